@@ -1,8 +1,14 @@
 from .address import *
+from .blocklist import *
 from .cache import *
 from .config import *
 from .hosts import *
+from .hostsdb import *
+from .name import *
 from .nameserver import *
 from .rand import *
 from .record import *
+from .shared_cache import *
+from .snapshot import *
+from .zone import *
 from .util import logger
@@ -0,0 +1,201 @@
+'''
+Blocklists of domain names.
+'''
+from array import array
+from bisect import bisect_left
+from io import TextIOWrapper
+import os
+from typing import Iterable, List, Tuple, Union
+import zlib
+
+from . import types
+from .address import Address, InvalidHost, InvalidIP
+from .name import DomainName
+from .record import Record, create_rdata
+
+__all__ = ['Blocklist']
+
+# the action of a rule is stored in the lowest bits of its hash
+_ACTION_MASK = 3
+_HASH_MASK = ~_ACTION_MASK
+
+# names in the header of hosts files, which must not be blocked
+_LOCAL_NAMES = frozenset((
+    'localhost',
+    'localhost.localdomain',
+    'local',
+    'broadcasthost',
+    'ip6-localhost',
+    'ip6-loopback',
+    'ip6-localnet',
+    'ip6-mcastprefix',
+    'ip6-allnodes',
+    'ip6-allrouters',
+    'ip6-allhosts',
+    '0.0.0.0',
+))
+
+
+class Blocklist:
+    '''A compact set of rules to block domain names.
+
+    A rule is either a name, e.g. `example.com`, or a suffix, e.g.
+    `*.example.com` which matches all subdomains of `example.com`. Each rule
+    is stored as a hash in a sorted array and a CRC32 of the name in
+    another, so millions of rules only take a few bytes each, and a lookup
+    is a binary search for the name and each of its parents. A hash matches
+    only if the CRC32 matches as well, so two names are confused only if
+    both independent checksums collide. The most specific rule wins, and
+    `ALLOW` wins over other rules of the same name.
+
+    Blocked names are answered with NXDOMAIN, with `0.0.0.0` and `::`, or
+    with the `sinkhole` addresses. `ALLOW` rules make exceptions.
+    '''
+    NXDOMAIN = 0
+    NULL = 1
+    SINKHOLE = 2
+    ALLOW = 3
+
+    def __init__(self,
+                 action: int = NULL,
+                 sinkhole: Iterable[str] = ('0.0.0.0', '::'),
+                 ttl: int = 60):
+        self.action = action
+        self.ttl = ttl
+        self.exact = array('q')
+        self.suffix = array('q')
+        # CRC32 of the names of the rules in the same order
+        self.exact_crc = array('I')
+        self.suffix_crc = array('I')
+        self._dirty = False
+        self.null = {
+            types.A: create_rdata(types.A, '0.0.0.0'),
+            types.AAAA: create_rdata(types.AAAA, '::'),
+        }
+        self.sinkhole = {}
+        for ip in sinkhole:
+            addr = Address.parse(ip)
+            self.sinkhole[addr.ip_type] = create_rdata(addr.ip_type, ip)
+
+    def __len__(self):
+        return len(self.exact) + len(self.suffix)
+
+    @staticmethod
+    def _hash(name: str) -> int:
+        return hash(name) & _HASH_MASK
+
+    @staticmethod
+    def _crc(name: str) -> int:
+        return zlib.crc32(name.encode())
+
+    def add(self, rule: str, action: int = None):
+        '''Add a rule, `action` defaults to the action of the blocklist.'''
+        if action is None:
+            action = self.action
+        # avoid interning millions of names as `DomainName`
+        name = rule.lower().rstrip('.')
+        if name.startswith('*.'):
+            target, crcs = self.suffix, self.suffix_crc
+            name = name[2:]
+        else:
+            target, crcs = self.exact, self.exact_crc
+        target.append(self._hash(name) | action)
+        crcs.append(self._crc(name))
+        self._dirty = True
+
+    def load(self, fd: Union[str, TextIOWrapper]):
+        '''Add rules from a file.
+
+        Each line is a rule, a rule prefixed with `@@` to allow it, or a
+        hosts file entry whose names are blocked, except well-known local
+        names like `localhost`. `#` starts a comment.
+        '''
+        if isinstance(fd, str):
+            with open(os.path.expanduser(fd), 'r', encoding='utf-8-sig') as f:
+                self._load_lines(f)
+        else:
+            self._load_lines(fd)
+
+    def _load_lines(self, fd: TextIOWrapper):
+        for line in fd:
+            items = line.split('#', 1)[0].split()
+            if not items:
+                continue
+            if len(items) > 1:
+                try:
+                    # strip the zone index, e.g. `fe80::1%lo0`
+                    Address.parse(items[0].split('%', 1)[0])
+                except (InvalidHost, InvalidIP):
+                    pass
+                else:
+                    items = [
+                        item for item in items[1:]
+                        if item.lower().rstrip('.') not in _LOCAL_NAMES
+                    ]
+            for item in items:
+                if item.startswith('@@'):
+                    self.add(item[2:], self.ALLOW)
+                else:
+                    self.add(item)
+
+    def compile(self):
+        '''Sort the rules, called automatically before lookups.'''
+        self.exact, self.exact_crc = self._sort(self.exact, self.exact_crc)
+        self.suffix, self.suffix_crc = self._sort(self.suffix,
+                                                  self.suffix_crc)
+        self._dirty = False
+
+    @staticmethod
+    def _sort(rules: array, crcs: array) -> Tuple[array, array]:
+        order = sorted(range(len(rules)), key=rules.__getitem__)
+        return (array('q', (rules[i] for i in order)),
+                array('I', (crcs[i] for i in order)))
+
+    @classmethod
+    def _find(cls, rules: array, crcs: array,
+              name: str) -> Union[int, None]:
+        key = cls._hash(name)
+        i = bisect_left(rules, key)
+        size = len(rules)
+        if i == size or rules[i] & _HASH_MASK != key:
+            return None
+        crc = cls._crc(name)
+        found = None
+        # rules of the same hash are sorted by action, ALLOW is the last one
+        while i < size and rules[i] & _HASH_MASK == key:
+            if crcs[i] == crc:
+                action = rules[i] & _ACTION_MASK
+                if action == cls.ALLOW:
+                    return action
+                if found is None:
+                    found = action
+            i += 1
+        return found
+
+    def match(self, fqdn: str) -> Union[int, None]:
+        '''Return the action of the most specific rule matching `fqdn`.'''
+        if self._dirty:
+            self.compile()
+        name = DomainName(fqdn)
+        if self.exact:
+            action = self._find(self.exact, self.exact_crc, name)
+            if action is not None:
+                return action
+        if self.suffix:
+            start = name.find('.')
+            while start >= 0:
+                action = self._find(self.suffix, self.suffix_crc,
+                                    name[start + 1:])
+                if action is not None:
+                    return action
+                start = name.find('.', start + 1)
+
+    def answer(self, fqdn: str, qtype: int, action: int) -> List[Record]:
+        '''Return the answer records of a question blocked by a NULL or
+        SINKHOLE rule.'''
+        rdatas = self.sinkhole if action == self.SINKHOLE else self.null
+        qtypes = (types.A, types.AAAA) if qtype == types.ANY else (qtype, )
+        return [
+            Record(name=fqdn, qtype=qt, ttl=self.ttl, data=rdatas[qt])
+            for qt in qtypes if qt in rdatas
+        ]
@@ -1,69 +1,547 @@
+import asyncio
+from collections import OrderedDict
+import heapq
+import sys
 import time
-from typing import Dict, Iterable, Union
+from typing import Dict, Hashable, Iterable, List, Tuple, Union
 
 from async_dns.core.record import RData
 
 from . import types
-from .record import Record, create_rdata, load_rdata
+from .name import DomainName
+from .record import (Address_RData, Record, SOA_RData, create_rdata,
+                     load_rdata)
 
-__all__ = ['CacheNode']
+__all__ = ['CacheNode', 'LRUPolicy', 'NegativeCache', 'TinyLFUPolicy']
+
+CacheKey = Tuple[DomainName, int]
+
+
+def get_record_size(record: Record) -> int:
+    '''Return the approximate memory used by a cached record, in bytes.'''
+    rdata = record.data
+    if isinstance(rdata, Address_RData):
+        value = rdata.raw
+    elif isinstance(rdata, RData):
+        value = rdata.data
+    else:
+        value = rdata
+    return sys.getsizeof(record) + sys.getsizeof(rdata) + sys.getsizeof(value)
+
+
+# approximate memory of an item in a dict: hash, key and value pointers in
+# a table that is at most 2/3 full, and the index
+_DICT_ITEM_SIZE = 3 * 8 * 3 // 2 + 8
+# the dict of records of a set, its key, its expiry and its items in
+# `CacheValue.expires`, `CacheIndex.lru` and `CacheIndex.scheduled`, and its
+# tuple in `CacheIndex.heap`
+_SET_SIZE = (sys.getsizeof({}) + sys.getsizeof((None, None)) +
+             sys.getsizeof(0.0) + 3 * _DICT_ITEM_SIZE +
+             sys.getsizeof((0.0, None, 0)) + 8)
+
+
+def get_node_size(key: str) -> int:
+    '''Return the approximate memory used by a cache node, in bytes.'''
+    return _NODE_SIZE + sys.getsizeof(key)
+
+
+def create_record(fqdn: str, qtype: int, data: Union[RData, bytes, Iterable],
+                  ttl: int) -> Record:
+    '''Create a record to cache from RData, wire format or RData arguments.'''
+    assert fqdn is not None
+    assert qtype is not None
+    if isinstance(data, bytes):
+        _, rdata = load_rdata(qtype, data, 0, len(data))
+    elif isinstance(data, RData):
+        rdata = data
+    else:
+        assert not isinstance(
+            data, str
+        ), 'String data needs to be wrapped in a tuple or list: ' + data
+        rdata = create_rdata(qtype, *data)
+    return Record(name=fqdn, data=rdata, qtype=qtype, ttl=ttl)
+
+
+class LRUPolicy:
+    '''Evict the least recently used record sets and admit all new ones.'''
+    def record_access(self, key: Hashable):
+        pass
+
+    def admit(self, key: Hashable, victim: Hashable) -> bool:
+        return True
+
+
+# lookup table to halve all counters with `bytes.translate`
+_HALVE = bytes(i >> 1 for i in range(256))
+
+
+class TinyLFUPolicy(LRUPolicy):
+    '''LRU eviction with TinyLFU admission.
+
+    Access frequencies are estimated with a count-min sketch which is halved
+    every `sample_size` accesses. When the cache is full, a new record set is
+    admitted only if it is accessed more often than the one to be evicted, so
+    one-off names such as random subdomains do not flush popular entries.
+    '''
+    depth = 4
+    max_count = 15
+
+    def __init__(self, width: int = 1 << 16, sample_size: int = None):
+        assert 0 < width <= 1 << 16 and width & (width - 1) == 0, \
+            'width must be a power of 2 no larger than 65536'
+        self.width = width
+        self.table = bytearray(width * self.depth)
+        self.sample_size = sample_size or width * 10
+        self.additions = 0
+
+    def _indexes(self, key: Hashable) -> Iterable[int]:
+        value = hash(key)
+        mask = self.width - 1
+        for i in range(self.depth):
+            yield i * self.width + ((value >> (i * 16)) & mask)
+
+    def record_access(self, key: Hashable):
+        table = self.table
+        for index in self._indexes(key):
+            if table[index] < self.max_count:
+                table[index] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.table = table.translate(_HALVE)
+            self.additions //= 2
+
+    def estimate(self, key: Hashable) -> int:
+        table = self.table
+        return min(table[index] for index in self._indexes(key))
+
+    def admit(self, key: Hashable, victim: Hashable) -> bool:
+        return self.estimate(key) > self.estimate(victim)
+
+
+class CacheIndex:
+    '''Bookkeeping of the record sets in a cache tree.'''
+    def __init__(self,
+                 max_entries: int = None,
+                 max_bytes: int = None,
+                 policy: LRUPolicy = None,
+                 stale_ttl: int = 0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy or LRUPolicy()
+        self.stale_ttl = stale_ttl
+        # nodes by name for exact lookups without walking the tree
+        self.nodes: Dict[DomainName, 'CacheNode'] = {}
+        # the number of wildcard names in `nodes`
+        self.wildcards = 0
+        # record sets that can be evicted, in LRU order
+        self.lru: Dict[CacheKey, 'CacheNode'] = OrderedDict()
+        # record sets with permanent records, e.g. from hosts files
+        self.pinned: Dict[CacheKey, 'CacheNode'] = {}
+        self.records = 0
+        self.bytes = 0
+        # (expires, name, qtype) of record sets, items that do not match
+        # `scheduled` are outdated and skipped
+        self.heap: List[Tuple[float, DomainName, int]] = []
+        # the expiry in `heap` of each record set, including `stale_ttl`
+        self.scheduled: Dict[CacheKey, float] = {}
+        # the number of outdated items in `heap`
+        self.outdated = 0
+        self.expiry_handle: asyncio.Handle = None
+
+    @property
+    def entries(self) -> int:
+        return len(self.lru) + len(self.pinned)
+
+    def is_full(self) -> bool:
+        return (self.max_entries is not None
+                and self.entries >= self.max_entries) or (
+                    self.max_bytes is not None
+                    and self.bytes >= self.max_bytes)
+
+    def is_over(self) -> bool:
+        return (self.max_entries is not None
+                and self.entries > self.max_entries) or (
+                    self.max_bytes is not None
+                    and self.bytes > self.max_bytes)
+
+    def get_node(self, key: CacheKey) -> Union['CacheNode', None]:
+        node = self.lru.get(key)
+        if node is None:
+            node = self.pinned.get(key)
+        return node
+
+    def schedule(self, key: CacheKey, expires: Union[float, None]):
+        '''Schedule the expiry of a record set, or cancel it if `expires` is
+        None.
+
+        Each record set has one item in `heap` at most, and the heap is
+        rebuilt when outdated items outnumber the others, so it never holds
+        much more than the record sets in the cache.
+        '''
+        scheduled = self.scheduled
+        if expires is None:
+            if scheduled.pop(key, None) is None:
+                return
+        else:
+            expires += self.stale_ttl
+            old = scheduled.get(key)
+            if old == expires:
+                return
+            scheduled[key] = expires
+            heapq.heappush(self.heap, (expires, key[0], key[1]))
+            if old is None:
+                return
+        self.outdated += 1
+        if self.outdated > len(scheduled):
+            self.heap = [(expires, name, qtype)
+                         for (name, qtype), expires in scheduled.items()]
+            heapq.heapify(self.heap)
+            self.outdated = 0
+
+
+class NegativeCache:
+    '''Cache of negative answers as described in RFC 2308.
+
+    NXDOMAIN is cached by name and applies to all types, NODATA is cached by
+    name and type. The TTL is the minimum of the SOA TTL and the SOA minimum
+    field, capped by `max_ttl`.
+    '''
+    def __init__(self, max_size: int = 10000, max_ttl: int = 3600):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self.data: OrderedDict = OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    def add(self, name: str, qtype: int, rcode: int, soa: Record):
+        '''Cache a negative answer with the SOA record from the authority
+        section. `rcode` is 3 for NXDOMAIN and 0 for NODATA.
+        '''
+        if not isinstance(soa.data, SOA_RData):
+            return
+        ttl = min(soa.data.minimum, self.max_ttl)
+        if soa.ttl >= 0:
+            ttl = min(ttl, soa.get_ttl())
+        if ttl <= 0:
+            return
+        key = DomainName(name), None if rcode == 3 else qtype
+        self.data[key] = rcode, soa.copy(ttl=ttl)
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+    def get(self, name: str, qtype: int) -> Union[Tuple[int, Record], None]:
+        '''Return `(rcode, soa)` if the question is known to have no answer.
+
+        The TTL of the SOA record is the remaining time to cache the answer.
+        '''
+        name = DomainName(name)
+        now = int(time.time())
+        for key in ((name, None), (name, qtype)):
+            entry = self.data.get(key)
+            if entry is None:
+                continue
+            rcode, soa = entry
+            ttl = soa.get_ttl(now)
+            if ttl <= 0:
+                self.data.pop(key, None)
+                continue
+            self.data.move_to_end(key)
+            return rcode, soa.copy(ttl=ttl)
+
+    def remove(self, name: str, qtype: int = None):
+        '''Remove NXDOMAIN of a name, and NODATA of `qtype`, or of all types
+        if `qtype` is not provided.
+        '''
+        name = DomainName(name)
+        self.data.pop((name, None), None)
+        if qtype is not None:
+            self.data.pop((name, qtype), None)
+        else:
+            for key in [key for key in self.data if key[0] == name]:
+                del self.data[key]
+
+    def clear(self):
+        self.data.clear()
 
 
 class CacheValue:
+    __slots__ = ('data', 'expires', 'hits')
+
     def __init__(self):
         self.data: Dict[int, Dict[RData, Record]] = {}
+        # the earliest expiry of each record set, permanent sets are omitted
+        self.expires: Dict[int, float] = {}
+        # the number of questions answered for each type
+        self.hits: Dict[int, int] = {}
 
-    def check_ttl(self, record: Record):
+    @staticmethod
+    def check_ttl(record: Record):
         return record.ttl < 0 or record.timestamp + record.ttl >= time.time()
 
     def get(self, qtype: int) -> Iterable[Record]:
         if qtype == types.ANY:
-            for qt in self.data.keys():
+            for qt in list(self.data.keys()):
                 yield from self.get(qt)
             return
         results = self.data.get(qtype)
         if results is not None:
-            keys = list(results.keys())
-            for key in keys:
-                record = results[key]
+            expires = self.expires.get(qtype)
+            if expires is None or expires >= time.time():
+                yield from list(results.values())
+                return
+            for record in list(results.values()):
                 if self.check_ttl(record):
                     yield record
-                else:
-                    results.pop(key, None)
 
-    def add(self, record: Record):
-        if self.check_ttl(record):
-            results = self.data.setdefault(record.qtype, {})
-            results[record.data] = record
+    def update_expires(self, qtype: int):
+        '''Recompute the earliest expiry of a record set.'''
+        results = self.data.get(qtype)
+        expires = None
+        if results:
+            expires = min((record.timestamp + record.ttl
+                           for record in results.values() if record.ttl >= 0),
+                          default=None)
+        if expires is None:
+            self.expires.pop(qtype, None)
+        else:
+            self.expires[qtype] = expires
 
 
 class CacheNode:
-    def __init__(self):
+    '''A node in the cache tree, the root node holds the whole cache.
+
+    The cache can be bounded by the number of record sets (`max_entries`)
+    and the approximate memory they use (`max_bytes`). Record sets are
+    evicted in LRU order, and `policy` decides whether a new record set is
+    admitted when the cache is full.
+
+    Expired records are kept for `stale_ttl` seconds so that they can be
+    served with `query(..., stale=True)` when upstreams fail, see RFC 8767.
+    '''
+    __slots__ = ('children', 'data', 'parent', 'key', 'index')
+
+    def __init__(self,
+                 max_entries: int = None,
+                 max_bytes: int = None,
+                 policy: LRUPolicy = None,
+                 parent: 'CacheNode' = None,
+                 key: str = None,
+                 stale_ttl: int = 0):
         self.children: Dict[str, CacheNode] = {}
         self.data = CacheValue()
+        self.parent = parent
+        self.key = key
+        self.index = None if parent is not None else CacheIndex(
+            max_entries, max_bytes, policy, stale_ttl)
 
-    def get(self, fqdn: str, touch: bool = False):
+    @property
+    def stale_ttl(self) -> int:
+        return self.index.stale_ttl
+
+    @property
+    def name(self) -> DomainName:
+        labels = []
+        node = self
+        while node.parent is not None:
+            labels.append(node.key)
+            node = node.parent
+        return DomainName('.'.join(labels))
+
+    def _find(self, name: DomainName,
+              touch: bool = False) -> Tuple[Union['CacheNode', None], bool]:
+        '''Find the node of `name`, and whether it is matched exactly.
+
+        Wildcard nodes are used as fallbacks unless `touch` is true, in which
+        case missing nodes are created.
+        '''
         current = self
-        keys = reversed(fqdn.split('.'))
-        for key in keys:
+        exact = True
+        for key in reversed(name.labels):
             child = current.children.get(key)
             if child is None:
-                child = current.children.get('*')
-            if child is None:
-                if not touch: return
-                child = CacheNode()
-                current.children[key] = child
+                if touch:
+                    child = CacheNode(parent=current, key=key)
+                    current.children[key] = child
+                    self.index.bytes += get_node_size(key)
+                else:
+                    child = current.children.get('*')
+                    if child is None:
+                        return None, False
+                    exact = False
             current = child
-        return current.data
+        if touch:
+            index = self.index
+            if name not in index.nodes:
+                index.nodes[name] = current
+                index.bytes += sys.getsizeof(name) + _DICT_ITEM_SIZE
+                if name.labels and name.labels[0] == '*':
+                    index.wildcards += 1
+        return current, exact
+
+    def _lookup(self, name: DomainName) -> Tuple[Union['CacheNode', None], bool]:
+        '''Find the node of `name` like `_find`, but look up the index first
+        and only walk the tree for wildcards.
+        '''
+        index = self.index
+        node = index.nodes.get(name)
+        if node is not None:
+            return node, True
+        if not index.wildcards:
+            return None, False
+        return self._find(name)
 
-    def query(self, fqdn: str, qtype: Union[int, Iterable[int]]):
+    def get(self, fqdn: str, touch: bool = False):
+        name = DomainName(fqdn)
+        if touch:
+            current, _ = self._find(name, True)
+        else:
+            current, _ = self._lookup(name)
+        if current is not None:
+            return current.data
+
+    def query(self,
+              fqdn: str,
+              qtype: Union[int, Iterable[int]],
+              stale: bool = False):
+        '''Yield cached records, including expired ones in the stale window
+        if `stale` is true.
+        '''
         if isinstance(qtype, int):
-            value = self.get(fqdn)
-            if value is not None:
-                yield from value.get(qtype)
+            name = DomainName(fqdn)
+            index = self.index
+            if index is not None:
+                index.policy.record_access((name, qtype))
+            node, exact = self._lookup(name)
+            if node is not None:
+                if not exact:
+                    name = node.name
+                yield from self._query_node(node, name, qtype, stale)
         else:
             for t in qtype:
-                yield from self.query(fqdn, t)
+                yield from self.query(fqdn, t, stale)
+
+    def hit(self, fqdn: str, qtype: int) -> int:
+        '''Count a question answered from the cache and return the number of
+        hits since the last call of `pop_hits`.
+        '''
+        node, exact = self._lookup(DomainName(fqdn))
+        if node is None or not exact:
+            return 0
+        hits = node.data.hits
+        count = hits[qtype] = hits.get(qtype, 0) + 1
+        return count
+
+    def pop_hits(self, fqdn: str, qtype: int) -> int:
+        '''Return the number of hits of a question and reset it.'''
+        node, exact = self._lookup(DomainName(fqdn))
+        if node is None or not exact:
+            return 0
+        return node.data.hits.pop(qtype, 0)
+
+    def _query_node(self,
+                    node: 'CacheNode',
+                    name: DomainName,
+                    qtype: int,
+                    stale: bool = False) -> Iterable[Record]:
+        value = node.data
+        data = value.data
+        qtypes = list(data) if qtype == types.ANY else (qtype, )
+        now = time.time()
+        results = []
+        for qt in qtypes:
+            expires = value.expires.get(qt)
+            if expires is not None and expires < now:
+                # Expired records are usually removed in background, in case
+                # they are not, filter them here.
+                self._expire_set(node, name, qt, now)
+                records = data.get(qt)
+                if not records:
+                    continue
+                if stale:
+                    results.extend(records.values())
+                else:
+                    results.extend(record for record in records.values()
+                                   if CacheValue.check_ttl(record))
+            else:
+                records = data.get(qt)
+                if not records:
+                    continue
+                results.extend(records.values())
+            if self.index is not None:
+                key = name, qt
+                if key in self.index.lru:
+                    self.index.lru.move_to_end(key)
+        return results
+
+    def _expire_set(self, node: 'CacheNode', name: DomainName, qtype: int,
+                    now: float):
+        '''Remove records that are expired and out of the stale window.'''
+        records = node.data.data.get(qtype)
+        if not records:
+            return
+        now -= self.index.stale_ttl
+        expired = [
+            record for record in records.values()
+            if 0 <= record.ttl and record.timestamp + record.ttl < now
+        ]
+        if expired:
+            self._remove_records(node, name, qtype, expired)
+
+    def expire(self, now: float = None, budget: float = 0.002) -> int:
+        '''Remove expired records for about `budget` seconds at most.
+
+        Return the number of record sets checked.
+        '''
+        index = self.index
+        heap = index.heap
+        if now is None:
+            now = time.time()
+        deadline = time.perf_counter() + budget
+        count = 0
+        while heap and heap[0][0] < now:
+            expires, name, qtype = heapq.heappop(heap)
+            key = name, qtype
+            if index.scheduled.get(key) != expires:
+                index.outdated = max(0, index.outdated - 1)
+                continue
+            del index.scheduled[key]
+            node = index.get_node(key)
+            if node is not None:
+                self._expire_set(node, name, qtype, now)
+                value = node.data
+                if qtype in value.data:
+                    index.schedule(key, value.expires.get(qtype))
+            count += 1
+            if count % 64 == 0 and time.perf_counter() > deadline:
+                break
+        return count
+
+    def start_expiry(self, interval: float = 1.0, budget: float = 0.002):
+        '''Remove expired records periodically on the event loop.
+
+        Each run takes about `budget` seconds at most, and the next one is
+        scheduled immediately if there are more records to remove.
+        '''
+        index = self.index
+        if index.expiry_handle is not None:
+            return
+        loop = asyncio.get_event_loop()
+
+        def run():
+            self.expire(budget=budget)
+            heap = index.heap
+            delay = 0 if heap and heap[0][0] < time.time() else interval
+            index.expiry_handle = loop.call_later(delay, run)
+
+        index.expiry_handle = loop.call_later(interval, run)
+
+    def stop_expiry(self):
+        index = self.index
+        if index.expiry_handle is not None:
+            index.expiry_handle.cancel()
+            index.expiry_handle = None
 
     def add(self,
             fqdn: str = None,
@@ -72,23 +550,164 @@ class CacheNode:
             ttl=-1,
             record: Record = None):
         if record is None:
-            assert fqdn is not None
-            assert qtype is not None
-            if isinstance(data, bytes):
-                _, rdata = load_rdata(qtype, data, 0, len(data))
-            elif isinstance(data, RData):
-                rdata = data
-            else:
-                assert not isinstance(
-                    data, str
-                ), 'String data needs to be wrapped in a tuple or list: ' + data
-                rdata = create_rdata(qtype, *data)
-            record = Record(name=fqdn, data=rdata, qtype=qtype, ttl=ttl)
-        value = self.get(record.name, True)
-        value.add(record)
+            record = create_record(fqdn, qtype, data, ttl)
+        if not CacheValue.check_ttl(record):
+            return
+        index = self.index
+        name = DomainName(record.name)
+        key = name, record.qtype
+        node, _ = self._find(name, True)
+        records = node.data.data.get(record.qtype)
+        if records is None:
+            if index.is_full() and index.lru:
+                victim = next(iter(index.lru))
+                if not index.policy.admit(key, victim):
+                    self._prune(node, name)
+                    return
+            records = node.data.data[record.qtype] = {}
+            index.bytes += _SET_SIZE
+        purged = False
+        expires = node.data.expires.get(record.qtype)
+        if expires is not None and expires < record.timestamp:
+            # drop stale records once the set is refreshed
+            for old in list(records.values()):
+                if not CacheValue.check_ttl(old):
+                    records.pop(old.data)
+                    index.records -= 1
+                    index.bytes -= get_record_size(old)
+                    purged = True
+        old = records.get(record.data)
+        if old is not None:
+            index.records -= 1
+            index.bytes -= get_record_size(old)
+        records[record.data] = record
+        index.records += 1
+        index.bytes += get_record_size(record)
+        if purged or old is not None and old.ttl >= 0:
+            # the removed records may hold the earliest expiry
+            node.data.update_expires(record.qtype)
+        value = node.data
+        if record.ttl >= 0:
+            expires = record.timestamp + record.ttl
+            if expires < value.expires.get(record.qtype, expires + 1):
+                value.expires[record.qtype] = expires
+        index.schedule(key, value.expires.get(record.qtype))
+        if key in index.pinned:
+            pass
+        elif record.ttl < 0:
+            index.lru.pop(key, None)
+            index.pinned[key] = node
+        else:
+            index.lru[key] = node
+            index.lru.move_to_end(key)
+        self._evict(key)
+
+    def _evict(self, keep: CacheKey = None):
+        '''Evict least recently used record sets until the cache fits.'''
+        index = self.index
+        while index.is_over() and index.lru:
+            key = next(iter(index.lru))
+            if key == keep:
+                if len(index.lru) == 1:
+                    break
+                index.lru.move_to_end(key)
+                continue
+            self._remove_set(index.lru[key], key)
+
+    def _remove_records(self, node: 'CacheNode', name: DomainName,
+                        qtype: int, records: Iterable[Record]):
+        results = node.data.data.get(qtype)
+        if results is None:
+            return
+        index = self.index
+        for record in records:
+            if results.pop(record.data, None) is not None and index is not None:
+                index.records -= 1
+                index.bytes -= get_record_size(record)
+        if results:
+            node.data.update_expires(qtype)
+            if index is not None:
+                index.schedule((name, qtype), node.data.expires.get(qtype))
+        else:
+            self._remove_set(node, (name, qtype))
+
+    def _remove_set(self, node: 'CacheNode', key: CacheKey):
+        results = node.data.data.pop(key[1], None)
+        node.data.expires.pop(key[1], None)
+        node.data.hits.pop(key[1], None)
+        index = self.index
+        if index is not None:
+            index.lru.pop(key, None)
+            index.pinned.pop(key, None)
+            index.schedule(key, None)
+            if results is not None:
+                index.records -= len(results)
+                index.bytes -= _SET_SIZE + sum(
+                    map(get_record_size, results.values()))
+        self._prune(node, key[0])
+
+    def _prune(self, node: 'CacheNode', name: DomainName):
+        '''Remove `node` of `name` and its ancestors if they become empty.'''
+        index = self.index
+        while (node.parent is not None and not node.children
+               and not node.data.data):
+            node.parent.children.pop(node.key, None)
+            index.bytes -= get_node_size(node.key)
+            if index.nodes.pop(name, None) is not None:
+                index.bytes -= sys.getsizeof(name) + _DICT_ITEM_SIZE
+                if node.key == '*':
+                    index.wildcards -= 1
+            node = node.parent
+            name = name.parent
+
+    def remove(self, fqdn: str, qtype: int = types.ANY):
+        '''Remove cached records of `fqdn`.'''
+        name = DomainName(fqdn)
+        node, exact = self._lookup(name)
+        if node is None or not exact:
+            return
+        qtypes = list(node.data.data) if qtype == types.ANY else (qtype, )
+        for qt in qtypes:
+            self._remove_set(node, (name, qt))
+
+    def discard(self, fqdn: str, qtype: int, data: Iterable[RData]):
+        '''Remove the cached records of `fqdn` and `qtype` with `data`, and
+        keep the other records of the set.'''
+        name = DomainName(fqdn)
+        node, exact = self._lookup(name)
+        if node is None or not exact:
+            return
+        records = node.data.data.get(qtype)
+        if not records:
+            return
+        key = name, qtype
+        self._remove_records(node, name, qtype,
+                             [records[item] for item in data if item in records])
+        index = self.index
+        if key in index.pinned and all(record.ttl >= 0
+                                       for record in records.values()):
+            # no permanent records are left, the set can be evicted
+            index.lru[key] = index.pinned.pop(key)
+
+    def stats(self) -> Dict[str, int]:
+        '''Return the number of record sets and records, and the approximate
+        memory they use in bytes.'''
+        index = self.index
+        return {
+            'entries': index.entries,
+            'records': index.records,
+            'bytes': index.bytes,
+        }
 
     def iter_values(self) -> Iterable[Record]:
         '''Yield all cached values in this node and its subtree.'''
         yield from self.data.get(types.ANY)
-        for child in self.children.values():
+        for child in list(self.children.values()):
             yield from child.iter_values()
+
+
+# a node with its `CacheValue` and dicts, and its item in the children of the
+# parent node
+_NODE_SIZE = (sys.getsizeof(CacheNode(parent=True)) +
+              sys.getsizeof(CacheValue()) + 4 * sys.getsizeof({}) +
+              _DICT_ITEM_SIZE)
@@ -2,7 +2,7 @@ from io import TextIOWrapper
 import os
 from typing import Union
 
-from .address import Address
+from .address import Address, InvalidHost, InvalidIP
 
 if os.name == 'nt':
     hosts_file = os.path.expandvars(r'%windir%\System32\drivers\etc\hosts')
@@ -18,7 +18,7 @@ def _parse_lines(fd: TextIOWrapper):
         try:
             it = iter(items)
             addr = Address.parse(next(it))
-        except StopIteration:
+        except (StopIteration, InvalidHost, InvalidIP, ValueError):
             pass
         else:
             for name in it:
@@ -26,7 +26,13 @@ def _parse_lines(fd: TextIOWrapper):
                     yield name, addr.ip_type, (addr.hostinfo.hostname, )
 
 
-def parse_hosts_file(fd: Union[str, TextIOWrapper] = None):
+def parse_hosts_file(fd: Union[str, TextIOWrapper] = None,
+                     strict: bool = False):
+    '''Yield the name, type and data of each record in a hosts file.
+
+    Invalid lines are skipped. A file that cannot be read is taken as empty
+    unless `strict` is true, in which case the error is raised.
+    '''
     if fd is None:
         fd = hosts_file
     try:
@@ -34,7 +40,8 @@ def parse_hosts_file(fd: Union[str, TextIOWrapper] = None):
             fd = os.path.expanduser(fd)
             with open(fd, 'r', encoding='utf-8-sig') as f:
                 yield from _parse_lines(f)
-        else:
+        elif fd is not None:
             yield from _parse_lines(fd)
-    except:
-        pass
+    except (OSError, UnicodeDecodeError):
+        if strict:
+            raise
@@ -0,0 +1,168 @@
+'''
+Precompiled databases of static records, e.g. huge hosts files.
+
+A database is compiled once with `compile_hosts_db` or
+`python3 -m async_dns.core.hostsdb`, and mapped into memory by `HostsDB`, so
+that the records are never loaded into Python objects until they are asked.
+
+The file starts with a header, followed by the offsets of the entries sorted
+by name, and the entries:
+
+    header: `ADHD` | version (2) | number of entries (4)
+    index: entry offset (4) * number of entries
+    entry: name length (1) | name (canonical) | number of records (2)
+           | records
+    record: qtype (2) | qclass (2) | ttl (4, -1 for permanent)
+            | rdlength (2) | rdata (wire format, names compressed within the
+            rdata only)
+'''
+import mmap
+import os
+import struct
+from typing import Dict, Iterable, List, Tuple, Union
+
+from .. import types
+from ..name import DomainName
+from ..record import RData, Record, create_rdata, load_rdata
+from ..util import Packer, ParseError
+
+__all__ = ['HostsDB', 'compile_hosts_db']
+
+_HEADER = struct.Struct('!4sHL')
+_OFFSET = struct.Struct('!L')
+_COUNT = struct.Struct('!H')
+_RECORD = struct.Struct('!HHlH')
+MAGIC = b'ADHD'
+VERSION = 1
+# flush the buffer to the file when it grows larger than this
+CHUNK_SIZE = 1 << 16
+
+
+def _pack_entry(packer: Packer, name: bytes, records: List[Tuple[int, bytes]],
+                ttl: int):
+    packer.write_string(name)
+    packer.write_struct(_COUNT, len(records))
+    for qtype, rdata in records:
+        packer.write_struct(_RECORD, qtype, 1, ttl, len(rdata))
+        packer.write(rdata)
+
+
+def compile_hosts_db(entries: Iterable[Tuple[str, int, Union[RData,
+                                                             Iterable]]],
+                     path: str,
+                     ttl: int = -1) -> int:
+    '''Compile records into a database at `path` and return the number of
+    names.
+
+    `entries` are tuples of name, qtype and data like the ones yielded by
+    `parse_hosts_file`. Duplicate records are dropped. The file is replaced
+    atomically so that servers never map a partial database.
+    '''
+    names: Dict[str, Dict[Tuple[int, bytes], None]] = {}
+    for name, qtype, data in entries:
+        # avoid interning millions of names as `DomainName`
+        name = name.lower().rstrip('.')
+        if not isinstance(data, RData):
+            data = create_rdata(qtype, *data)
+        # rdata is loaded on its own, so pointers must be relative to it
+        packer = Packer(64)
+        data.pack(packer)
+        names.setdefault(name, {})[qtype, packer.getvalue()] = None
+    keys = sorted(name.encode() for name in names)
+    index = Packer(_HEADER.size + _OFFSET.size * len(keys))
+    index.write_struct(_HEADER, MAGIC, VERSION, len(keys))
+    # offset of the buffer in the file
+    base = _HEADER.size + _OFFSET.size * len(keys)
+    packer = Packer(CHUNK_SIZE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.seek(base)
+        for key in keys:
+            index.write_struct(_OFFSET, base + packer.pos)
+            # records of the same type keep their order
+            _pack_entry(packer, key,
+                        sorted(names[key.decode()], key=_by_type), ttl)
+            if packer.pos >= CHUNK_SIZE:
+                f.write(packer.getvalue())
+                base += packer.pos
+                packer.pos = 0
+        f.write(packer.getvalue())
+        f.seek(0)
+        f.write(index.getvalue())
+    os.replace(tmp_path, path)
+    return len(keys)
+
+
+def _by_type(key: Tuple[int, bytes]) -> int:
+    return key[0]
+
+
+class HostsDB:
+    '''A read-only database of records compiled by `compile_hosts_db`.
+
+    The file is mapped into memory and looked up with a binary search on
+    the sorted names. Names are matched exactly, there are no wildcards.
+    It can be passed to a resolver as `hosts_db` and is looked up before the
+    cache.
+    '''
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ParseError(b'', 0, 'Invalid hosts database: ' + path)
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = _HEADER.unpack_from(self.mm, 0)
+        if (magic != MAGIC or version != VERSION
+                or len(self.mm) < _HEADER.size + _OFFSET.size * self.count):
+            self.close()
+            raise ParseError(b'', 0, 'Invalid hosts database: ' + path)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.mm.close()
+
+    def _find(self, key: bytes) -> int:
+        '''Return the offset of the records of `key`, or -1 if not found.'''
+        mm = self.mm
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset, = _OFFSET.unpack_from(mm, _HEADER.size + mid * _OFFSET.size)
+            end = offset + 1 + mm[offset]
+            name = mm[offset + 1:end]
+            if name < key:
+                lo = mid + 1
+            elif name > key:
+                hi = mid
+            else:
+                return end
+        return -1
+
+    def query(self, fqdn: str,
+              qtype: Union[int, Iterable[int]]) -> Iterable[Record]:
+        '''Yield the records of `fqdn` with `qtype`, or all records of `fqdn`
+        if `qtype` is ANY.'''
+        name = DomainName(fqdn)
+        l = self._find(name.encode())
+        if l < 0:
+            return
+        if isinstance(qtype, int):
+            qtypes = None if qtype == types.ANY else (qtype, )
+        else:
+            qtypes = tuple(qtype)
+        mm = self.mm
+        count, = _COUNT.unpack_from(mm, l)
+        l += _COUNT.size
+        for _ in range(count):
+            rtype, qclass, ttl, rdlength = _RECORD.unpack_from(mm, l)
+            l += _RECORD.size
+            if qtypes is None or rtype in qtypes:
+                _, rdata = load_rdata(rtype, mm[l:l + rdlength], 0, rdlength)
+                yield Record(name=name,
+                             qtype=rtype,
+                             qclass=qclass,
+                             ttl=ttl,
+                             data=rdata)
+            l += rdlength
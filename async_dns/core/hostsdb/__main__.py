@@ -0,0 +1,35 @@
+'''
+Compile hosts files into a database for `HostsDB`.
+'''
+import argparse
+import itertools
+import logging
+import os
+
+from .. import logger, parse_hosts_file
+from . import compile_hosts_db
+
+
+def main():
+    '''Compile hosts files from command line.'''
+    parser = argparse.ArgumentParser(
+        prog='python3 -m async_dns.core.hostsdb',
+        description='Compile hosts files into a database')
+    parser.add_argument('hosts', nargs='+', help='the paths of hosts files')
+    parser.add_argument('-o',
+                        '--output',
+                        required=True,
+                        help='the path of the database')
+    parser.add_argument('--ttl',
+                        type=int,
+                        default=-1,
+                        help='the TTL of the records, -1 for permanent')
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get('LOGLEVEL', logging.INFO))
+    count = compile_hosts_db(
+        itertools.chain.from_iterable(map(parse_hosts_file, args.hosts)),
+        args.output, args.ttl)
+    logger.info('%d names compiled to %s', count, args.output)
+
+
+main()
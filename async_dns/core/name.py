@@ -0,0 +1,78 @@
+'''
+Canonical domain names.
+'''
+import sys
+from typing import Dict, Iterable, Tuple
+
+__all__ = ['DomainName']
+
+
+class DomainName(str):
+    '''Canonical domain name.
+
+    A domain name is lowercased and has no trailing dot, so it can be compared
+    and used as a key directly. It keeps interned labels and its wire format,
+    and equal names share the same object as long as the intern table is not
+    full.
+    '''
+    __slots__ = ('labels', 'wire')
+
+    labels: Tuple[str, ...]
+    wire: bytes
+
+    _interned: Dict[str, 'DomainName'] = {}
+    max_interned = 1 << 20
+
+    def __new__(cls, name: str = ''):
+        if type(name) is cls:
+            return name
+        name = name.lower()
+        if name.endswith('.'):
+            name = name[:-1]
+        cached = cls._interned.get(name)
+        if cached is not None:
+            return cached
+        return cls._create(name)
+
+    @classmethod
+    def from_labels(cls, labels: Iterable[bytes]) -> 'DomainName':
+        '''Create a domain name from labels in wire format.'''
+        name = b'.'.join(labels).lower().decode()
+        cached = cls._interned.get(name)
+        if cached is not None:
+            return cached
+        return cls._create(name)
+
+    @classmethod
+    def _create(cls, name: str) -> 'DomainName':
+        self = str.__new__(cls, name)
+        labels = tuple(map(sys.intern, name.split('.'))) if name else ()
+        wire = bytearray()
+        for label in labels:
+            label = label.encode()
+            wire.append(len(label))
+            wire.extend(label)
+        wire.append(0)
+        self.labels = labels
+        self.wire = bytes(wire)
+        # compute the hash once so that it is cached by str
+        hash(self)
+        interned = cls._interned
+        if len(interned) >= cls.max_interned:
+            interned.clear()
+        interned[name] = self
+        return self
+
+    def __reduce__(self):
+        return DomainName, (str(self), )
+
+    @property
+    def parent(self) -> 'DomainName':
+        '''Return the parent domain, e.g. `google.com` for `www.google.com`.'''
+        return DomainName(self.partition('.')[2])
+
+    def is_subdomain(self, other: str) -> bool:
+        '''Return whether the name is `other` or a subdomain of it.'''
+        other = DomainName(other)
+        size = len(other.labels)
+        return size == 0 or self.labels[-size:] == other.labels
@@ -1,11 +1,10 @@
-import io
 import socket
 import struct
 import time
-from typing import Dict, Iterable, List, Tuple, Union
+from typing import Iterable, List, Tuple, Union
 
 from . import types
-from .util import get_bits, load_domain_name, load_string, pack_domain_name, pack_string
+from .util import Packer, ParseError, get_bits, load_domain_name, load_string
 
 __all__ = [
     'REQUEST',
@@ -13,6 +12,7 @@ __all__ = [
     'DNSError',
     'Record',
     'DNSMessage',
+    'EDNS_UDP_SIZE',
     'RData',
     'create_rdata',
     'load_rdata',
@@ -21,6 +21,16 @@ __all__ = [
 REQUEST = 0
 RESPONSE = 1
 MAXAGE = 3600000
+EDNS_UDP_SIZE = 1232  # recommended by DNS flag day 2020
+
+_HEADER = struct.Struct('!HHHHHH')
+_QUESTION = struct.Struct('!HH')
+_RR = struct.Struct('!HHLH')
+_SHORT = struct.Struct('!H')
+_SOA = struct.Struct('!LLLLL')
+_MX = _SHORT
+_SRV = struct.Struct('!HHH')
+_NAPTR = struct.Struct('!HH')
 
 
 class DNSError(Exception):
@@ -64,6 +74,7 @@ def load_rdata(qtype: int, data: bytes, l: int,
 
 class RData:
     '''Base class of RData'''
+    __slots__ = ()
     rtype = -1
     data = None
 
@@ -84,51 +95,74 @@ class RData:
     def load(cls, data: bytes, l: int, size: int):
         raise NotImplementedError
 
-    def dump(self, names: Dict[str, int], offset: int) -> Iterable[bytes]:
+    def pack(self, packer: Packer):
+        '''Write RData into `packer`.'''
         raise NotImplementedError
 
 
-@rdata
-class A_RData(RData):
-    '''A record'''
-    rtype = types.A
+class Address_RData(RData):
+    '''Base class of address records.
 
-    def __init__(self, data: str):
-        self.data = data
+    The address is stored in its packed form, `data` is the text form.
+    '''
+    __slots__ = ('raw', )
+    family = None
+    # the length of the packed address
+    size = 0
+
+    def __init__(self, data: Union[str, bytes]):
+        if isinstance(data, str):
+            data = socket.inet_pton(self.family, data)
+        elif len(data) != self.size:
+            raise ValueError('Invalid address length: %d' % len(data))
+        self.raw = data
+
+    def __hash__(self):
+        return hash(self.raw)
+
+    def __eq__(self, other: 'RData'):
+        return self.__class__ == other.__class__ and self.raw == other.raw
+
+    @property
+    def data(self) -> str:
+        return socket.inet_ntop(self.family, self.raw)
 
     @classmethod
     def load(cls, data: bytes, l: int, size: int):
-        ip = socket.inet_ntoa(data[l:l + size])
-        return l + size, cls(ip)
+        if size != cls.size or l + size > len(data):
+            raise ParseError(data, l, 'Invalid address length')
+        return l + size, cls(bytes(data[l:l + size]))
 
-    def dump(self, names: Dict[str, int], offset: int) -> Iterable[bytes]:
-        yield socket.inet_aton(self.data)
+    def pack(self, packer: Packer):
+        packer.write(self.raw)
 
 
 @rdata
-class AAAA_RData(RData):
-    '''AAAA record'''
-    rtype = types.AAAA
-
-    def __init__(self, data: str):
-        self.data = data
+class A_RData(Address_RData):
+    '''A record'''
+    __slots__ = ()
+    rtype = types.A
+    family = socket.AF_INET
+    size = 4
 
-    @classmethod
-    def load(cls, data: bytes, l: int, size: int):
-        ip = socket.inet_ntop(socket.AF_INET6, data[l:l + size])
-        return l + size, cls(ip)
 
-    def dump(self, names: Dict[str, int], offset: int) -> Iterable[bytes]:
-        yield socket.inet_pton(socket.AF_INET6, self.data)
+@rdata
+class AAAA_RData(Address_RData):
+    '''AAAA record'''
+    __slots__ = ()
+    rtype = types.AAAA
+    family = socket.AF_INET6
+    size = 16
 
 
 @rdata
 class SOA_RData(RData):
     '''Start of Authority record'''
+    __slots__ = ('mname', 'rname', 'serial', 'refresh', 'retry', 'expire',
+                 'minimum')
     rtype = types.SOA
 
     def __init__(self, *k):
-        self.data = k
         (
             self.mname,
             self.rname,
@@ -139,6 +173,11 @@ class SOA_RData(RData):
             self.minimum,
         ) = k
 
+    @property
+    def data(self):
+        return (self.mname, self.rname, self.serial, self.refresh, self.retry,
+                self.expire, self.minimum)
+
     def __repr__(self):
         return '<%s: %s>' % (self.type_name, self.rname)
 
@@ -152,77 +191,90 @@ class SOA_RData(RData):
             retry,
             expire,
             minimum,
-        ) = struct.unpack('!LLLLL', data[i:i + 20])
+        ) = _SOA.unpack_from(data, i)
         return i + 20, cls(mname, rname, serial, refresh, retry, expire,
                            minimum)
 
-    def dump(self, names: Dict[str, int], offset: int) -> Iterable[bytes]:
-        mname = pack_domain_name(self.mname, names, offset + 2)
-        yield mname
-        yield pack_domain_name(self.rname, names, offset + 2 + len(mname))
-        yield struct.pack('!LLLLL', self.serial, self.refresh, self.retry,
-                          self.expire, self.minimum)
+    def pack(self, packer: Packer):
+        packer.write_name(self.mname)
+        packer.write_name(self.rname)
+        packer.write_struct(_SOA, self.serial, self.refresh, self.retry,
+                            self.expire, self.minimum)
 
 
 @rdata
 class MX_RData(RData):
     '''Mail exchanger record'''
 
+    __slots__ = ('preference', 'exchange')
     rtype = types.MX
 
     def __init__(self, *k):
-        self.data = k
         self.preference, self.exchange = k
 
+    @property
+    def data(self):
+        return self.preference, self.exchange
+
     def __repr__(self):
         return '<%s-%s: %s>' % (self.type_name, self.preference, self.exchange)
 
     @classmethod
     def load(cls, data: bytes, l: int, size: int) -> Tuple[int, 'MX_RData']:
-        preference, = struct.unpack('!H', data[l:l + 2])
+        preference, = _MX.unpack_from(data, l)
         i, exchange = load_domain_name(data, l + 2)
         return i, cls(preference, exchange)
 
-    def dump(self, names: Dict[str, int], offset: int) -> Iterable[bytes]:
-        yield struct.pack('!H', self.preference)
-        yield pack_domain_name(self.exchange, names, offset + 4)
+    def pack(self, packer: Packer):
+        packer.write_struct(_MX, self.preference)
+        packer.write_name(self.exchange)
 
 
 @rdata
 class SRV_RData(RData):
     '''Service record'''
 
+    __slots__ = ('priority', 'weight', 'port', 'hostname')
     rtype = types.SRV
 
     def __init__(self, *k):
-        self.data = k
         self.priority, self.weight, self.port, self.hostname = k
 
+    @property
+    def data(self):
+        return self.priority, self.weight, self.port, self.hostname
+
     def __repr__(self):
         return '<%s-%s: %s:%s>' % (self.type_name, self.priority,
                                    self.hostname, self.port)
 
     @classmethod
     def load(cls, data: bytes, l: int, size: int) -> Tuple[int, 'SRV_RData']:
-        priority, weight, port = struct.unpack('!HHH', data[l:l + 6])
+        priority, weight, port = _SRV.unpack_from(data, l)
         i, hostname = load_domain_name(data, l + 6)
         return i, cls(priority, weight, port, hostname)
 
-    def dump(self, names: Dict[str, int], offset: int) -> Iterable[bytes]:
-        yield struct.pack('!HHH', self.priority, self.weight, self.port)
-        yield pack_domain_name(self.hostname, names, offset + 8)
+    def pack(self, packer: Packer):
+        packer.write_struct(_SRV, self.priority, self.weight, self.port)
+        packer.write_name(self.hostname)
 
 
 @rdata
 class NAPTR_RData(RData):
     '''NAPTR record'''
 
+    __slots__ = ('order', 'preference', 'flags', 'service', 'regexp',
+                 'replacement')
     rtype = types.NAPTR
 
     def __init__(self, *k):
-        self.data = k
         self.order, self.preference, self.flags, self.service, self.regexp, self.replacement = k
 
+    @property
+    def data(self):
+        return (self.order, self.preference, self.flags, self.service,
+                self.regexp, self.replacement)
+
     def __repr__(self):
         return '<%s-%s-%s: %s %s %s %s>' % (
             self.type_name, self.order, self.preference, self.flags,
@@ -231,29 +283,30 @@ class NAPTR_RData(RData):
     @classmethod
     def load(cls, data: bytes, l: int, size: int) -> Tuple[int, 'NAPTR_RData']:
         pos = l
-        order, preference = struct.unpack('!HH', data[pos:pos + 4])
+        order, preference = _NAPTR.unpack_from(data, pos)
         pos += 4
-        length = data[pos]
-        pos += 1
-        flags = data[pos:pos + length].decode()
-        pos += length
-        length = data[pos]
-        pos += 1
-        service = data[pos:pos + length].decode()
-        pos += length
-        length = data[pos]
-        pos += 1
-        regexp = data[pos:pos + length].decode()
-        pos += length
+        pos, flags = load_string(data, pos)
+        pos, service = load_string(data, pos)
+        pos, regexp = load_string(data, pos)
+        flags = bytes(flags).decode()
+        service = bytes(service).decode()
+        regexp = bytes(regexp).decode()
         i, replacement = load_domain_name(data, pos)
         return i, cls(order, preference, flags, service, regexp, replacement)
 
-    def dump(self, names: Dict[str, int], offset: int) -> Iterable[bytes]:
-        raise NotImplementedError
+    def pack(self, packer: Packer):
+        packer.write_struct(_NAPTR, self.order, self.preference)
+        packer.write_string(self.flags)
+        packer.write_string(self.service)
+        packer.write_string(self.regexp)
+        # RFC 3403: the replacement field must not be compressed
+        packer.write_name(self.replacement, False)
 
 
 class Domain_RData(RData):
     '''Domain record'''
+    __slots__ = ('data', )
+
     def __init__(self, data: str):
         self.data = data
 
@@ -263,34 +316,35 @@ class Domain_RData(RData):
         l, domain = load_domain_name(data, l)
         return l, cls(domain)
 
-    def dump(self, names: Dict[str, int], offset: int) -> Iterable[bytes]:
-        yield pack_domain_name(self.data, names, offset + 2)
+    def pack(self, packer: Packer):
+        packer.write_name(self.data)
 
 
 @rdata
 class CNAME_RData(Domain_RData):
     '''CNAME record'''
+    __slots__ = ()
     rtype = types.CNAME
 
 
 @rdata
 class NS_RData(Domain_RData):
     '''NS record'''
-
+    __slots__ = ()
     rtype = types.NS
 
 
 @rdata
 class PTR_RData(Domain_RData):
     '''PTR record'''
-
+    __slots__ = ()
     rtype = types.PTR
 
 
 @rdata
 class TXT_RData(RData):
     '''TXT record'''
-
+    __slots__ = ('data', )
     rtype = types.TXT
 
     def __init__(self, data: str):
@@ -299,29 +353,53 @@ class TXT_RData(RData):
     @classmethod
     def load(cls, data: bytes, l: int, size: int) -> Tuple[int, 'TXT_RData']:
         _, text = load_string(data, l)
-        return l + size, cls(text.decode())
+        return l + size, cls(bytes(text).decode())
+
+    def pack(self, packer: Packer):
+        packer.write_string(self.data)
+
+
+@rdata
+class OPT_RData(RData):
+    '''OPT pseudo-record of EDNS(0), RFC 6891'''
+    __slots__ = ('data', )
+    rtype = types.OPT
 
-    def dump(self, names: Dict[str, int], offset: int) -> Iterable[bytes]:
-        yield pack_string(self.data)
+    def __init__(self, data: bytes = b''):
+        self.data = data
+
+    @classmethod
+    def load(cls, data: bytes, l: int, size: int) -> Tuple[int, 'OPT_RData']:
+        return l + size, cls(bytes(data[l:l + size]))
+
+    def pack(self, packer: Packer):
+        packer.write(self.data)
 
 
 class Unsupported_RData(RData):
     '''Unsupported RData'''
+    __slots__ = ('rtype', 'raw')
+
     def __init__(self, rtype: int, raw: bytes):
-        self.data = rtype, raw
         self.rtype = rtype
         self.raw = raw
 
+    @property
+    def data(self):
+        return self.rtype, self.raw
+
     @classmethod
     def load(cls, data: bytes, l: int, size: int,
              qtype: int) -> Tuple[int, 'Unsupported_RData']:
-        return l + size, cls(qtype, data[l:l + size])
+        return l + size, cls(qtype, bytes(data[l:l + size]))
 
-    def dump(self, names: Dict[str, int], offset: int) -> Iterable[bytes]:
-        yield self.raw
+    def pack(self, packer: Packer):
+        packer.write(self.raw)
 
 
 class Record:
+    __slots__ = ('q', 'name', 'qtype', 'qclass', 'ttl', 'data', 'timestamp')
+
     def __init__(self,
                  q: int = RESPONSE,
                  name: str = '',
@@ -345,46 +423,102 @@ class Record:
             return f'<Record type=response qtype={types.get_name(self.qtype)} name={self.name} ttl={self.ttl} data={self.data}>'
 
     def copy(self, **kw):
-        return Record(q=kw.get('q', self.q),
-                      name=kw.get('name', self.name),
-                      qtype=kw.get('qtype', self.qtype),
-                      qclass=kw.get('qclass', self.qclass),
-                      ttl=kw.get('ttl', self.ttl),
-                      data=kw.get('data', self.data))
+        record = Record(q=kw.get('q', self.q),
+                        name=kw.get('name', self.name),
+                        qtype=kw.get('qtype', self.qtype),
+                        qclass=kw.get('qclass', self.qclass),
+                        ttl=kw.get('ttl', self.ttl),
+                        data=kw.get('data', self.data))
+        if record.q == RESPONSE and 'ttl' not in kw:
+            record.timestamp = self.timestamp
+        return record
+
+    def get_ttl(self, now: int = None) -> int:
+        '''Return the remaining TTL, or -1 if the record never expires.'''
+        if self.ttl < 0:
+            return -1
+        if now is None:
+            now = int(time.time())
+        return max(0, self.ttl - now + self.timestamp)
 
     def parse(self, data: bytes, l: int):
         l, self.name = load_domain_name(data, l)
-        self.qtype, self.qclass = struct.unpack('!HH', data[l:l + 4])
-        l += 4
         if self.q == RESPONSE:
+            self.qtype, self.qclass, self.ttl, dl = _RR.unpack_from(data, l)
+            l += 10
             self.timestamp = int(time.time())
-            self.ttl, dl = struct.unpack('!LH', data[l:l + 6])
-            l += 6
             _, self.data = load_rdata(self.qtype, data, l, dl)
             l += dl
+        else:
+            self.qtype, self.qclass = _QUESTION.unpack_from(data, l)
+            l += 4
         return l
 
-    def pack(self, names, offset=0):
-        buf = io.BytesIO()
-        buf.write(pack_domain_name(self.name, names, offset))
-        buf.write(struct.pack('!HH', self.qtype, self.qclass))
+    @classmethod
+    def create_opt(cls, udp_size: int = EDNS_UDP_SIZE, ext_rcode: int = 0,
+                   version: int = 0, do: int = 0, options: bytes = b''):
+        '''Create an OPT pseudo-record for EDNS(0).
+
+        The class holds the UDP payload size and the TTL holds the extended
+        rcode, the version and the flags.
+        '''
+        return cls(name='',
+                   qtype=types.OPT,
+                   qclass=udp_size,
+                   ttl=(ext_rcode << 24) + (version << 16) + (do << 15),
+                   data=OPT_RData(options))
+
+    def pack(self, packer: Packer):
+        packer.write_name(self.name)
         if self.q == RESPONSE:
-            if self.ttl < 0:
-                ttl = MAXAGE
-            else:
-                now = int(time.time())
-                self.ttl -= now - self.timestamp
-                if self.ttl < 0:
-                    self.ttl = 0
-                self.timestamp = now
+            if self.qtype == types.OPT:
+                # TTL holds the extended rcode and flags of EDNS(0)
                 ttl = self.ttl
-            buf.write(struct.pack('!L', ttl))
-            data_str = b''.join(self.data.dump(names, offset + buf.tell()))
-            buf.write(pack_string(data_str, '!H'))
-        return buf.getvalue()
+            else:
+                ttl = self.get_ttl()
+                if ttl < 0:
+                    ttl = MAXAGE
+            packer.write_struct(_RR, self.qtype, self.qclass, ttl, 0)
+            start = packer.pos
+            if self.ttl >= 0 and self.qtype != types.OPT:
+                packer.ttls.append((start - 6, ttl))
+            self.data.pack(packer)
+            _SHORT.pack_into(packer.buf, start - 2, packer.pos - start)
+        else:
+            packer.write_struct(_QUESTION, self.qtype, self.qclass)
+
+
+def _skip_name(data: bytes, l: int) -> int:
+    '''Return the offset after a packed domain name without decoding it.'''
+    while True:
+        if l >= len(data):
+            raise ParseError(data, l, 'Bad data')
+        length = data[l]
+        if length == 0:
+            return l + 1
+        if length >= 0xc0:
+            return l + 2
+        l += length + 1
+
+
+def _section(index: int, doc: str):
+    def fget(self) -> List[Record]:
+        if self._pending is not None:
+            self._load_sections(index)
+        return self._sections[index]
+
+    def fset(self, value: List[Record]):
+        if self._pending is not None:
+            self._load_sections(index)
+        self._sections[index] = value
+
+    return property(fget, fset, doc=doc)
 
 
 class DNSMessage:
+    __slots__ = ('qr', 'qid', 'o', 'aa', 'tc', 'rd', 'ra', 'r', 'qd',
+                 '_sections', '_pending')
+
     def __init__(self, qr=RESPONSE, qid=0, o=0, aa=0, tc=0, rd=1, ra=1, r=0):
         self.qr = qr  # 0 for request, 1 for response
         self.qid = qid  # id for UDP package
@@ -395,9 +529,14 @@ class DNSMessage:
         self.ra = ra  # Recursion Available for response
         self.r = r  # rcode: 0 for success
         self.qd: List[Record] = []
-        self.an: List[Record] = []  # answers
-        self.ns: List[Record] = []  # authority records, aka nameservers
-        self.ar: List[Record] = []  # additional records
+        # an, ns, ar
+        self._sections: List[List[Record]] = [[], [], []]
+        # (buffer, offset, loaded, counts) of sections not decoded yet
+        self._pending = None
+
+    an = _section(0, 'answers')
+    ns = _section(1, 'authority records, aka nameservers')
+    ar = _section(2, 'additional records')
 
     def __bool__(self):
         return any(map(len, (self.an, self.ns)))
@@ -412,29 +551,49 @@ class DNSMessage:
         return '<DNSMessage type=%s qid=%d r=%d QD=%s AN=%s NS=%s AR=%s>' % (
             self.qr, self.qid, self.r, self.qd, self.an, self.ns, self.ar)
 
-    def pack(self, size_limit: int = None):
+    def pack(self,
+             size_limit: int = None,
+             packer: Packer = None,
+             opt: Record = None) -> bytes:
+        '''Pack the message into bytes.
+
+        If `packer` is provided, the offsets of TTLs written can be read from
+        `packer.ttls` afterwards.
+
+        If `opt` is provided, it is appended to the additional records and
+        kept even if the message is truncated.
+        '''
         z = 0
-        names: Dict[str, int] = {}
-        buf = io.BytesIO()
-        buf.seek(12)
+        if packer is None:
+            packer = Packer(size_limit or 512)
+        packer.reserve(12)
+        if opt is not None and size_limit is not None:
+            # OPT record with no options takes 11 bytes
+            size_limit -= 11 + len(opt.data.data)
+        counts = []
         tc = 0
         for group in self.qd, self.an, self.ns, self.ar:
-            if tc: break
-            for rec in group:
-                offset = buf.tell()
-                brec = rec.pack(names, offset)
-                if size_limit is not None and offset + len(brec) > size_limit:
-                    tc = 1
-                    break
-                buf.write(brec)
+            count = 0
+            if not tc:
+                for rec in group:
+                    start = packer.pos
+                    rec.pack(packer)
+                    if size_limit is not None and packer.pos > size_limit:
+                        packer.truncate(start)
+                        tc = 1
+                        break
+                    count += 1
+            counts.append(count)
+        if opt is not None:
+            opt.pack(packer)
+            counts[3] += 1
         self.tc = tc
-        buf.seek(0)
-        buf.write(
-            struct.pack('!HHHHHH', self.qid, (self.qr << 15) + (self.o << 11) +
-                        (self.aa << 10) + (self.tc << 9) + (self.rd << 8) +
-                        (self.ra << 7) + (z << 4) + self.r, len(self.qd),
-                        len(self.an), len(self.ns), len(self.ar)))
-        return buf.getvalue()
+        _HEADER.pack_into(
+            packer.buf, 0, self.qid,
+            (self.qr << 15) + (self.o << 11) + (self.aa << 10) +
+            (self.tc << 9) + (self.rd << 8) + (self.ra << 7) + (z << 4) +
+            self.r, *counts)
+        return packer.getvalue()
 
     @staticmethod
     def parse_entry(qr: int, data: bytes, l: int,
@@ -446,9 +605,28 @@ class DNSMessage:
             res.append(r)
         return l, res
 
+    def _load_sections(self, index: int = 2):
+        '''Decode pending sections up to `index` (0: an, 1: ns, 2: ar).'''
+        data, l, loaded, counts = self._pending
+        while loaded <= index:
+            l, self._sections[loaded] = self.parse_entry(
+                RESPONSE, data, l, counts[loaded])
+            loaded += 1
+        if loaded < 3:
+            self._pending = data, l, loaded, counts
+        else:
+            self._pending = None
+
     @classmethod
-    def parse(cls, data: bytes, qid: bytes = None):
-        rqid, x, qd, an, ns, ar = struct.unpack('!HHHHHH', data[:12])
+    def parse(cls, data: bytes, qid: bytes = None, lazy: bool = False):
+        '''Parse a DNS message from raw bytes.
+
+        If `lazy` is true, only the header and the question section are
+        decoded. The other sections are decoded from a memoryview of `data`
+        the first time any of them is accessed.
+        '''
+        data = memoryview(data)
+        rqid, x, qd, an, ns, ar = _HEADER.unpack_from(data)
         if qid is not None and qid != rqid:
             raise DNSError(-1, 'Transaction ID mismatch')
         r, x = get_bits(x, 4)  # rcode: 0 for no error
@@ -461,11 +639,76 @@ class DNSMessage:
         qr, x = get_bits(x, 1)  # qr: 0 for query and 1 for response
         ans = cls(qr, rqid, o, aa, tc, rd, ra, r)
         l, ans.qd = ans.parse_entry(REQUEST, data, 12, qd)
-        l, ans.an = ans.parse_entry(RESPONSE, data, l, an)
-        l, ans.ns = ans.parse_entry(RESPONSE, data, l, ns)
-        l, ans.ar = ans.parse_entry(RESPONSE, data, l, ar)
+        ans._pending = data, l, 0, (an, ns, ar)
+        if not lazy:
+            ans._load_sections()
         return ans
 
+    @property
+    def opt(self) -> Union[Record, None]:
+        '''The OPT pseudo-record of EDNS(0), None if EDNS is not used.
+
+        If the sections are not decoded yet, only the OPT record is decoded.
+        '''
+        if self._pending is not None:
+            return self._find_opt()
+        for rec in self.ar:
+            if rec.qtype == types.OPT:
+                return rec
+
+    def _find_opt(self) -> Union[Record, None]:
+        data, l, loaded, counts = self._pending
+        try:
+            # skip the records before the additional section
+            for _ in range(sum(counts[loaded:2])):
+                l = _skip_name(data, l)
+                l += _RR.size + _RR.unpack_from(data, l)[3]
+            for _ in range(counts[2]):
+                start = l
+                l = _skip_name(data, l)
+                qtype, _, _, size = _RR.unpack_from(data, l)
+                if qtype == types.OPT:
+                    rec = Record(RESPONSE)
+                    rec.parse(data, start)
+                    return rec
+                l += _RR.size + size
+        except struct.error:
+            raise ParseError(data, l, 'Bad data')
+
+    def set_edns(self, udp_size: int = EDNS_UDP_SIZE, do: int = 0):
+        '''Use EDNS(0) with `udp_size` as the UDP payload size.'''
+        self.ar = [rec for rec in self.ar if rec.qtype != types.OPT]
+        self.ar.append(Record.create_opt(udp_size, do=do))
+
+    @property
+    def udp_size(self) -> int:
+        '''The UDP payload size advertised by the sender.'''
+        opt = self.opt
+        if opt is None:
+            return 512
+        # RFC 6891: values lower than 512 must be treated as 512
+        return max(512, opt.qclass)
+
+    @property
+    def edns_version(self) -> Union[int, None]:
+        opt = self.opt
+        if opt is not None:
+            return (opt.ttl >> 16) & 0xff
+
+    @property
+    def edns_do(self) -> int:
+        '''The DNSSEC OK bit.'''
+        opt = self.opt
+        return 0 if opt is None else (opt.ttl >> 15) & 1
+
+    @property
+    def rcode(self) -> int:
+        '''The full rcode, including the upper 8 bits from EDNS(0).'''
+        opt = self.opt
+        if opt is None:
+            return self.r
+        return ((opt.ttl >> 24) << 4) + self.r
+
     def get_record(self, qtypes: Union[int, Iterable[int]]):
         '''Get the first record of qtype defined in `qtypes` in answer list.
         '''
@@ -0,0 +1,404 @@
+'''
+Cache shared by processes in a memory-mapped file.
+'''
+from contextlib import contextmanager
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple, Union
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from . import types
+from .cache import create_record
+from .name import DomainName
+from .record import RData, Record, load_rdata
+from .util import Packer, load_domain_name, logger
+
+__all__ = ['SharedCache']
+
+# magic, version, probes, number of slots, slot size
+_HEADER = struct.Struct('<4sHHLL')
+HEADER_SIZE = 64
+MAGIC = b'ADSC'
+VERSION = 1
+
+# Each slot holds one record set:
+#   seq (4) | hits (4) | hash (4) | expires (4) | qtype (2) | name length (2)
+#   | data length (2) | record count (2) | name | records
+# `seq` is odd while the slot is being written, readers retry until they get
+# the same even `seq` before and after copying the slot.
+_SEQ = struct.Struct('<L')
+_META = struct.Struct('<LLHHHH')
+SLOT_HEADER = 8 + _META.size
+# expires, ttl, qclass, rdata length
+_RECORD = struct.Struct('<LLHH')
+PERMANENT = 0xffffffff
+READ_RETRIES = 100
+
+# types to look up for ANY questions
+ANY_TYPES = (types.A, types.AAAA, types.CNAME, types.MX, types.NS, types.PTR,
+             types.SOA, types.SRV, types.TXT, types.NAPTR)
+
+RawRecord = Tuple[int, int, int, bytes]
+
+
+def _pack_rdata(rdata: RData) -> bytes:
+    packer = Packer(64)
+    rdata.pack(packer)
+    return packer.getvalue()
+
+
+class SharedCache:
+    '''A fixed-size cache in a memory-mapped file that can be used by several
+    processes in place of `CacheNode`.
+
+    Record sets are stored in wire format in an open-addressing table of
+    `slots` slots of `slot_size` bytes. A record set lives in one of the
+    `probes` slots after its hash, and replaces an empty or expired slot, or
+    the one that expires first when the cache is full. Record sets larger
+    than a slot are not cached.
+
+    Readers do not lock, writers are serialized with a lock on the file. The
+    lock is taken on a file descriptor opened by each process, so a cache
+    opened before `fork` still excludes writers of the other processes.
+    Wildcard names are not expanded, and ANY questions only return the types
+    in `ANY_TYPES`.
+    '''
+    def __init__(self,
+                 path: str,
+                 slots: int = 1 << 16,
+                 slot_size: int = 512,
+                 stale_ttl: int = 0,
+                 probes: int = 8):
+        self.path = path
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # `flock` locks are shared by descriptors forked from the same open
+        # file, so each process opens its own descriptor to lock
+        self._lock_fd = self.fd
+        self._lock_pid = os.getpid()
+        with self._locked():
+            size = os.fstat(self.fd).st_size
+            if size < HEADER_SIZE:
+                size = HEADER_SIZE + slots * slot_size
+                os.ftruncate(self.fd, size)
+                self.mm = mmap.mmap(self.fd, size)
+                _HEADER.pack_into(self.mm, 0, MAGIC, VERSION, probes, slots,
+                                  slot_size)
+            else:
+                self.mm = mmap.mmap(self.fd, size)
+        magic, version, probes, slots, slot_size = _HEADER.unpack_from(
+            self.mm, 0)
+        if (magic != MAGIC or version != VERSION
+                or size != HEADER_SIZE + slots * slot_size):
+            self.close()
+            raise ValueError('Invalid shared cache file: ' + path)
+        self.probes = min(probes, slots)
+        self.slots = slots
+        self.slot_size = slot_size
+
+    def close(self):
+        self.mm.close()
+        if self._lock_fd != self.fd:
+            os.close(self._lock_fd)
+        os.close(self.fd)
+
+    def _get_lock_fd(self) -> int:
+        pid = os.getpid()
+        if pid != self._lock_pid:
+            # forked, the thread holding the lock may not exist any more
+            self._lock = threading.Lock()
+            self._lock_fd = os.open(self.path, os.O_RDWR)
+            self._lock_pid = pid
+        return self._lock_fd
+
+    @contextmanager
+    def _locked(self):
+        fd = self._get_lock_fd()
+        with self._lock:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def _bases(self, key_hash: int) -> Iterable[int]:
+        slots = self.slots
+        for i in range(self.probes):
+            yield HEADER_SIZE + (key_hash + i) % slots * self.slot_size
+
+    def _read(self, name: DomainName,
+              qtype: int) -> Tuple[int, Union[bytes, None]]:
+        '''Return the position and a consistent copy of the slot holding a
+        record set, or `(-1, None)` if it is not found.
+        '''
+        mm = self.mm
+        wire = name.wire
+        key_hash = zlib.crc32(wire, qtype)
+        for base in self._bases(key_hash):
+            for _ in range(READ_RETRIES):
+                seq, = _SEQ.unpack_from(mm, base)
+                if seq & 1:
+                    continue
+                slot_hash, _, slot_qtype, name_len, data_len, _ = _META.unpack_from(
+                    mm, base + 8)
+                if (slot_hash != key_hash or slot_qtype != qtype
+                        or name_len != len(wire)):
+                    break
+                size = SLOT_HEADER + name_len + data_len
+                if size > self.slot_size:
+                    continue
+                data = mm[base:base + size]
+                if _SEQ.unpack_from(mm, base)[0] != seq:
+                    continue
+                if data[SLOT_HEADER:SLOT_HEADER + name_len] != wire:
+                    break
+                return base, data
+        return -1, None
+
+    def _load_records(self, data: bytes, name: DomainName, qtype: int,
+                      now: int, stale: bool) -> List[Record]:
+        _, _, _, name_len, _, count = _META.unpack_from(data, 8)
+        results = []
+        l = SLOT_HEADER + name_len
+        with memoryview(data) as view:
+            for _ in range(count):
+                expires, ttl, qclass, size = _RECORD.unpack_from(view, l)
+                l += _RECORD.size
+                if (expires == PERMANENT or expires >= now
+                        or stale and expires + self.stale_ttl >= now):
+                    with view[l:l + size] as rdata:
+                        _, rdata = load_rdata(qtype, rdata, 0, size)
+                    if expires == PERMANENT:
+                        record = Record(name=name,
+                                        qtype=qtype,
+                                        qclass=qclass,
+                                        ttl=-1,
+                                        data=rdata)
+                    else:
+                        record = Record(name=name,
+                                        qtype=qtype,
+                                        qclass=qclass,
+                                        ttl=ttl,
+                                        data=rdata)
+                        record.timestamp = expires - ttl
+                    results.append(record)
+                l += size
+        return results
+
+    def query(self,
+              fqdn: str,
+              qtype: Union[int, Iterable[int]],
+              stale: bool = False) -> Iterable[Record]:
+        '''Yield cached records, see `CacheNode.query`.'''
+        if not isinstance(qtype, int):
+            for t in qtype:
+                yield from self.query(fqdn, t, stale)
+            return
+        name = DomainName(fqdn)
+        if qtype == types.ANY:
+            yield from self.query(name, ANY_TYPES, stale)
+            return
+        _, data = self._read(name, qtype)
+        if data is not None:
+            yield from self._load_records(data, name, qtype,
+                                          int(time.time()), stale)
+
+    def hit(self, fqdn: str, qtype: int) -> int:
+        '''Count a question answered from the cache, see `CacheNode.hit`.
+
+        The counters are not locked and may miss concurrent hits.
+        '''
+        base, _ = self._read(DomainName(fqdn), qtype)
+        if base < 0:
+            return 0
+        count = _SEQ.unpack_from(self.mm, base + 4)[0] + 1
+        _SEQ.pack_into(self.mm, base + 4, count)
+        return count
+
+    def pop_hits(self, fqdn: str, qtype: int) -> int:
+        '''Return the number of hits of a question and reset it.'''
+        base, _ = self._read(DomainName(fqdn), qtype)
+        if base < 0:
+            return 0
+        count, = _SEQ.unpack_from(self.mm, base + 4)
+        _SEQ.pack_into(self.mm, base + 4, 0)
+        return count
+
+    def _find_slot(self, key_hash: int, qtype: int, wire: bytes,
+                   now: int) -> Tuple[int, bool]:
+        '''Return the position of the slot to write a record set to, and
+        whether it already holds the record set. Must be called with the lock.
+        '''
+        mm = self.mm
+        best = -1
+        best_expires = PERMANENT
+        for base in self._bases(key_hash):
+            slot_hash, expires, slot_qtype, name_len, _, _ = _META.unpack_from(
+                mm, base + 8)
+            if (slot_hash == key_hash and slot_qtype == qtype
+                    and name_len == len(wire) and
+                    mm[base + SLOT_HEADER:base + SLOT_HEADER + name_len] == wire):
+                return base, True
+            if name_len == 0:
+                expires = 0
+            elif expires != PERMANENT and expires + self.stale_ttl < now:
+                expires = 1
+            if best < 0 or expires < best_expires:
+                best = base
+                best_expires = expires
+        if best_expires == PERMANENT:
+            return -1, False
+        return best, False
+
+    def _read_raw(self, base: int) -> List[RawRecord]:
+        '''Return the records in a slot in wire format. Must be called with
+        the lock.
+        '''
+        mm = self.mm
+        _, _, _, name_len, _, count = _META.unpack_from(mm, base + 8)
+        records = []
+        l = base + SLOT_HEADER + name_len
+        for _ in range(count):
+            expires, ttl, qclass, size = _RECORD.unpack_from(mm, l)
+            l += _RECORD.size
+            records.append((expires, ttl, qclass, mm[l:l + size]))
+            l += size
+        return records
+
+    def _write(self, base: int, key_hash: int, qtype: int, wire: bytes,
+               records: List[RawRecord], reset_hits: bool):
+        '''Write a record set to a slot. Must be called with the lock.'''
+        mm = self.mm
+        buf = bytearray(wire)
+        for expires, ttl, qclass, rdata in records:
+            buf.extend(_RECORD.pack(expires, ttl, qclass, len(rdata)))
+            buf.extend(rdata)
+        if SLOT_HEADER + len(buf) > self.slot_size:
+            logger.debug('[SharedCache] record set too large: %d bytes',
+                         len(buf))
+            return
+        expires = max((item[0] for item in records), default=0)
+        seq, = _SEQ.unpack_from(mm, base)
+        # an odd `seq` means the last writer crashed
+        seq |= 1
+        _SEQ.pack_into(mm, base, seq)
+        if reset_hits:
+            _SEQ.pack_into(mm, base + 4, 0)
+        _META.pack_into(mm, base + 8, key_hash, expires, qtype, len(wire),
+                        len(buf) - len(wire), len(records))
+        mm[base + SLOT_HEADER:base + SLOT_HEADER + len(buf)] = buf
+        _SEQ.pack_into(mm, base, (seq + 1) & 0xffffffff)
+
+    def add(self,
+            fqdn: str = None,
+            qtype: int = None,
+            data: Union[RData, bytes, Iterable] = None,
+            ttl=-1,
+            record: Record = None):
+        '''Add a record to the cache, see `CacheNode.add`.'''
+        if record is None:
+            record = create_record(fqdn, qtype, data, ttl)
+        now = int(time.time())
+        if record.ttl < 0:
+            expires = PERMANENT
+        else:
+            expires = record.timestamp + record.ttl
+            if expires < now:
+                return
+        name = DomainName(record.name)
+        qtype = record.qtype
+        wire = name.wire
+        key_hash = zlib.crc32(wire, qtype)
+        rdata = _pack_rdata(record.data)
+        with self._locked():
+            base, found = self._find_slot(key_hash, qtype, wire, now)
+            if base < 0:
+                return
+            records = []
+            if found:
+                for item in self._read_raw(base):
+                    if item[3] == rdata and item[2] == record.qclass:
+                        continue
+                    if item[0] != PERMANENT and item[0] < now:
+                        # drop stale records once the set is refreshed
+                        continue
+                    records.append(item)
+            records.append(
+                (expires, max(record.ttl, 0), record.qclass, rdata))
+            self._write(base, key_hash, qtype, wire, records, not found)
+
+    def remove(self, fqdn: str, qtype: int = types.ANY):
+        '''Remove cached records of `fqdn`.'''
+        name = DomainName(fqdn)
+        qtypes = ANY_TYPES if qtype == types.ANY else (qtype, )
+        with self._locked():
+            for qt in qtypes:
+                base, data = self._read(name, qt)
+                if data is not None:
+                    self._write(base, 0, 0, b'', [], True)
+
+    def discard(self, fqdn: str, qtype: int, data: Iterable[RData]):
+        '''Remove the cached records of `fqdn` and `qtype` with `data`, see
+        `CacheNode.discard`.'''
+        name = DomainName(fqdn)
+        rdata = set(map(_pack_rdata, data))
+        with self._locked():
+            base, slot = self._read(name, qtype)
+            if slot is None:
+                return
+            records = [
+                item for item in self._read_raw(base) if item[3] not in rdata
+            ]
+            if records:
+                self._write(base, zlib.crc32(name.wire, qtype), qtype,
+                            name.wire, records, False)
+            else:
+                self._write(base, 0, 0, b'', [], True)
+
+    def _iter_slots(self) -> Iterable[bytes]:
+        for base in range(HEADER_SIZE, len(self.mm), self.slot_size):
+            for _ in range(READ_RETRIES):
+                seq, = _SEQ.unpack_from(self.mm, base)
+                if seq & 1:
+                    continue
+                data = self.mm[base:base + self.slot_size]
+                if _SEQ.unpack_from(self.mm, base)[0] == seq:
+                    if _META.unpack_from(data, 8)[3]:
+                        yield data
+                    break
+
+    def iter_values(self) -> Iterable[Record]:
+        '''Yield all live records.'''
+        now = int(time.time())
+        for data in self._iter_slots():
+            _, name = load_domain_name(data, SLOT_HEADER)
+            qtype = _META.unpack_from(data, 8)[2]
+            yield from self._load_records(data, name, qtype, now, False)
+
+    def stats(self) -> Dict[str, int]:
+        '''Return the number of record sets and records, and the bytes they
+        use in the table.'''
+        entries = records = size = 0
+        for data in self._iter_slots():
+            _, _, _, name_len, data_len, count = _META.unpack_from(data, 8)
+            entries += 1
+            records += count
+            size += SLOT_HEADER + name_len + data_len
+        return {'entries': entries, 'records': records, 'bytes': size}
+
+    def start_expiry(self, *k, **kw):
+        '''Expired slots are reused by writers, nothing to do in background.'''
+
+    def stop_expiry(self):
+        pass
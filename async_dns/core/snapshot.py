@@ -0,0 +1,122 @@
+'''
+Binary snapshots of the cache for warm restarts.
+
+A snapshot starts with a header of `ADNS` and the format version, followed
+by one entry per record:
+
+    name (uncompressed wire format)
+    qtype (2) | qclass (2) | expires (4, UNIX time) | rdlength (2)
+    rdata (wire format, names compressed within the rdata only)
+'''
+import mmap
+import os
+import struct
+import time
+from typing import Iterable
+
+from .cache import CacheNode
+from .name import DomainName
+from .record import Record, load_rdata
+from .util import Packer, ParseError, load_domain_name, logger
+
+__all__ = ['save_snapshot', 'write_snapshot', 'load_snapshot']
+
+_HEADER = struct.Struct('!4sH')
+_ENTRY = struct.Struct('!HHLH')
+_SHORT = struct.Struct('!H')
+MAGIC = b'ADNS'
+VERSION = 1
+# flush the buffer to the file when it grows larger than this
+CHUNK_SIZE = 1 << 16
+
+
+def save_snapshot(cache: CacheNode, path: str) -> int:
+    '''Write the cached records with a TTL to `path` and return the number
+    of records written.
+
+    The file is replaced atomically so that a crash never leaves a partial
+    snapshot.
+    '''
+    return write_snapshot(cache.iter_values(), path)
+
+
+def write_snapshot(records: Iterable[Record], path: str) -> int:
+    '''Write `records` with a TTL to `path` like `save_snapshot`.
+
+    Records collected from a cache on the event loop can be written in
+    another thread, since the cache is not accessed.
+    '''
+    now = int(time.time())
+    packer = Packer(CHUNK_SIZE)
+    packer.write_struct(_HEADER, MAGIC, VERSION)
+    count = 0
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        for record in records:
+            ttl = record.get_ttl(now)
+            if ttl <= 0:
+                # permanent records are loaded from hosts files
+                continue
+            packer.write(DomainName(record.name).wire)
+            packer.write_struct(_ENTRY, record.qtype, record.qclass, now + ttl,
+                                0)
+            start = packer.pos
+            # rdata is loaded on its own, so pointers must be relative to it
+            packer.names.clear()
+            packer.offset = -start
+            record.data.pack(packer)
+            _SHORT.pack_into(packer.buf, start - 2, packer.pos - start)
+            count += 1
+            if packer.pos >= CHUNK_SIZE:
+                f.write(packer.getvalue())
+                packer.pos = 0
+        f.write(packer.getvalue())
+    os.replace(tmp_path, path)
+    return count
+
+
+def load_snapshot(cache: CacheNode, path: str) -> int:
+    '''Add the records in a snapshot to `cache` and return the number of
+    records loaded. Expired records are skipped.
+    '''
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return 0
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size < _HEADER.size:
+            return 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _load(cache, data, size)
+
+
+def _load(cache: CacheNode, data: mmap.mmap, size: int) -> int:
+    magic, version = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ParseError(b'', 0, 'Invalid snapshot header')
+    now = int(time.time())
+    count = 0
+    l = _HEADER.size
+    with memoryview(data) as view:
+        while l < size:
+            try:
+                l, name = load_domain_name(view, l)
+                qtype, qclass, expires, rdlength = _ENTRY.unpack_from(view, l)
+                l += _ENTRY.size
+                if expires <= now:
+                    l += rdlength
+                    continue
+                with view[l:l + rdlength] as rdata:
+                    _, rdata = load_rdata(qtype, rdata, 0, rdlength)
+                l += rdlength
+            except (IndexError, ParseError, struct.error):
+                logger.warning('[load_snapshot] truncated at %d', l)
+                break
+            cache.add(record=Record(name=name,
+                                    qtype=qtype,
+                                    qclass=qclass,
+                                    ttl=expires - now,
+                                    data=rdata))
+            count += 1
+    return count
@@ -13,6 +13,9 @@ TXT = 16
 AAAA = 28
 SRV = 33
 NAPTR = 35
+OPT = 41
+IXFR = 251
+AXFR = 252
 ANY = 255
 
 
@@ -2,10 +2,11 @@
 Utility methods for parsing and packing DNS record data.
 '''
 
-import io
 import logging
 import struct
-from typing import Union
+from typing import Dict, List, Tuple, Union
+
+from .name import DomainName
 
 logger = logging.getLogger(__package__)
 
@@ -50,8 +51,7 @@ def load_domain_name(buffer: bytes, offset: int):
         offset += length
     if cursor is None:
         raise ParseError(buffer, offset, 'Bad data')
-    data = b'.'.join(parts).decode()
-    return cursor, data
+    return cursor, DomainName.from_labels(parts)
 
 
 def load_string(buffer: bytes, offset: int):
@@ -62,12 +62,20 @@ def load_string(buffer: bytes, offset: int):
     return offset + length, data
 
 
+_BYTE = struct.Struct('B')
+_SHORT = struct.Struct('!H')
+_LENGTH_STRUCTS = {
+    'B': _BYTE,
+    '!H': _SHORT,
+}
+
+
 def pack_string(string: Union[str, bytes], btype='B') -> bytes:
     '''Pack string into `{length}{data}` format.'''
     if not isinstance(string, bytes):
         string = string.encode()
-    length = len(string)
-    return struct.pack('%s%ds' % (btype, length), length, string)
+    length_struct = _LENGTH_STRUCTS.get(btype) or struct.Struct(btype)
+    return length_struct.pack(len(string)) + string
 
 
 def get_bits(num: int, bit_len: int):
@@ -77,18 +85,87 @@ def get_bits(num: int, bit_len: int):
     return low, high
 
 
-def pack_domain_name(name, names, offset=0):
-    parts = name.split('.')
-    buf = io.BytesIO()
-    while parts:
-        subname = '.'.join(parts)
-        u = names.get(subname)
-        if u:
-            buf.write(struct.pack('!H', 0xc000 + u))
-            break
-        else:
-            names[subname] = buf.tell() + offset
-        buf.write(pack_string(parts.pop(0)))
-    else:
-        buf.write(b'\0')
-    return buf.getvalue()
+class Packer:
+    '''Pack DNS data into one growable buffer.
+
+    Domain names are compressed with a table keyed by label suffix, e.g.
+    `www.google.com`, `google.com` and `com` are looked up in turn.
+    '''
+    def __init__(self,
+                 size: int = 512,
+                 names: Dict[str, int] = None,
+                 offset: int = 0):
+        self.buf = bytearray(size)
+        self.pos = 0
+        # offset of the buffer in the whole message
+        self.offset = offset
+        self.names: Dict[str, int] = {} if names is None else names
+        # (position, ttl) of each TTL field written
+        self.ttls: List[Tuple[int, int]] = []
+
+    def reserve(self, size: int) -> int:
+        '''Reserve `size` bytes and return the position to write at.'''
+        pos = self.pos
+        end = pos + size
+        buf_len = len(self.buf)
+        if end > buf_len:
+            self.buf.extend(bytes(max(end, buf_len * 2) - buf_len))
+        self.pos = end
+        return pos
+
+    def truncate(self, pos: int):
+        '''Drop everything written after `pos`.'''
+        self.pos = pos
+        limit = pos + self.offset
+        names = self.names
+        for key in [key for key, value in names.items() if value >= limit]:
+            del names[key]
+        self.ttls = [item for item in self.ttls if item[0] < pos]
+
+    def write(self, data: bytes):
+        pos = self.reserve(len(data))
+        self.buf[pos:self.pos] = data
+
+    def write_struct(self, packer: struct.Struct, *values):
+        packer.pack_into(self.buf, self.reserve(packer.size), *values)
+
+    def write_string(self, string: Union[str, bytes]):
+        '''Write string in `{length}{data}` format.'''
+        if not isinstance(string, bytes):
+            string = string.encode()
+        self.write_struct(_BYTE, len(string))
+        self.write(string)
+
+    def write_name(self, name: str, compress: bool = True):
+        '''Write a domain name, reusing previously written suffixes.'''
+        name = DomainName(name)
+        names = self.names
+        wire = name.wire
+        base = self.pos + self.offset
+        # offsets of the current suffix in `name` and `wire`
+        start = 0
+        wire_start = 0
+        for label in name.labels:
+            suffix = name[start:] if start else name
+            if compress:
+                pointer = names.get(suffix)
+                if pointer is not None:
+                    self.write(wire[:wire_start])
+                    self.write_struct(_SHORT, 0xc000 + pointer)
+                    return
+            pointer = base + wire_start
+            if pointer < 0x4000:
+                names.setdefault(suffix, pointer)
+            start += len(label) + 1
+            wire_start += wire[wire_start] + 1
+        self.write(wire)
+
+    def getvalue(self) -> bytes:
+        return bytes(self.buf[:self.pos])
+
+
+def pack_domain_name(name: str, names: Dict[str, int], offset: int = 0):
+    '''Pack a domain name on its own, see `Packer.write_name`.'''
+    packer = Packer(len(name) + 2, names, offset)
+    packer.write_name(name)
+    return packer.getvalue()
@@ -0,0 +1,325 @@
+'''
+Local authoritative zones loaded from master files, see RFC 1035 section 5.
+'''
+from io import TextIOWrapper
+import os
+import re
+from typing import Dict, Iterable, List, Tuple, Union
+
+from . import types
+from .name import DomainName
+from .record import Record, create_rdata
+
+__all__ = ['Zone', 'ZoneError', 'parse_zone_file']
+
+_TTL = re.compile(r'(\d+)([smhdw]?)', re.I)
+_TTL_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+_CLASSES = ('IN', 'CS', 'CH', 'HS')
+
+
+class ZoneError(Exception):
+    pass
+
+
+class _Quoted(str):
+    '''A token in quotes, never taken as a keyword.'''
+
+
+def _tokenize(fd: Iterable[str]):
+    '''Yield the line number, whether the entry starts with a blank, and the
+    tokens of each entry, which may span lines in parentheses.'''
+    tokens = []
+    depth = 0
+    for lineno, line in enumerate(fd, 1):
+        if depth == 0:
+            tokens = []
+            start = lineno
+            blank = line[:1] in (' ', '\t')
+        i = 0
+        size = len(line)
+        while i < size:
+            c = line[i]
+            if c in ' \t\r\n':
+                i += 1
+            elif c == ';':
+                break
+            elif c == '(':
+                depth += 1
+                i += 1
+            elif c == ')':
+                depth -= 1
+                if depth < 0:
+                    raise ZoneError('Unbalanced parentheses at line %d' %
+                                    lineno)
+                i += 1
+            elif c == '"':
+                chars = []
+                i += 1
+                while i < size and line[i] != '"':
+                    if line[i] == '\\' and i + 1 < size:
+                        i += 1
+                    chars.append(line[i])
+                    i += 1
+                if i >= size:
+                    raise ZoneError('Unterminated string at line %d' % lineno)
+                tokens.append(_Quoted(''.join(chars)))
+                i += 1
+            else:
+                j = i
+                while j < size and line[j] not in ' \t\r\n;()"':
+                    j += 2 if line[j] == '\\' else 1
+                tokens.append(line[i:j])
+                i = j
+        if depth == 0 and tokens:
+            yield start, blank, tokens
+    if depth:
+        raise ZoneError('Unbalanced parentheses at line %d' % start)
+
+
+def _parse_ttl(token: str) -> int:
+    '''Parse a TTL like `3600` or `1h30m`.'''
+    if not token or _TTL.sub('', token):
+        raise ValueError('Invalid TTL: ' + token)
+    return sum(
+        int(value) * _TTL_UNITS[unit.lower()]
+        for value, unit in _TTL.findall(token))
+
+
+def _is_ttl(token: str) -> bool:
+    return not isinstance(token, _Quoted) and token[:1].isdigit()
+
+
+def _absolute(name: str, origin: Union[DomainName, None]) -> DomainName:
+    if name == '@':
+        if origin is None:
+            raise ValueError('No origin for `@`')
+        return origin
+    if name.endswith('.'):
+        return DomainName(name)
+    if origin is None:
+        raise ValueError('No origin for relative name: ' + name)
+    return DomainName(name + '.' + origin if origin else name)
+
+
+def _parse_rdata(qtype: int, args: List[str], origin: DomainName) -> tuple:
+    if qtype in (types.A, types.AAAA):
+        address, = args
+        return address,
+    if qtype in (types.NS, types.CNAME, types.PTR):
+        name, = args
+        return _absolute(name, origin),
+    if qtype == types.MX:
+        preference, exchange = args
+        return int(preference), _absolute(exchange, origin)
+    if qtype == types.SRV:
+        priority, weight, port, target = args
+        return int(priority), int(weight), int(port), _absolute(target, origin)
+    if qtype == types.SOA:
+        mname, rname, serial, *timers = args
+        refresh, retry, expire, minimum = map(_parse_ttl, timers)
+        return (_absolute(mname, origin), _absolute(rname, origin),
+                int(serial), refresh, retry, expire, minimum)
+    if qtype == types.TXT:
+        # character strings are joined as only one is kept in `TXT_RData`
+        return ''.join(args),
+    raise ValueError('Unsupported type: ' + types.get_name(qtype))
+
+
+def parse_zone_file(fd: Union[str, TextIOWrapper],
+                    origin: str = None,
+                    default_ttl: int = 3600):
+    '''Yield records in a master file.
+
+    `$ORIGIN` and `$TTL` are supported, `$INCLUDE` is not. Records without a
+    TTL take the one of `$TTL`, or the last TTL in the file, or
+    `default_ttl`. Only class IN is supported.
+    '''
+    if isinstance(fd, str):
+        with open(os.path.expanduser(fd), 'r', encoding='utf-8-sig') as f:
+            yield from parse_zone_file(f, origin, default_ttl)
+        return
+    origin = None if origin is None else DomainName(origin)
+    owner = None
+    zone_ttl = None
+    last_ttl = None
+    for lineno, blank, tokens in _tokenize(fd):
+        try:
+            first = tokens[0]
+            if not blank and first.startswith('$') and not isinstance(
+                    first, _Quoted):
+                directive = first.upper()
+                if directive == '$ORIGIN':
+                    origin = _absolute(tokens[1], origin)
+                elif directive == '$TTL':
+                    zone_ttl = _parse_ttl(tokens[1])
+                else:
+                    raise ValueError('Unsupported directive: ' + first)
+                continue
+            if not blank:
+                owner = _absolute(tokens.pop(0), origin)
+            elif owner is None:
+                raise ValueError('No owner name')
+            ttl = None
+            while tokens and (_is_ttl(tokens[0])
+                              or tokens[0].upper() in _CLASSES):
+                token = tokens.pop(0)
+                if _is_ttl(token):
+                    ttl = last_ttl = _parse_ttl(token)
+                elif token.upper() != 'IN':
+                    raise ValueError('Unsupported class: ' + token)
+            qtype = types.get_code(tokens.pop(0).upper())
+            if qtype is None:
+                raise ValueError('Unknown type')
+            data = create_rdata(qtype, *_parse_rdata(qtype, tokens, origin))
+        except (IndexError, ValueError, OSError) as e:
+            raise ZoneError('Invalid entry at line %d: %s' % (lineno, e))
+        if ttl is None:
+            ttl = next(t for t in (zone_ttl, last_ttl, default_ttl)
+                       if t is not None)
+        yield Record(name=owner,
+                     qtype=qtype,
+                     ttl=ttl,
+                     data=data)
+
+
+class Zone:
+    '''An authoritative zone in memory.
+
+    Record sets are indexed by name, and so are the names that only exist
+    as parents of other names, so that a question is answered with its
+    records, NODATA, a wildcard expansion (RFC 4592) or NXDOMAIN, with the
+    SOA record in the authority section of negative answers (RFC 2308).
+    Names delegated to other servers are not treated specially.
+    '''
+    def __init__(self, origin: str):
+        self.origin = DomainName(origin)
+        self.soa: Union[Record, None] = None
+        self.data: Dict[DomainName, Dict[int, List[Record]]] = {}
+        # the number of names with records at or below each name
+        self.names: Dict[DomainName, int] = {self.origin: 0}
+        self.count = 0
+
+    def __contains__(self, fqdn: str) -> bool:
+        return DomainName(fqdn).is_subdomain(self.origin)
+
+    def __len__(self):
+        return self.count
+
+    @classmethod
+    def load(cls,
+             fd: Union[str, TextIOWrapper],
+             origin: str = None,
+             default_ttl: int = 3600) -> 'Zone':
+        '''Load a zone from a master file.
+
+        The origin of the zone is the owner of the SOA record, which must be
+        the first record.
+        '''
+        zone = None
+        for record in parse_zone_file(fd, origin, default_ttl):
+            if zone is None:
+                if record.qtype != types.SOA:
+                    raise ZoneError('The first record must be SOA')
+                zone = cls(record.name)
+            zone.add(record)
+        if zone is None:
+            raise ZoneError('No SOA record')
+        return zone
+
+    def _update_names(self, name: DomainName, delta: int):
+        names = self.names
+        while True:
+            count = names.get(name, 0) + delta
+            if count or name == self.origin:
+                names[name] = count
+            else:
+                names.pop(name, None)
+            if name == self.origin:
+                break
+            name = name.parent
+
+    def add(self, record: Record):
+        name = DomainName(record.name)
+        if name not in self:
+            raise ZoneError('%s is out of zone %s' % (name, self.origin))
+        if record.qtype == types.SOA and name != self.origin:
+            raise ZoneError('SOA must be at the origin: ' + name)
+        rrsets = self.data.get(name)
+        if rrsets is None:
+            rrsets = self.data[name] = {}
+            self._update_names(name, 1)
+        if record.qtype == types.SOA:
+            self.count += 1 - len(rrsets.get(types.SOA, ()))
+            self.soa = record
+            rrsets[types.SOA] = [record]
+            return
+        records = rrsets.setdefault(record.qtype, [])
+        if record.data not in (rec.data for rec in records):
+            records.append(record)
+            self.count += 1
+
+    def remove(self, record: Record) -> bool:
+        '''Remove the record with the same name, type and data as `record`,
+        and return whether it is found.'''
+        name = DomainName(record.name)
+        rrsets = self.data.get(name)
+        records = rrsets and rrsets.get(record.qtype)
+        if not records:
+            return False
+        for i, rec in enumerate(records):
+            if rec.data == record.data:
+                break
+        else:
+            return False
+        del records[i]
+        self.count -= 1
+        if not records:
+            del rrsets[record.qtype]
+            if record.qtype == types.SOA:
+                self.soa = None
+            if not rrsets:
+                del self.data[name]
+                self._update_names(name, -1)
+        return True
+
+    def _negative(self) -> List[Record]:
+        if self.soa is None:
+            return []
+        soa = self.soa
+        return [soa.copy(ttl=min(soa.ttl, soa.data.minimum))]
+
+    def query(self, fqdn: str,
+              qtype: int) -> Tuple[int, List[Record], List[Record]]:
+        '''Return the rcode, the answer records and the authority records of
+        a question in the zone.
+
+        The answer of a name with a CNAME record is the CNAME record unless
+        CNAME or ANY is asked, the caller should follow it. Names outside the
+        zone are refused.
+        '''
+        name = DomainName(fqdn)
+        if name not in self:
+            return 5, [], []
+        rrsets = self.data.get(name)
+        if rrsets is None and name not in self.names:
+            encloser = name.parent
+            # stops at the origin at last, which is always in `self.names`
+            while encloser not in self.names:
+                encloser = encloser.parent
+            rrsets = self.data.get(
+                DomainName('*.' + encloser if encloser else '*'))
+            if rrsets is None:
+                return 3, [], self._negative()
+        if rrsets:
+            if qtype == types.ANY:
+                records = [rec for recs in rrsets.values() for rec in recs]
+            else:
+                records = rrsets.get(qtype)
+                if not records and qtype != types.CNAME:
+                    records = rrsets.get(types.CNAME)
+            if records:
+                # zone records never age
+                return 0, [
+                    rec.copy(name=name, ttl=rec.ttl) for rec in records
+                ], []
+        return 0, [], self._negative()
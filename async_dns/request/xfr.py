@@ -0,0 +1,152 @@
+'''
+Zone transfers over TCP, see RFC 5936 (AXFR) and RFC 1995 (IXFR).
+'''
+import asyncio
+import struct
+from typing import List, Union
+
+from async_dns.core import Address, DNSError, DNSMessage, REQUEST, Record, Zone, types
+
+from .util import ConnectionHandle
+
+__all__ = ['iter_transfer', 'transfer_zone']
+
+
+def _serial(record: Record) -> int:
+    return record.data.serial
+
+
+def _is_newer(serial: int, other: int) -> bool:
+    '''Compare serial numbers with wrapping, see RFC 1982.'''
+    return 0 < (serial - other) % (1 << 32) < 1 << 31
+
+
+async def iter_transfer(addr: Address,
+                        origin: str,
+                        qtype: int = types.AXFR,
+                        soa: Record = None,
+                        timeout: float = 10.0):
+    '''Yield the answer records of a zone transfer from `addr`.
+
+    The response may span many messages. They are read and decoded one at a
+    time, so memory does not grow with the size of the zone. `timeout`
+    applies to each message.
+
+    For IXFR, `soa` is the SOA record of the copy to update. The records are
+    yielded as sent, starting and ending with the SOA record of the new
+    version.
+    '''
+    req = DNSMessage(qr=REQUEST, rd=0)
+    req.qd = [Record(REQUEST, origin, qtype)]
+    if qtype == types.IXFR:
+        req.ns = [soa]
+    async with ConnectionHandle(*addr.to_addr(),
+                                ssl=addr.protocol == 'tcps') as conn:
+        reader = conn.reader
+        qdata = req.pack()
+        conn.writer.write(struct.pack('!H', len(qdata)) + qdata)
+        await conn.writer.drain()
+        first = None
+        incremental = False
+        # the number of SOA records after the first one
+        soa_count = 0
+        index = 0
+        while True:
+            size, = struct.unpack(
+                '!H', await asyncio.wait_for(reader.readexactly(2), timeout))
+            data = await asyncio.wait_for(reader.readexactly(size), timeout)
+            msg = DNSMessage.parse(data, lazy=True)
+            if msg.r:
+                raise DNSError(msg.r)
+            for record in msg.an:
+                index += 1
+                yield record
+                is_soa = record.qtype == types.SOA
+                if first is None:
+                    if not is_soa:
+                        raise DNSError(-1, 'Zone transfer must start with SOA')
+                    first = _serial(record)
+                    if qtype == types.IXFR and not _is_newer(
+                            first, _serial(soa)):
+                        # up to date
+                        return
+                    continue
+                if index == 2:
+                    incremental = qtype == types.IXFR and is_soa and _serial(
+                        record) != first
+                if is_soa:
+                    soa_count += 1
+                    # incremental transfers alternate between the old SOA
+                    # before deletions and the new SOA before additions
+                    if _serial(record) == first and (not incremental
+                                                     or soa_count % 2):
+                        return
+
+
+async def transfer_zone(addr: Address,
+                        zone: Union[Zone, str],
+                        timeout: float = 10.0) -> Zone:
+    '''Mirror a zone from the primary server `addr`.
+
+    If `zone` is a domain name, the whole zone is transferred with AXFR into
+    a new `Zone`.
+
+    If `zone` is a `Zone`, it is updated in place with IXFR. Each difference
+    sequence is applied at once when it is received completely, so queries
+    never see a partial version. If the server sends the whole zone
+    instead, the zone is replaced at once when the transfer is complete.
+    '''
+    if isinstance(zone, str):
+        zone = Zone(zone)
+        qtype = types.AXFR
+    else:
+        qtype = types.AXFR if zone.soa is None else types.IXFR
+    records = iter_transfer(addr, zone.origin, qtype, zone.soa, timeout)
+    try:
+        await _transfer(zone, records)
+    finally:
+        await records.aclose()
+    return zone
+
+
+async def _transfer(zone: Zone, records):
+    first = await records.__anext__()
+    second = None
+    async for second in records:
+        break
+    if second is None:
+        # only the SOA record of the current version
+        return
+    if second.qtype != types.SOA or _serial(second) == _serial(first):
+        # the whole zone, the last record is the first SOA record again
+        new_zone = Zone(zone.origin)
+        new_zone.add(first)
+        if second.qtype != types.SOA:
+            new_zone.add(second)
+            async for record in records:
+                if record.qtype != types.SOA:
+                    new_zone.add(record)
+        zone.soa, zone.data, zone.names, zone.count = (new_zone.soa,
+                                                       new_zone.data,
+                                                       new_zone.names,
+                                                       new_zone.count)
+        return
+    if _serial(second) != _serial(zone.soa):
+        raise DNSError(-1, 'IXFR does not start with the current version')
+    # difference sequences: old SOA, deleted records, new SOA, added records
+    deleted: List[Record] = []
+    added: List[Record] = []
+    adding = False
+    async for record in records:
+        if record.qtype != types.SOA:
+            (added if adding else deleted).append(record)
+        elif not adding:
+            adding = True
+            added.append(record)
+        else:
+            for rec in deleted:
+                zone.remove(rec)
+            for rec in added:
+                zone.add(rec)
+            deleted, added = [], []
+            adding = False
@@ -1,18 +1,30 @@
 import asyncio
-from typing import List, Tuple, Union
+import time
+from typing import Awaitable, Callable, Dict, List, Tuple, Union
 
 from async_dns.core import (
     Address,
+    Blocklist,
     CacheNode,
     DNSError,
     DNSMessage,
+    DomainName,
+    HostsDB,
     InvalidHost,
     InvalidIP,
+    NameServers,
+    NegativeCache,
+    REQUEST,
+    Record,
+    SharedCache,
+    Zone,
+    logger,
     types,
 )
 from async_dns.core.record import CNAME_RData, NS_RData
 
 from .client import DNSClient
+from .util import Coalescer, HedgeBudget, RTTStats
 
 A_TYPES = types.A, types.AAAA
 
@@ -20,21 +32,103 @@ A_TYPES = types.A, types.AAAA
 class BaseResolver:
     zone_domains = []
     nameserver_types = [types.A]
+    # Refresh a cached answer in background if it is asked at least
+    # `prefetch_hits` times and its remaining TTL is less than
+    # `prefetch_ratio` of the original TTL.
+    prefetch_ratio = 0.1
+    prefetch_hits = 3
+    # Serve expired records kept by the cache if upstreams do not answer
+    # within `stale_timeout` seconds, with a TTL of `stale_answer_ttl`,
+    # see RFC 8767.
+    stale_timeout = 1.8
+    stale_answer_ttl = 30
+    # Send the question to the next upstream if the pending ones do not
+    # answer within the p90 RTT of the last one, or `hedge_delay` seconds
+    # until there are enough samples, see `hedged_request`. Hedged requests
+    # are limited to `hedge_ratio` of the requests with bursts up to
+    # `hedge_burst`, set both to 0 to disable hedging.
+    hedge_delay = 0.5
+    hedge_min_delay = 0.01
+    hedge_ratio = 0.1
+    hedge_burst = 10
 
     def __init__(self,
-                 cache: CacheNode = None,
+                 cache: Union[CacheNode, SharedCache] = None,
                  query_timeout: float = 3.0,
-                 request_timeout: float = 5.0):
-        self._queries = {}
+                 request_timeout: float = 5.0,
+                 negative_cache: NegativeCache = None,
+                 blocklist: Blocklist = None,
+                 hosts_db: HostsDB = None):
         self.cache = cache or CacheNode()
+        self.negative_cache = negative_cache or NegativeCache()
+        self.blocklist = blocklist
+        self.hosts_db = hosts_db
+        self.zones: Dict[DomainName, Zone] = {}
         self.request_timeout = request_timeout
         self.query_timeout = query_timeout
         self.client = DNSClient(request_timeout)
+        # shares in-flight queries of this resolver, see `coalesce`
+        self.coalescer = Coalescer()
+        self.rtt = RTTStats()
+        self.hedge_budget = HedgeBudget(self.hedge_ratio, self.hedge_burst)
+        # called with `(fqdn, qtype)` when cached answers are invalidated or
+        # refreshed, e.g. `async_dns.server.ResponseCache.invalidate`
+        self.invalidation_callbacks: List[Callable[[str, int], None]] = []
+        # an object with `publish_message` and `publish_invalidation` to
+        # replicate cache updates, e.g. `async_dns.server.CacheReplicator`
+        self.replicator = None
 
-    def cache_message(self, msg: DNSMessage):
+    def cache_message(self, msg: DNSMessage, replicate: bool = True):
+        '''Cache the records of a fresh response, and invalidate the answers
+        built from older ones, e.g. stale answers in a response cache.
+        '''
         for rec in msg.an + msg.ns + msg.ar:
-            if rec.ttl > 0 and rec.qtype not in (types.SOA, ):
+            if rec.ttl > 0 and rec.qtype not in (types.SOA, types.OPT):
                 self.cache.add(record=rec)
+        self._cache_negative(msg)
+        if self.invalidation_callbacks:
+            for name in {rec.name for rec in msg.qd + msg.an}:
+                for callback in self.invalidation_callbacks:
+                    callback(name, types.ANY)
+        if replicate and self.replicator is not None:
+            self.replicator.publish_message(msg)
+
+    def invalidate(self,
+                   fqdn: str,
+                   qtype: int = types.ANY,
+                   replicate: bool = True):
+        '''Remove cached answers of `fqdn`, including negative ones.'''
+        self.cache.remove(fqdn, qtype)
+        self.negative_cache.remove(fqdn,
+                                   None if qtype == types.ANY else qtype)
+        for callback in self.invalidation_callbacks:
+            callback(fqdn, qtype)
+        if replicate and self.replicator is not None:
+            self.replicator.publish_invalidation(fqdn, qtype)
+
+    def _cache_negative(self, msg: DNSMessage):
+        '''Cache NXDOMAIN and NODATA answers with an SOA record in the
+        authority section, see RFC 2308.
+        '''
+        if not msg.qd or msg.r not in (0, 3):
+            return
+        for soa in msg.ns:
+            if soa.qtype == types.SOA:
+                break
+        else:
+            return
+        question = msg.qd[0]
+        name, qtype = question.name, question.qtype
+        if qtype != types.CNAME:
+            # the answer is negative for the last name in the CNAME chain
+            for rec in msg.an:
+                if rec.name == name and isinstance(rec.data, CNAME_RData):
+                    name = rec.data.data
+        if msg.r == 3:
+            self.negative_cache.add(name, qtype, 3, soa)
+        elif qtype != types.ANY and not any(
+                rec.name == name and rec.qtype == qtype for rec in msg.an):
+            self.negative_cache.add(name, qtype, 0, soa)
 
     def set_zone_domains(self, domains: List[str]):
         '''Set zone domains for the resolver.
@@ -44,14 +138,58 @@ class BaseResolver:
         '''
         self.zone_domains = [domain.lstrip('.') for domain in domains]
 
-    async def _query(self, _fqdn: str, _qtype: int) -> Tuple[DNSMessage, bool]:
+    def add_zone(self, zone: Zone):
+        '''Answer questions in `zone` locally as its authoritative server.
+
+        If zones are nested, the most specific one answers.
+        '''
+        self.zones[zone.origin] = zone
+
+    def remove_zone(self, origin: str):
+        self.zones.pop(DomainName(origin), None)
+
+    def _get_zone(self, fqdn: str) -> Union[Zone, None]:
+        if not self.zones:
+            return None
+        name = DomainName(fqdn)
+        while True:
+            zone = self.zones.get(name)
+            if zone is not None or not name:
+                return zone
+            name = name.parent
+
+    def _add_zone_records(self, msg: DNSMessage, zone: Zone, fqdn: str,
+                          qtype: int) -> Union[str, None]:
+        '''Add the answer of a local zone to msg, and return the target of a
+        CNAME record to follow.
+        '''
+        rcode, answers, authority = zone.query(fqdn, qtype)
+        if (len(answers) == 1 and answers[0].qtype == types.CNAME
+                and qtype not in (types.CNAME, types.ANY)):
+            msg.an.append(answers[0])
+            return answers[0].data.data
+        msg.aa = 1
+        msg.r = rcode
+        msg.an.extend(answers)
+        msg.ns.extend(authority)
+
+    async def _query(self,
+                     _fqdn: str,
+                     _qtype: int,
+                     refresh: bool = False,
+                     timeout: float = None) -> Tuple[DNSMessage, bool]:
+        '''Resolve a question, skipping the cached answer if `refresh` is
+        true.
+
+        Queries of the same question are shared, and `timeout` only limits the
+        wait of this caller, see `coalesce`.
+        '''
         raise NotImplementedError
 
     async def query(self,
                     fqdn: str,
                     qtype=types.ANY) -> Tuple[DNSMessage, bool]:
-        if fqdn.endswith('.'):
-            fqdn = fqdn[:-1]
+        fqdn = DomainName(fqdn)
         if qtype == types.ANY:
             try:
                 addr = Address.parse(fqdn)
@@ -59,38 +197,196 @@ class BaseResolver:
             except (InvalidHost, InvalidIP):
                 pass
             else:
-                fqdn = ptr_name
+                fqdn = DomainName(ptr_name)
                 qtype = types.PTR
-        return await asyncio.wait_for(self._query(fqdn, qtype),
-                                      self.query_timeout)
+        query = self._query(fqdn, qtype, timeout=self.query_timeout)
+        if self.cache.stale_ttl <= 0:
+            res, from_cache = await query
+        else:
+            future = asyncio.ensure_future(query)
+            try:
+                res, from_cache = await asyncio.wait_for(
+                    asyncio.shield(future), self.stale_timeout)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                res = self.query_stale(fqdn, qtype)
+                if res is None:
+                    if future.done():
+                        raise
+                    res, from_cache = await future
+                else:
+                    # keep resolving in background to refresh the cache
+                    future.add_done_callback(
+                        lambda f: f.cancelled() or f.exception())
+                    return res, True
+        if from_cache and qtype != types.ANY:
+            self.check_prefetch(fqdn, qtype, res)
+        return res, from_cache
+
+    def query_stale(self, fqdn: str, qtype: int) -> Union[DNSMessage, None]:
+        '''Build an answer from the cache including expired records in the
+        stale window, or return None if nothing is found.
+        '''
+        msg = DNSMessage()
+        msg.qd.append(Record(REQUEST, name=fqdn, qtype=qtype))
+        has_result, _ = self.query_cache(msg, fqdn, qtype, True)
+        if not has_result:
+            return
+        now = int(time.time())
+        for section in (msg.an, msg.ns, msg.ar):
+            for i, rec in enumerate(section):
+                if rec.ttl >= 0 and rec.get_ttl(now) <= 0:
+                    section[i] = rec.copy(ttl=self.stale_answer_ttl)
+        logger.debug('[query_stale][%s][%s] serve stale records',
+                      types.get_name(qtype), fqdn)
+        return msg
+
+    def check_prefetch(self, fqdn: str, qtype: int, msg: DNSMessage):
+        '''Count a hit of a cached answer, and refresh it in background if it
+        is popular and about to expire.
+        '''
+        self.cache.hit(fqdn, qtype)
+        if self.prefetch_ratio <= 0:
+            return
+        now = int(time.time())
+        if not any(rec.ttl > 0
+                   and rec.get_ttl(now) <= rec.ttl * self.prefetch_ratio
+                   for rec in msg.an):
+            return
+        if self.cache.pop_hits(fqdn, qtype) >= self.prefetch_hits:
+            self.prefetch(fqdn, qtype)
+
+    def prefetch(self, fqdn: str, qtype: int) -> asyncio.Future:
+        '''Refresh the answer of a question in background.'''
+        future = asyncio.ensure_future(
+            self._query(fqdn, qtype, refresh=True,
+                        timeout=self.query_timeout))
+
+        def on_done(future):
+            if not future.cancelled() and future.exception() is not None:
+                logger.debug('[prefetch][%s][%s] %s', types.get_name(qtype),
+                             fqdn, future.exception())
+
+        future.add_done_callback(on_done)
+        return future
 
     async def request(self, fqdn: str, qtype: int, addr: Address):
         '''Query remote records with the DNS client.
         '''
         result = await self.client.query(fqdn, qtype, addr)
-        if result.qd[0].name != fqdn:
+        if result.qd[0].name != DomainName(fqdn):
             raise DNSError(-1, 'Question section mismatch')
         assert result.r != 2, 'Remote server fail'
-        self.cache_message(result)
         return result
 
-    def _add_cache_cname(self, msg: DNSMessage, fqdn: str) -> Union[str, None]:
+    def _hedge_delay(self, addr: Address) -> float:
+        delay = self.rtt.percentile(addr)
+        if delay is None:
+            delay = self.hedge_delay
+        return max(self.hedge_min_delay, delay)
+
+    async def hedged_request(
+            self, nameservers: NameServers,
+            request: Callable[[Address], Awaitable[DNSMessage]]) -> DNSMessage:
+        '''Return the first valid response of `request(addr)` for the
+        addresses of `nameservers`.
+
+        The next address is tried when all pending requests fail, or, within
+        the hedge budget, when they are slower than the hedge delay. The
+        other requests are cancelled once a response is returned, and their
+        elapsed time is recorded as a lower bound of their round-trip time, so
+        a slow upstream that always loses still raises its hedge delay.
+        '''
+        loop = asyncio.get_event_loop()
+        addrs = nameservers.iter()
+        pending: Dict[asyncio.Future, Tuple[Address, float]] = {}
+        deadline = None
+        last_err = None
+
+        def start(addr: Address):
+            nonlocal deadline
+            now = loop.time()
+            pending[asyncio.ensure_future(request(addr))] = addr, now
+            deadline = now + self._hedge_delay(addr)
+
+        start(next(addrs))
+        self.hedge_budget.request()
+        following = next(addrs, None)
+        try:
+            while pending:
+                timeout = None
+                if following is not None and deadline is not None:
+                    timeout = max(0, deadline - loop.time())
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if self.hedge_budget.take():
+                        logger.debug('[BaseResolver.hedged_request] %s',
+                                     following)
+                        start(following)
+                        following = next(addrs, None)
+                    else:
+                        # wait for the pending requests without hedging
+                        deadline = None
+                    continue
+                for task in done:
+                    addr, started = pending.pop(task)
+                    if not task.cancelled() and task.exception() is None:
+                        nameservers.success(addr)
+                        self.rtt.add(addr, loop.time() - started)
+                        return task.result()
+                    nameservers.fail(addr)
+                    if not task.cancelled():
+                        last_err = task.exception()
+                if not pending and following is not None:
+                    start(following)
+                    following = next(addrs, None)
+        finally:
+            now = loop.time()
+            for task, (addr, started) in pending.items():
+                task.cancel()
+                self.rtt.add(addr, now - started)
+        raise last_err or Exception('Unknown error')
+
+    def _query_records(self,
+                       fqdn: str,
+                       qtype: Union[int, Tuple[int, ...]],
+                       stale: bool = False):
+        '''Query the records in `hosts_db`, or the cache if there are none.
+        '''
+        if self.hosts_db is not None:
+            records = list(self.hosts_db.query(fqdn, qtype))
+            if records:
+                return records
+        return self.cache.query(fqdn, qtype, stale)
+
+    def _add_cache_cname(self,
+                         msg: DNSMessage,
+                         fqdn: str,
+                         stale: bool = False) -> Union[str, None]:
         '''Query cache for CNAME records and add to result msg.
         '''
-        for cname in self.cache.query(fqdn, types.CNAME):
+        for cname in self._query_records(fqdn, types.CNAME, stale):
             msg.an.append(cname.copy(name=fqdn))
             if isinstance(cname.data, CNAME_RData):
                 return cname.data.data
 
-    def _add_cache_qtype(self, msg: DNSMessage, fqdn: str, qtype: int) -> bool:
+    def _add_cache_qtype(self,
+                         msg: DNSMessage,
+                         fqdn: str,
+                         qtype: int,
+                         stale: bool = False) -> bool:
         '''Query cache for records other than CNAME and add to result msg.
         '''
         if qtype == types.CNAME:
             return False
         has_result = False
-        for rec in self.cache.query(fqdn, qtype):
+        for rec in self._query_records(fqdn, qtype, stale):
             if isinstance(rec.data, NS_RData):
-                a_res = list(self.cache.query(rec.data.data, A_TYPES))
+                a_res = list(
+                    self._query_records(rec.data.data, A_TYPES, stale))
                 if a_res:
                     msg.ar.extend(a_res)
                     msg.ns.append(rec)
@@ -100,10 +396,28 @@ class BaseResolver:
                 has_result = True
         return has_result
 
-    def query_cache(self, msg: DNSMessage, fqdn: str, qtype: int):
+    def query_cache(self,
+                    msg: DNSMessage,
+                    fqdn: str,
+                    qtype: int,
+                    stale: bool = False):
+        if self.blocklist is not None:
+            action = self.blocklist.match(fqdn)
+            if action is not None and action != Blocklist.ALLOW:
+                if action == Blocklist.NXDOMAIN:
+                    msg.r = 3
+                else:
+                    msg.an.extend(self.blocklist.answer(fqdn, qtype, action))
+                return True, fqdn
         cnames = set()
         while True:
-            cname = self._add_cache_cname(msg, fqdn)
+            zone = self._get_zone(fqdn)
+            if zone is None:
+                cname = self._add_cache_cname(msg, fqdn, stale)
+            else:
+                cname = self._add_zone_records(msg, zone, fqdn, qtype)
+                if cname is None:
+                    return True, fqdn
             if not cname: break
             if cname in cnames:
                 # CNAME cycle detected
@@ -113,7 +427,14 @@ class BaseResolver:
             fqdn = cname
         has_result = bool(cname) and qtype in (types.CNAME, types.ANY)
         if qtype != types.CNAME:
-            has_result = self._add_cache_qtype(msg, fqdn, qtype) or has_result
+            has_result = self._add_cache_qtype(msg, fqdn, qtype,
+                                               stale) or has_result
+        if not has_result:
+            negative = self.negative_cache.get(fqdn, qtype)
+            if negative is not None:
+                msg.r, soa = negative
+                msg.ns.append(soa)
+                has_result = True
         if any(('.' + fqdn).endswith(root) for root in self.zone_domains):
             if not has_result:
                 msg.r = 3
@@ -1,8 +1,12 @@
 import asyncio
+from collections import OrderedDict
+import time
 
-from async_dns.core import Address, DNSMessage, REQUEST, Record, logger, types
+from async_dns.core import Address, DNSMessage, EDNS_UDP_SIZE, REQUEST, Record, logger, types
 from async_dns.request import doh, tcp, udp
 
+from .util import Coalescer
+
 
 class DNSClient:
     '''
@@ -16,27 +20,42 @@ class DNSClient:
         'https': doh.request,
     }
 
-    def __init__(self, timeout=5.0):
-        self.request_cache = {}
+    # how long to remember that a question needs TCP, in seconds
+    tcp_hint_ttl = 600
+    tcp_hint_size = 10000
+
+    def __init__(self, timeout=5.0, edns_size=EDNS_UDP_SIZE):
+        # shares in-flight requests of the same question to the same server
+        self.coalescer = Coalescer()
         self.timeout = timeout
+        # UDP payload size advertised with EDNS(0), None to disable EDNS
+        self.edns_size = edns_size
+        # (addr, fqdn, qtype) -> expiry, for questions truncated over UDP
+        self.tcp_hints = OrderedDict()
 
-    async def query(self, fqdn: str, qtype: int, addr: Address) -> DNSMessage:
+    async def query(self,
+                    fqdn: str,
+                    qtype: int,
+                    addr: Address,
+                    timeout: float = None) -> DNSMessage:
         '''
         Query a name from a remote name server.
 
         It is guarenteed a query will only be sent once before it gets a response or timeout error.
+
+        If `timeout` is provided, this caller gives up after `timeout` seconds
+        with `asyncio.TimeoutError`, while the request keeps running for other
+        callers until `self.timeout`.
         '''
-        key = fqdn, qtype, addr
-        task = self.request_cache.get(key)
-        if task is None:
-            task = asyncio.ensure_future(self._query(fqdn, qtype, addr))
-            task.add_done_callback(lambda _: self.request_cache.pop(key, None))
-            self.request_cache[key] = task
-        return await task
+        return await self.coalescer.run((fqdn, qtype, addr),
+                                        lambda: self._query(fqdn, qtype, addr),
+                                        timeout)
 
     async def _query(self, fqdn: str, qtype: int, addr: Address):
         req = DNSMessage(qr=REQUEST)
         req.qd.append(Record(REQUEST, fqdn, qtype))
+        if self.edns_size:
+            req.set_edns(self.edns_size)
         logger.debug('[DNSClient:query][%s][%s] %s', types.get_name(qtype),
                      fqdn, addr)
         res = await asyncio.wait_for(self._request(req, addr), self.timeout)
@@ -46,11 +65,47 @@ class DNSClient:
         '''Return response to a request.
 
         Send DNS request data with `protocol`.
+
+        If a UDP response is truncated, the request is sent again over TCP to
+        the same server, and later requests of the same question will be sent
+        over TCP directly for a while.
         '''
-        request = self.protocols[addr.protocol]
+        if addr.protocol != 'udp':
+            request = self.protocols[addr.protocol]
+            return await request(req, addr, self.timeout)
+        question = req.qd[0]
+        key = addr, question.name, question.qtype
+        if self._needs_tcp(key):
+            return await self._request_tcp(req, addr)
+        request = self.protocols['udp']
         data = await request(req, addr, self.timeout)
+        if data.tc:
+            logger.debug('[DNSClient:truncated][%s][%s] %s',
+                         types.get_name(question.qtype), question.name, addr)
+            self._set_tcp_hint(key)
+            data = await self._request_tcp(req, addr)
         return data
 
+    def _request_tcp(self, req, addr):
+        addr = addr.copy()
+        addr.protocol = 'tcp'
+        return self.protocols['tcp'](req, addr, self.timeout)
+
+    def _needs_tcp(self, key) -> bool:
+        expires = self.tcp_hints.get(key)
+        if expires is None:
+            return False
+        if expires < time.time():
+            self.tcp_hints.pop(key, None)
+            return False
+        return True
+
+    def _set_tcp_hint(self, key):
+        self.tcp_hints[key] = time.time() + self.tcp_hint_ttl
+        self.tcp_hints.move_to_end(key)
+        while len(self.tcp_hints) > self.tcp_hint_size:
+            self.tcp_hints.popitem(last=False)
+
 
 if __name__ == '__main__':
 
@@ -1,7 +1,13 @@
 import asyncio
+from io import TextIOWrapper
+import os
+from typing import Union
 
 from async_dns.core import (
+    Address,
     DNSMessage,
+    InvalidHost,
+    InvalidIP,
     NameServers,
     REQUEST,
     Record,
@@ -11,7 +17,16 @@ from async_dns.core import (
 )
 
 from .base_resolver import BaseResolver
-from .util import Memoizer
+from .routing import RoutingTable
+from .util import coalesce
+
+
+def _is_nameserver(value: str) -> bool:
+    try:
+        Address.parse(value)
+    except (InvalidHost, InvalidIP, ValueError):
+        return False
+    return True
 
 
 class ProxyResolver(BaseResolver):
@@ -21,29 +36,16 @@ class ProxyResolver(BaseResolver):
     '''
     name = 'ProxyResolver'
     default_nameservers = core_config['default_nameservers']
-    memoizer = Memoizer()
 
     def __init__(self, *k, proxies=None, **kw):
         super().__init__(*k, **kw)
         self.set_proxies(proxies or self.default_nameservers)
 
     def _get_nameservers(self, fqdn):
+        nameservers = self.routes.get(fqdn)
         logger.debug('[ProxyResolver._get_nameservers][%s] %s', fqdn,
-                     self.ns_pairs)
-        for test, ns in self.ns_pairs:
-            if test is None or test(fqdn): break
-        else:
-            ns = []
-        return NameServers(ns)
-
-    @staticmethod
-    def build_tester(rule):
-        if rule is None or callable(rule): return rule
-        assert isinstance(rule, str)
-        if rule.startswith('*.'):
-            suffix = rule[1:]
-            return lambda d: d.endswith(suffix)
-        return lambda d: d == rule
+                     nameservers)
+        return nameservers
 
     def set_proxies(self, proxies):
         '''Set proxy servers.
@@ -52,6 +54,10 @@ class ProxyResolver(BaseResolver):
         - (test, nameserver_list)
         - nameserver
 
+        A test is a domain name, a suffix like `*.lan` matching the
+        subdomains of `lan`, a callable or None for the fallback. The most
+        specific name or suffix wins, then callables are tried in order.
+
         Examples:
         [
             ('*.lan', ['tcp://192.168.1.1:53']),
@@ -60,8 +66,10 @@ class ProxyResolver(BaseResolver):
             '8.8.8.8', # equivalent to (None, ['udp://8.8.8.8'])
         ]
         '''
-        ns_pairs = []
+        rules = []
         fallback = []
+        # rules with the same nameservers share the failure statistics
+        shared = {}
         if proxies:
             for item in proxies:
                 if isinstance(item, str):
@@ -71,36 +79,64 @@ class ProxyResolver(BaseResolver):
                 if test is None:
                     fallback.extend(ns)
                     continue
-                ns_pairs.append((self.build_tester(test), NameServers(ns)))
-        if fallback:
-            ns_pairs.append((None, NameServers(fallback)))
-        self.ns_pairs = ns_pairs
+                key = tuple(map(str, ns))
+                nameservers = shared.get(key)
+                if nameservers is None:
+                    nameservers = shared[key] = NameServers(ns)
+                rules.append((test, nameservers))
+        routes = RoutingTable(NameServers(fallback))
+        routes.update(rules)
+        # replaced at once so that queries never see a partial table
+        self.routes = routes
 
-    @memoizer.memoize_async(lambda _, fqdn, qtype: (fqdn, qtype))
-    async def _query(self, fqdn: str, qtype: int):
+    @staticmethod
+    def load_proxies(fd: Union[str, TextIOWrapper]) -> list:
+        '''Load proxies for `set_proxies` from a file.
+
+        Each line is a rule followed by nameservers, or nameservers to use
+        when no rule matches. `#` starts a comment.
+
+        Examples:
+            *.lan tcp://192.168.1.1:53
+            8.8.8.8 udp://8.8.4.4
+        '''
+        if isinstance(fd, str):
+            with open(os.path.expanduser(fd), 'r', encoding='utf-8-sig') as f:
+                return ProxyResolver.load_proxies(f)
+        proxies = []
+        for line in fd:
+            items = line.split('#', 1)[0].split()
+            if not items:
+                continue
+            if len(items) > 1 and not _is_nameserver(items[0]):
+                proxies.append((items[0], items[1:]))
+            else:
+                proxies.extend(items)
+        return proxies
+
+    @coalesce(lambda _, fqdn, qtype, refresh=False: (fqdn, qtype, refresh))
+    async def _query(self, fqdn: str, qtype: int, refresh: bool = False):
         msg = DNSMessage()
         msg.qd.append(Record(REQUEST, name=fqdn, qtype=qtype))
 
-        has_result, fqdn = self.query_cache(msg, fqdn, qtype)
+        if refresh:
+            has_result = False
+        else:
+            has_result, fqdn = self.query_cache(msg, fqdn, qtype)
         from_cache = has_result
 
-        while not has_result:
-            nameservers = self._get_nameservers(fqdn)
-            for addr in nameservers.iter():
-                try:
-                    res = await self.request(fqdn, qtype, addr)
-                    assert res.ra, 'The upstream name server must be in recursive mode'
-                    assert res.r != 2, 'Remote server failed'
-                except:
-                    nameservers.fail(addr)
-                    raise
-                else:
-                    nameservers.success(addr)
-                    self.cache_message(res)
-                    msg.an.extend(res.an)
-                    has_result = True
-                    # has_result, fqdn = self.query_cache(msg, fqdn, qtype)
-                    break
+        async def request(addr):
+            res = await self.request(fqdn, qtype, addr)
+            assert res.ra, 'The upstream name server must be in recursive mode'
+            return res
+
+        if not has_result:
+            res = await self.hedged_request(self._get_nameservers(fqdn),
+                                            request)
+            self.cache_message(res)
+            msg.r = res.r
+            msg.an.extend(res.an)
+            msg.ns.extend(rec for rec in res.ns if rec.qtype == types.SOA)
         return msg, from_cache
 
 
@@ -3,7 +3,6 @@ from typing import Tuple
 
 from async_dns.core import (
     Address,
-    DNSError,
     DNSMessage,
     NameServers,
     REQUEST,
@@ -15,7 +14,7 @@ from async_dns.core import (
 from async_dns.core.record import CNAME_RData, NS_RData, SOA_RData
 
 from .base_resolver import BaseResolver
-from .util import Memoizer
+from .util import coalesce
 
 
 class RecursiveResolver(BaseResolver):
@@ -24,7 +23,6 @@ class RecursiveResolver(BaseResolver):
     Resolve hostnames recursively from upstream name servers.
     '''
     name = 'RecursiveResolver'
-    memoizer = Memoizer()
 
     def __init__(self, *k, max_tick=5, **kw):
         super().__init__(*k, **kw)
@@ -32,8 +30,16 @@ class RecursiveResolver(BaseResolver):
         for rec in get_root_servers():
             self.cache.add(record=rec)
 
-    async def _query(self, fqdn: str, qtype: int):
-        return await self._query_tick(fqdn, qtype, self.max_tick)
+    async def _query(self,
+                     fqdn: str,
+                     qtype: int,
+                     refresh: bool = False,
+                     timeout: float = None):
+        return await self._query_tick(fqdn,
+                                      qtype,
+                                      self.max_tick,
+                                      refresh,
+                                      timeout=timeout)
 
     def _get_nameservers(self, fqdn: str):
         '''Return a generator of parent domains'''
@@ -57,45 +63,42 @@ class RecursiveResolver(BaseResolver):
                      hosts)
         return NameServers(hosts)
 
-    @memoizer.memoize_async(lambda _, fqdn, qtype, _tick: (fqdn, qtype))
-    async def _query_tick(self, fqdn: str, qtype: int,
-                          tick: int) -> Tuple[DNSMessage, bool]:
+    @coalesce(lambda _, fqdn, qtype, _tick, refresh=False:
+              (fqdn, qtype, refresh))
+    async def _query_tick(self,
+                          fqdn: str,
+                          qtype: int,
+                          tick: int,
+                          refresh: bool = False) -> Tuple[DNSMessage, bool]:
         msg = DNSMessage()
         msg.qd.append(Record(REQUEST, name=fqdn, qtype=qtype))
 
-        has_result, fqdn = self.query_cache(msg, fqdn, qtype)
+        if refresh:
+            has_result = False
+        else:
+            has_result, fqdn = self.query_cache(msg, fqdn, qtype)
         from_cache = has_result
 
-        last_err = None
         nameservers = self._get_nameservers(fqdn)
         while not has_result and tick > 0:
             tick -= 1
-            for addr in nameservers.iter():
-                try:
-                    has_result, fqdn, nsips = await self._query_remote(
-                        msg, fqdn, qtype, addr, tick)
-                    nameservers = NameServers(nsips)
-                except Exception as err:
-                    last_err = err
-                else:
-                    break
-            else:
-                raise last_err or Exception('Unknown error')
+            res = await self.hedged_request(
+                nameservers, lambda addr: self.request(fqdn, qtype, addr))
+            has_result, fqdn, nsips = await self._handle_response(
+                msg, fqdn, qtype, res, tick)
+            nameservers = NameServers(nsips)
 
         assert has_result, 'Maximum nested query times exceeded'
         return msg, from_cache
 
-    async def _query_remote(self, msg: DNSMessage, fqdn: str, qtype: int,
-                            addr: Address, tick: int):
-        res = await self.request(fqdn, qtype, addr)
-        if res.qd[0].name != fqdn:
-            raise DNSError(-1, 'Question section mismatch')
-        assert res.r != 2, 'Remote server fail'
+    async def _handle_response(self, msg: DNSMessage, fqdn: str, qtype: int,
+                               res: DNSMessage, tick: int):
         self.cache_message(res)
 
         has_cname = False
         has_result = False
         has_ns = False
+        soa = None
 
         for rec in res.an:
             msg.an.append(rec)
@@ -105,12 +108,19 @@ class RecursiveResolver(BaseResolver):
             if rec.qtype != types.CNAME or qtype in (types.CNAME, types.ANY):
                 has_result = True
         for rec in res.ns:
-            if rec.qtype == types.SOA or qtype == types.NS:
+            if rec.qtype == types.SOA:
+                soa = rec
+                has_result = True
+            elif qtype == types.NS:
                 has_result = True
             else:
                 has_ns = True
 
-        if not has_cname and not has_ns:
+        if soa is not None and res.r in (0, 3):
+            # NXDOMAIN or NODATA, RFC 2308
+            msg.r = res.r
+            msg.ns.append(soa)
+        elif not has_cname and not has_ns:
             # Not found, return server fail since we are not authorative
             msg.r = 2
             has_result = True
@@ -0,0 +1,91 @@
+'''
+Routing of questions to upstream name servers by domain name rules.
+'''
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+
+from async_dns.core import DomainName
+
+__all__ = ['RoutingTable']
+
+
+class _Node:
+    __slots__ = ('children', 'exact', 'suffix')
+
+    def __init__(self):
+        self.children: Dict[str, '_Node'] = {}
+        # values of the rules `name` and `*.name`
+        self.exact = None
+        self.suffix = None
+
+
+class RoutingTable:
+    '''Map domain names to values by rules.
+
+    A rule is a name like `example.com`, a suffix like `*.example.com` which
+    matches the subdomains of `example.com`, or a callable that takes a name
+    and returns whether it matches.
+
+    Name and suffix rules are stored in a trie of labels from the top level
+    down, so the longest match is found in one walk along the labels of a
+    name, whatever the number of rules. An exact name wins over a suffix.
+    Callable rules are tried in order only if no name or suffix rule
+    matches, and `default` is returned if nothing matches.
+    '''
+    def __init__(self, default: Any = None):
+        self.root = _Node()
+        self.callables: List[Tuple[Callable[[str], bool], Any]] = []
+        self.default = default
+        self.size = 0
+
+    def __len__(self):
+        return self.size + len(self.callables)
+
+    def add(self, rule: Union[str, Callable[[str], bool]], value: Any):
+        '''Add a rule, replacing the value of the same name or suffix rule.
+        '''
+        if callable(rule):
+            self.callables.append((rule, value))
+            return
+        suffix = rule.startswith('*.')
+        if suffix:
+            rule = rule[2:]
+        node = self.root
+        for label in reversed(DomainName(rule).labels):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = _Node()
+            node = child
+        if suffix:
+            if node.suffix is None:
+                self.size += 1
+            node.suffix = value
+        else:
+            if node.exact is None:
+                self.size += 1
+            node.exact = value
+
+    def update(self, rules: Iterable[Tuple[Union[str, Callable[[str], bool]],
+                                           Any]]):
+        '''Add rules in bulk from `(rule, value)` pairs.'''
+        for rule, value in rules:
+            self.add(rule, value)
+
+    def get(self, fqdn: str) -> Any:
+        '''Return the value of the most specific rule matching `fqdn`.'''
+        name = DomainName(fqdn)
+        node = self.root
+        match = None
+        for label in reversed(name.labels):
+            if node.suffix is not None:
+                match = node.suffix
+            node = node.children.get(label)
+            if node is None:
+                break
+        else:
+            match = node.exact if node.exact is not None else match
+        if match is not None:
+            return match
+        for test, value in self.callables:
+            if test(name):
+                return value
+        return self.default
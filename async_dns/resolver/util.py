@@ -1,27 +1,153 @@
 import asyncio
+from collections import OrderedDict, deque
+import functools
+from typing import Awaitable, Callable, Dict, Hashable, Union
 
 
-class Memoizer:
+class Coalescer:
+    '''Share in-flight work between callers with the same key.
+
+    The first caller of a key starts the work in a task, and later callers
+    wait for the same task until it is done. Each caller waits through
+    `asyncio.shield`, so a caller cancelled, e.g. by `asyncio.wait_for`,
+    never cancels the work for the others. The work is cancelled when all
+    its callers are gone.
+    '''
     def __init__(self):
-        self.data = {}
+        self.tasks: Dict[Hashable, asyncio.Future] = {}
+        self.waiters: Dict[Hashable, int] = {}
+        # number of tasks started and of calls that joined a running task
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self.tasks)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'started': self.started,
+            'coalesced': self.coalesced,
+            'in_flight': len(self.tasks),
+        }
+
+    def _on_done(self, key: Hashable, task: asyncio.Future):
+        if self.tasks.get(key) is task:
+            del self.tasks[key]
+            del self.waiters[key]
+        if not task.cancelled():
+            # retrieve the exception in case all callers are gone
+            task.exception()
+
+    async def run(self,
+                  key: Hashable,
+                  factory: Callable[[], Awaitable],
+                  timeout: float = None):
+        '''Return the result of `factory()`, or of the running task with the
+        same key.
+
+        If `timeout` is provided, this caller gives up after `timeout`
+        seconds with `asyncio.TimeoutError`, without affecting the others.
+        '''
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.tasks[key] = task
+            self.waiters[key] = 0
+            task.add_done_callback(functools.partial(self._on_done, key))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        self.waiters[key] += 1
+        try:
+            if timeout is None:
+                return await asyncio.shield(task)
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        finally:
+            if self.tasks.get(key) is task:
+                self.waiters[key] -= 1
+                if not self.waiters[key]:
+                    # later callers must not join the cancelled task
+                    del self.tasks[key]
+                    del self.waiters[key]
+                    task.cancel()
+
+
+class RTTStats:
+    '''Keep the recent round-trip times of each upstream.
+
+    The last `window` samples are kept for each of the last `size` upstreams
+    seen.
+    '''
+    def __init__(self, window: int = 64, size: int = 10000):
+        self.window = window
+        self.size = size
+        self.samples: Dict[Hashable, deque] = OrderedDict()
+
+    def add(self, key: Hashable, rtt: float):
+        samples = self.samples.get(key)
+        if samples is None:
+            samples = self.samples[key] = deque(maxlen=self.window)
+            while len(self.samples) > self.size:
+                self.samples.popitem(last=False)
+        else:
+            self.samples.move_to_end(key)
+        samples.append(rtt)
+
+    def percentile(self,
+                   key: Hashable,
+                   p: float = 0.9,
+                   min_samples: int = 5) -> Union[float, None]:
+        '''Return the `p` percentile of the round-trip times of `key`, or
+        None if there are less than `min_samples` samples.'''
+        samples = self.samples.get(key)
+        if samples is None or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+class HedgeBudget:
+    '''Limit hedged requests to `ratio` of the requests.
+
+    Each request earns `ratio` token and each hedged request spends one, with
+    at most `burst` tokens saved, so idle periods do not allow a flood.
+    '''
+    def __init__(self, ratio: float = 0.1, burst: float = 10):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.requests = 0
+        self.hedged = 0
+
+    def request(self):
+        self.requests += 1
+        self.tokens = min(self.burst, self.tokens + self.ratio)
 
-    def memoize_async(self, key=None):
-        data = self.data
+    def take(self) -> bool:
+        '''Return whether a hedged request is allowed, and spend a token if
+        it is.'''
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        self.hedged += 1
+        return True
 
-        def wrapper(fn):
-            async def wrapped(*k, **kw):
-                key_str = '' if key is None else key(*k, **kw)
-                future = data.get(key_str)
-                if future is None:
-                    future = asyncio.ensure_future(fn(*k, **kw))
-                    data[key_str] = future
 
-                    def clear(_):
-                        data.pop(key_str, None)
+def coalesce(key: Callable[..., Hashable]):
+    '''Share in-flight calls of an async method with the same key through
+    `self.coalescer`.
 
-                    future.add_done_callback(clear)
-                return await future
+    `key` is called with the arguments of the method, including `self`. The
+    wrapped method takes an extra keyword argument `timeout`, passed to
+    `Coalescer.run` to limit the wait of this caller only.
+    '''
+    def wrapper(fn):
+        @functools.wraps(fn)
+        async def wrapped(self, *k, timeout: float = None, **kw):
+            return await self.coalescer.run(key(self, *k, **kw),
+                                            lambda: fn(self, *k, **kw),
+                                            timeout)
 
-            return wrapped
+        return wrapped
 
-        return wrapper
+    return wrapper
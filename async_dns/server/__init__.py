@@ -2,39 +2,110 @@
 Async DNS server
 '''
 import asyncio
+import atexit
 import struct
+from typing import Iterable
 
-from async_dns.core import CacheNode, DNSMessage, logger, parse_hosts_file, types
+from async_dns.core import Blocklist, CacheNode, DNSMessage, EDNS_UDP_SIZE, HostsDB, NegativeCache, Record, SharedCache, TinyLFUPolicy, Zone, hosts_file, load_snapshot, logger, types, write_snapshot
+from async_dns.core.util import Packer
 from async_dns.resolver import BaseResolver, ProxyResolver, RecursiveResolver
 
+from .cache import *
+from .reload import *
+from .replication import *
 from .serve import *
 
 
-async def handle_dns(resolver: BaseResolver, data, addr, protocol):
-    '''Handle DNS requests'''
+def _echo_question(result: bytearray, data: bytes, end: int):
+    '''Copy the question from the request to keep its letter case.
 
-    msg = DNSMessage.parse(data)
+    Names are lowercased when parsed, but the client may check that the
+    question is echoed exactly, e.g. with DNS 0x20 encoding.
+    '''
+    question = data[12:end]
+    if result[12:end] != question and result[12:end].lower() == question.lower():
+        result[12:end] = question
+
+
+def _badvers(msg: DNSMessage, data: bytes, edns_size: int) -> bytearray:
+    res = DNSMessage(qid=msg.qid, rd=msg.rd)
+    res.qd = msg.qd
+    # BADVERS is 16, the upper 8 bits of the rcode are in the OPT record
+    result = bytearray(res.pack(opt=Record.create_opt(edns_size, ext_rcode=1)))
+    if res.qd:
+        _echo_question(result, data, 16 + len(res.qd[0].name.wire))
+    return result
+
+
+async def handle_dns(resolver: BaseResolver,
+                     data,
+                     addr,
+                     protocol,
+                     response_cache: ResponseCache = None,
+                     edns_size: int = EDNS_UDP_SIZE):
+    '''Handle DNS requests
+
+    If the request uses EDNS(0), responses over UDP are limited by the smaller
+    one of `edns_size` and the payload size advertised by the client,
+    otherwise by 512 bytes (RFC 1035). The DO bit is echoed, and requests of
+    EDNS versions other than 0 are answered with BADVERS (RFC 6891).
+    '''
+
+    msg = DNSMessage.parse(data, lazy=True)
+    opt = None
+    req_opt = msg.opt if edns_size else None
+    if req_opt is not None:
+        if (req_opt.ttl >> 16) & 0xff:
+            result = _badvers(msg, data, edns_size)
+            logger.info('[%s|badvers|%s] %d', protocol, addr[0], msg.qid)
+            yield result
+            return
+        opt = Record.create_opt(edns_size, do=(req_opt.ttl >> 15) & 1)
+    size_limit = None
+    if protocol == 'udp':
+        # RFC 6891: values lower than 512 must be treated as 512
+        size_limit = 512 if opt is None else min(max(512, req_opt.qclass),
+                                                  edns_size)
     for question in msg.qd:
-        try:
-            error = None
-            res, cached = await resolver.query(question.name, question.qtype)
-        except Exception as e:
-            import traceback
-            logger.debug('[server_handle][%s][%s] %s',
-                         types.get_name(question.qtype), question.name,
-                         traceback.format_exc())
-            error = str(e)
-            res, cached = None, None
-        if res is not None:
-            res.qid = msg.qid
-            data = res.pack(
-                size_limit=512 if protocol == 'udp' else None)  # rfc2181
-            len_data = len(data)
-            yield data
-            res_code = res.r
+        error = None
+        cache_key = (question.name, question.qtype, question.qclass,
+                     size_limit, None if opt is None else opt.ttl)
+        result = None
+        if response_cache is not None:
+            result = response_cache.get(cache_key, msg.qid)
+        if result is not None:
+            cached = True
+            res_code = result[3] & 0xf
+            resolver.cache.hit(question.name, question.qtype)
+        else:
+            try:
+                res, cached = await resolver.query(question.name,
+                                                   question.qtype)
+            except Exception as e:
+                import traceback
+                logger.debug('[server_handle][%s][%s] %s',
+                             types.get_name(question.qtype), question.name,
+                             traceback.format_exc())
+                error = str(e)
+                res, cached = None, None
+            if res is not None:
+                res.qid = msg.qid
+                packer = Packer(size_limit or 512)
+                result = bytearray(res.pack(size_limit, packer, opt))
+                res_code = res.r
+                if response_cache is not None and res.r in (0, 3) and (
+                        res.an or res.ns):
+                    response_cache.put(
+                        cache_key, result, packer.ttls,
+                        (rec.name for rec in res.an + res.ns))
+            else:
+                res_code = -1
+        if result is not None:
+            _echo_question(result, data, 16 + len(question.name.wire))
+            len_data = len(result)
+            yield result
         else:
             len_data = 0
-            res_code = -1
         logger.info(
             '[%s|%s|%s|%s] %s %d %d %s',
             protocol,
@@ -50,8 +121,13 @@ async def handle_dns(resolver: BaseResolver, data, addr, protocol):
 
 
 class TCPHandler:
-    def __init__(self, resolver: BaseResolver):
+    def __init__(self,
+                 resolver: BaseResolver,
+                 response_cache: ResponseCache = None,
+                 edns_size: int = EDNS_UDP_SIZE):
         self.resolver = resolver
+        self.response_cache = response_cache
+        self.edns_size = edns_size
 
     async def handle_tcp(self, reader, writer):
         addr = writer.transport.get_extra_info('peername')
@@ -61,7 +137,9 @@ class TCPHandler:
             except asyncio.IncompleteReadError:
                 break
             data = await reader.readexactly(size)
-            async for result in handle_dns(self.resolver, data, addr, 'tcp'):
+            async for result in handle_dns(self.resolver, data, addr, 'tcp',
+                                           self.response_cache,
+                                           self.edns_size):
                 bsize = struct.pack('!H', len(result))
                 writer.write(bsize)
                 writer.write(result)
@@ -69,9 +147,14 @@ class TCPHandler:
 
 class DNSDatagramProtocol(asyncio.DatagramProtocol):
     '''DNS server handler through UDP protocol.'''
-    def __init__(self, resolver):
+    def __init__(self,
+                 resolver,
+                 response_cache: ResponseCache = None,
+                 edns_size: int = EDNS_UDP_SIZE):
         super().__init__()
         self.resolver = resolver
+        self.response_cache = response_cache
+        self.edns_size = edns_size
 
     def connection_made(self, transport):
         self.transport = transport
@@ -80,45 +163,207 @@ class DNSDatagramProtocol(asyncio.DatagramProtocol):
         asyncio.ensure_future(self.handle(data, addr))
 
     async def handle(self, data, addr):
-        async for result in handle_dns(self.resolver, data, addr, 'udp'):
+        async for result in handle_dns(self.resolver, data, addr, 'udp',
+                                       self.response_cache, self.edns_size):
             self.transport.sendto(result, addr)
 
 
+def _write_snapshot(records: Iterable[Record], path: str):
+    try:
+        count = write_snapshot(records, path)
+    except OSError as e:
+        logger.warning('Failed to save snapshot %s: %s', path, e)
+    else:
+        logger.debug('%d records saved to %s', count, path)
+
+
+def _save_snapshot(cache: CacheNode, path: str):
+    _write_snapshot(cache.iter_values(), path)
+
+
+def schedule_snapshot(cache: CacheNode, path: str, interval: float):
+    '''Save snapshots of the cache periodically.
+
+    The records are collected on the event loop, and packed and written to
+    the file in the default executor so that queries are not blocked. The
+    next snapshot is scheduled when the file is written, until the returned
+    handle is cancelled.
+    '''
+    loop = asyncio.get_event_loop()
+
+    def run():
+        records = list(cache.iter_values())
+        future = loop.run_in_executor(None, _write_snapshot, records, path)
+        future.add_done_callback(schedule)
+
+    def schedule(_):
+        if not handle.cancelled():
+            loop.call_later(interval, run)
+
+    handle = loop.call_later(interval, run)
+    return handle
+
+
 async def start_dns_server(bind=':53',
                            enable_tcp=True,
                            enable_udp=True,
                            hosts=None,
-                           proxies=None):
-    '''Start a DNS server.'''
+                           proxies=None,
+                           response_cache=True,
+                           edns_size=EDNS_UDP_SIZE,
+                           max_cache_entries=None,
+                           max_cache_bytes=None,
+                           max_negative_ttl=3600,
+                           stale_ttl=0,
+                           snapshot=None,
+                           snapshot_interval=300,
+                           shared_cache=None,
+                           replication_bind=None,
+                           replication_peers=None,
+                           replication_secret=None,
+                           blocklist: Blocklist = None,
+                           hosts_db=None,
+                           proxies_file=None,
+                           reload_interval=0,
+                           zones=None):
+    '''Start a DNS server.
 
-    cache = CacheNode()
+    If `response_cache` is true, packed responses are cached and reused for
+    repeated questions. They are removed when the resolver invalidates a
+    name in them, including invalidations from replication peers, and when
+    the hosts file or zones are reloaded.
+
+    `edns_size` is the maximum UDP payload size for clients using EDNS(0),
+    0 to disable EDNS.
+
+    The cache is bounded by `max_cache_entries` record sets and about
+    `max_cache_bytes` bytes if provided. Expired records are removed in
+    background.
+
+    NXDOMAIN and NODATA answers are cached for `max_negative_ttl` seconds at
+    most, 0 to disable.
+
+    Expired records are kept for `stale_ttl` seconds and served when
+    upstreams fail or are slow, 0 to disable.
+
+    If `snapshot` is a file path, the cache is loaded from it on start, and
+    saved to it every `snapshot_interval` seconds and on exit.
+
+    If `shared_cache` is a file path, the cache is stored in the file with
+    `SharedCache` so that it can be shared by several server processes. The
+    size of the table is fixed, so `max_cache_entries` and `max_cache_bytes`
+    are ignored.
+
+    Cache updates are accepted from peer servers on `replication_bind`, and
+    sent to the addresses in `replication_peers`, see `CacheReplicator`.
+    Frames are signed with `replication_secret` if provided, which is
+    required unless `replication_bind` is a loopback address or a Unix
+    socket path.
+
+    Names matching `blocklist` are answered without looking up the cache.
+
+    If `hosts_db` is the path of a database compiled by `compile_hosts_db`,
+    its records are answered before the cache, see `HostsDB`.
+
+    If `proxies_file` is provided, the proxies in the file are used before
+    `proxies`, see `ProxyResolver.load_proxies`.
+
+    `zones` are paths of zone files to answer authoritatively, see `Zone`.
+
+    If `reload_interval` is positive, the hosts file, `hosts_db`,
+    `proxies_file` and `zones` are checked every `reload_interval` seconds,
+    and the changes are applied without dropping the cache.
+    '''
+
+    if shared_cache:
+        cache = SharedCache(shared_cache, stale_ttl=stale_ttl)
+    elif max_cache_entries is None and max_cache_bytes is None:
+        cache = CacheNode(stale_ttl=stale_ttl)
+    else:
+        cache = CacheNode(max_cache_entries,
+                          max_cache_bytes,
+                          TinyLFUPolicy(),
+                          stale_ttl=stale_ttl)
     cache.add('1.0.0.127.in-addr.arpa',
               qtype=types.PTR,
               data=('async-dns.local', ))
     cache.add('localhost', qtype=types.A, data=('127.0.0.1', ))
-    if hosts != 'none':
-        for name, qtype, data in parse_hosts_file(None if hosts ==
-                                                  'local' else hosts):
-            cache.add(name, qtype, data)
+    if snapshot:
+        try:
+            count = load_snapshot(cache, snapshot)
+        except Exception as e:
+            logger.warning('Failed to load snapshot %s: %s', snapshot, e)
+        else:
+            logger.info('%d records loaded from %s', count, snapshot)
+        schedule_snapshot(cache, snapshot, snapshot_interval)
+        atexit.register(_save_snapshot, cache, snapshot)
+    cache.start_expiry()
+    if hosts_db:
+        db = HostsDB(hosts_db)
+        logger.info('%d names loaded from %s', len(db), hosts_db)
+    else:
+        db = None
+    negative_cache = NegativeCache(max_ttl=max_negative_ttl)
+    static_proxies = list(proxies or [])
+    if proxies_file:
+        proxies = ProxyResolver.load_proxies(proxies_file) + static_proxies
     if proxies is None:
         # recursive resolver
-        resolver = RecursiveResolver(cache)
+        resolver = RecursiveResolver(cache,
+                                     negative_cache=negative_cache,
+                                     blocklist=blocklist,
+                                     hosts_db=db)
     else:
         # proxy resolver
         # if proxy is falsy, default proxies will be used
-        resolver = ProxyResolver(cache, proxies=proxies)
+        resolver = ProxyResolver(cache,
+                                 proxies=proxies,
+                                 negative_cache=negative_cache,
+                                 blocklist=blocklist,
+                                 hosts_db=db)
+    if replication_bind or replication_peers:
+        replicator = CacheReplicator(resolver,
+                                     replication_peers or (),
+                                     secret=replication_secret)
+        if replication_bind:
+            await replicator.start(replication_bind)
+    if response_cache:
+        response_cache = ResponseCache(ttl_ratio=1 - resolver.prefetch_ratio)
+        resolver.invalidation_callbacks.append(response_cache.invalidate)
+    else:
+        response_cache = None
+    watcher = FileWatcher(reload_interval)
+    if hosts != 'none':
+        hosts_path = hosts_file if hosts in (None, 'local') else hosts
+        reloader = HostsReloader(resolver, hosts_path, response_cache)
+        reloader.load()
+        if hosts_path:
+            watcher.watch(hosts_path, reloader.reload)
+    if hosts_db:
+        watch_hosts_db(watcher, resolver, hosts_db, response_cache)
+    if proxies_file:
+        watch_proxies(watcher, resolver, proxies_file, static_proxies)
+    for path in zones or ():
+        zone = Zone.load(path)
+        resolver.add_zone(zone)
+        logger.info('%d records loaded from %s for zone %s', len(zone), path,
+                    zone.origin)
+        watch_zone(watcher, resolver, path, response_cache)
+    if reload_interval > 0 and watcher.files:
+        watcher.start()
     loop = asyncio.get_event_loop()
     host = Host(bind)
     urls = []
     if enable_tcp:
-        server = await start_server(TCPHandler(resolver).handle_tcp, bind)
+        server = await start_server(TCPHandler(resolver, response_cache,
+                                               edns_size).handle_tcp, bind)
         urls.extend(get_server_hosts([server], 'tcp:'))
     else:
         server = None
     if enable_udp:
         hostname = host.hostname or '::'  # '::' includes both IPv4 and IPv6
         transport, _protocol = await loop.create_datagram_endpoint(
-            lambda: DNSDatagramProtocol(resolver),
+            lambda: DNSDatagramProtocol(resolver, response_cache, edns_size),
             local_addr=(hostname, host.port or 53))
         urls.append(
             get_url_items([transport.get_extra_info('sockname')], 'udp:'))
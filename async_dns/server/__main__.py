@@ -6,7 +6,7 @@ import logging
 import os
 
 from . import run_forever, start_dns_server
-from ..core import logger
+from ..core import Blocklist, logger
 
 
 def main():
@@ -23,6 +23,11 @@ def main():
         help=
         'the path of a hosts file, `none` to disable hosts, `local` to read from local hosts file'
     )
+    parser.add_argument(
+        '--hosts-db',
+        help=
+        'the path of a hosts database compiled by `python3 -m async_dns.core.hostsdb`'
+    )
     parser.add_argument(
         '-x',
         '--proxy',
@@ -31,11 +36,109 @@ def main():
         help=
         'the proxy DNS servers, `none` to serve as a recursive server, `default` to proxy to default nameservers'
     )
+    parser.add_argument(
+        '--proxies-file',
+        help=
+        'the path of a file with proxy rules and servers, used before `--proxy`'
+    )
+    parser.add_argument(
+        '--reload-interval',
+        type=float,
+        default=5,
+        help=
+        'the seconds between checks for changes of hosts and proxies files, 0 to disable'
+    )
+    parser.add_argument(
+        '--zone',
+        nargs='*',
+        help='the paths of zone files to answer authoritatively')
+    parser.add_argument('--cache-size',
+                        type=int,
+                        help='the maximum number of cached record sets')
+    parser.add_argument('--cache-memory',
+                        type=float,
+                        help='the approximate memory limit of the cache in MB')
+    parser.add_argument(
+        '--negative-ttl',
+        type=int,
+        default=3600,
+        help=
+        'the maximum TTL of cached NXDOMAIN and NODATA answers, 0 to disable')
+    parser.add_argument(
+        '--stale-ttl',
+        type=int,
+        default=0,
+        help=
+        'the seconds to keep expired records and serve them when upstreams fail, 0 to disable'
+    )
+    parser.add_argument(
+        '--snapshot',
+        help='the path of a cache snapshot to load on start and save periodically')
+    parser.add_argument('--snapshot-interval',
+                        type=float,
+                        default=300,
+                        help='the seconds between cache snapshots')
+    parser.add_argument(
+        '--shared-cache',
+        help='the path of a cache file shared by several server processes')
+    parser.add_argument(
+        '--replication-bind',
+        help='the address to accept cache updates from peer servers')
+    parser.add_argument('--replication-peers',
+                        nargs='*',
+                        help='the addresses of peer servers to send cache updates to')
+    parser.add_argument(
+        '--replication-secret-file',
+        help='the path of a file with the secret to sign cache updates, '
+        'required unless the replication address is local')
+    parser.add_argument(
+        '--blocklist',
+        nargs='*',
+        help='the paths of files with names to block, one rule per line')
+    parser.add_argument('--block-action',
+                        choices=['nxdomain', 'null', 'sinkhole'],
+                        default='null',
+                        help='how to answer blocked names')
+    parser.add_argument('--sinkhole',
+                        nargs='*',
+                        default=['0.0.0.0', '::'],
+                        help='the addresses to answer blocked names with')
     args = parser.parse_args()
     logging.basicConfig(level=os.environ.get('LOGLEVEL', logging.INFO))
     logger.info('DNS server v2 - by Gerald')
+    blocklist = None
+    if args.blocklist:
+        blocklist = Blocklist(getattr(Blocklist, args.block_action.upper()),
+                              args.sinkhole)
+        for path in args.blocklist:
+            blocklist.load(path)
+        blocklist.compile()
+        logger.info('%d blocklist rules loaded', len(blocklist))
+    replication_secret = None
+    if args.replication_secret_file:
+        with open(args.replication_secret_file, 'rb') as f:
+            replication_secret = f.read().strip()
     run_forever(
-        start_dns_server(bind=args.bind, hosts=args.hosts, proxies=args.proxy))
+        start_dns_server(
+            bind=args.bind,
+            hosts=args.hosts,
+            hosts_db=args.hosts_db,
+            proxies=args.proxy,
+            proxies_file=args.proxies_file,
+            reload_interval=args.reload_interval,
+            zones=args.zone,
+            max_cache_entries=args.cache_size,
+            max_negative_ttl=args.negative_ttl,
+            stale_ttl=args.stale_ttl,
+            snapshot=args.snapshot,
+            snapshot_interval=args.snapshot_interval,
+            shared_cache=args.shared_cache,
+            replication_bind=args.replication_bind,
+            replication_peers=args.replication_peers,
+            replication_secret=replication_secret,
+            blocklist=blocklist,
+            max_cache_bytes=None if args.cache_memory is None else int(
+                args.cache_memory * 1024 * 1024)))
 
 
 main()
@@ -0,0 +1,112 @@
+'''
+Cache of packed responses.
+'''
+from collections import OrderedDict
+import struct
+import time
+from typing import Dict, Hashable, Iterable, List, Set, Tuple, Union
+
+from ..core import DomainName
+
+__all__ = ['ResponseCache']
+
+_SHORT = struct.Struct('!H')
+_LONG = struct.Struct('!L')
+
+
+class ResponseCache:
+    '''Cache responses in wire format.
+
+    A cache hit only copies the packed data, then patches the transaction ID
+    and the TTL fields at the offsets recorded when the response was packed.
+
+    Responses are indexed by the names of the question and the records, so
+    that `invalidate` removes every response depending on a name, e.g. one
+    following a CNAME record to it. Pass it to
+    `BaseResolver.invalidation_callbacks` to keep the cache consistent with
+    the resolver.
+    '''
+    def __init__(self,
+                 max_size: int = 10000,
+                 max_ttl: int = 60,
+                 ttl_ratio: float = 1.0):
+        self.max_size = max_size
+        # the maximum age of a response, in case the records are changed
+        # in the resolver cache
+        self.max_ttl = max_ttl
+        # the part of the TTL to keep a response, so that the resolver sees
+        # the questions before the records expire and can prefetch them
+        self.ttl_ratio = ttl_ratio
+        self.data: OrderedDict = OrderedDict()
+        # keys of the responses containing each name
+        self.names: Dict[str, Set[Hashable]] = {}
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key: Hashable, qid: int) -> Union[bytearray, None]:
+        entry = self.data.get(key)
+        if entry is None:
+            return
+        packed, ttls, timestamp, expires, _ = entry
+        now = int(time.time())
+        if now >= expires:
+            self._pop(key)
+            return
+        self.data.move_to_end(key)
+        data = bytearray(packed)
+        _SHORT.pack_into(data, 0, qid)
+        elapsed = now - timestamp
+        if elapsed:
+            for offset, ttl in ttls:
+                _LONG.pack_into(data, offset, ttl - elapsed)
+        return data
+
+    def put(self,
+            key: Hashable,
+            packed: bytes,
+            ttls: List[Tuple[int, int]],
+            names: Iterable[str] = ()):
+        '''Cache a packed response.
+
+        `ttls` is a list of `(offset, ttl)` for each TTL field in the response.
+        `names` are the names in the response other than the question, which
+        is assumed to be the first item of the key.
+        '''
+        ttl = min((item[1] for item in ttls), default=self.max_ttl)
+        ttl = min(int(ttl * self.ttl_ratio), self.max_ttl)
+        if ttl <= 0:
+            return
+        now = int(time.time())
+        self._pop(key)
+        names = frozenset(map(DomainName, names)).union((key[0], ))
+        self.data[key] = bytes(packed), tuple(ttls), now, now + ttl, names
+        for name in names:
+            self.names.setdefault(name, set()).add(key)
+        while len(self.data) > self.max_size:
+            self._pop(next(iter(self.data)))
+
+    def _pop(self, key: Hashable):
+        entry = self.data.pop(key, None)
+        if entry is None:
+            return
+        for name in entry[4]:
+            keys = self.names.get(name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.names[name]
+
+    def remove(self, names: Iterable[str]):
+        '''Remove the responses containing any of `names`.'''
+        for name in set(map(DomainName, names)):
+            for key in list(self.names.get(name, ())):
+                self._pop(key)
+
+    def invalidate(self, fqdn: str, qtype: int = None):
+        '''Remove the responses containing `fqdn`, of any type.'''
+        self.remove((fqdn, ))
+
+    def clear(self):
+        self.data.clear()
+        self.names.clear()
@@ -0,0 +1,251 @@
+'''
+Reload hosts files and proxies without restarting the server.
+'''
+import asyncio
+import functools
+import inspect
+import os
+from typing import Awaitable, Callable, Dict, Iterable, Tuple, Union
+
+from async_dns.core import (
+    DomainName,
+    HostsDB,
+    Zone,
+    create_rdata,
+    logger,
+    parse_hosts_file,
+)
+from async_dns.resolver import BaseResolver, ProxyResolver
+
+from .cache import ResponseCache
+
+__all__ = [
+    'FileWatcher', 'HostsReloader', 'watch_hosts_db', 'watch_proxies',
+    'watch_zone'
+]
+
+Signature = Union[Tuple[int, int, int], None]
+
+
+def _stat(path: str) -> Signature:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class FileWatcher:
+    '''Call back when watched files are changed.
+
+    The modification time, size and inode of each file are polled every
+    `interval` seconds, so files replaced by a rename are detected as well.
+    A change is only reported when the file is unchanged in the next check,
+    so files being written are not loaded, and missing files are ignored
+    until they are back. Callbacks run in the event loop, and may return a
+    coroutine to do slow work without blocking it, e.g. reading the file in
+    an executor. Errors are logged without stopping the watcher.
+    '''
+    def __init__(self, interval: float = 5.0):
+        self.interval = interval
+        self.files: Dict[str, Tuple[Signature,
+                                    Callable[[str], Union[Awaitable,
+                                                          None]]]] = {}
+        # signatures of changed files to report if they are still the same
+        self.pending: Dict[str, Signature] = {}
+        self._handle = None
+
+    def watch(self, path: str, callback: Callable[[str], Union[Awaitable,
+                                                             None]]):
+        '''Call `callback(path)` when the file at `path` is changed.'''
+        path = os.path.expanduser(path)
+        self.files[path] = _stat(path), callback
+
+    def check(self):
+        '''Call back for the files changed since the last check.'''
+        for path, (signature, callback) in list(self.files.items()):
+            current = _stat(path)
+            if current == signature or current is None:
+                self.pending.pop(path, None)
+                continue
+            if self.pending.get(path) != current:
+                self.pending[path] = current
+                continue
+            del self.pending[path]
+            self.files[path] = current, callback
+            logger.info('[FileWatcher] %s changed', path)
+            try:
+                result = callback(path)
+            except Exception:
+                self._log_error(path)
+                continue
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result).add_done_callback(
+                    functools.partial(self._on_done, path))
+
+    def _on_done(self, path: str, future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            self._log_error(path, future.exception())
+
+    @staticmethod
+    def _log_error(path: str, exc_info: Union[BaseException, bool] = True):
+        logger.warning('[FileWatcher] failed to reload %s',
+                       path,
+                       exc_info=exc_info)
+
+    def start(self):
+        loop = asyncio.get_event_loop()
+
+        def run():
+            self.check()
+            self._handle = loop.call_later(self.interval, run)
+
+        self.stop()
+        self._handle = loop.call_later(self.interval, run)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+
+class HostsReloader:
+    '''Keep the records of a hosts file in the cache of a resolver.
+
+    Each load compares the file with the previous one, and only the records
+    that are added or removed are updated in the cache and the response
+    cache, so a reload never drops the rest of the cache, including records
+    of the same names from upstreams. If the file cannot be read, nothing is
+    changed.
+
+    `reload` parses the file in an executor and only applies the changes in
+    the event loop, so large files do not stall the resolution.
+    '''
+    def __init__(self,
+                 resolver: BaseResolver,
+                 path: str = None,
+                 response_cache: ResponseCache = None):
+        self.resolver = resolver
+        self.path = path
+        self.response_cache = response_cache
+        self.entries: Dict[Tuple[DomainName, int], Tuple[tuple, ...]] = {}
+        # the number of reloads started, to drop the results of older ones
+        self.generation = 0
+
+    @staticmethod
+    def read(path: str) -> Dict[Tuple[DomainName, int], Tuple[tuple, ...]]:
+        '''Return the records of the hosts file by name and type.'''
+        entries = {}
+        for name, qtype, data in parse_hosts_file(path, strict=True):
+            key = DomainName(name), qtype
+            values = entries.setdefault(key, ())
+            if data not in values:
+                entries[key] = values + (data, )
+        return entries
+
+    def load(self, path: str = None) -> int:
+        '''Apply the changes of the hosts file and return the number of
+        record sets updated.'''
+        path = path or self.path
+        self.generation += 1
+        try:
+            entries = self.read(path)
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning('Failed to load hosts file %s: %s', path, e)
+            return 0
+        return self.update(entries)
+
+    async def reload(self, path: str = None) -> int:
+        '''Like `load`, but read the file in an executor.'''
+        path = path or self.path
+        self.generation += 1
+        generation = self.generation
+        loop = asyncio.get_event_loop()
+        try:
+            entries = await loop.run_in_executor(None, self.read, path)
+        except (OSError, UnicodeDecodeError) as e:
+            logger.warning('Failed to load hosts file %s: %s', path, e)
+            return 0
+        if generation != self.generation:
+            # a later reload is applying a newer version of the file
+            return 0
+        return self.update(entries)
+
+    def update(self, entries: Dict[Tuple[DomainName, int], Tuple[tuple,
+                                                                 ...]]) -> int:
+        cache = self.resolver.cache
+        old = self.entries
+        changed = set()
+        for key, values in old.items():
+            if entries.get(key) != values:
+                cache.discard(*key,
+                              [create_rdata(key[1], *data) for data in values])
+                changed.add(key)
+        for key, values in entries.items():
+            if old.get(key) != values:
+                for data in values:
+                    cache.add(key[0], key[1], data)
+                changed.add(key)
+        self.entries = entries
+        if self.response_cache is not None:
+            self.response_cache.remove(name for name, _ in changed)
+        return len(changed)
+
+
+def watch_hosts_db(watcher: FileWatcher,
+                   resolver: BaseResolver,
+                   path: str,
+                   response_cache: ResponseCache = None):
+    '''Reopen the hosts database of `resolver` when it is compiled again.'''
+    def reload(path: str):
+        hosts_db = HostsDB(path)
+        old, resolver.hosts_db = resolver.hosts_db, hosts_db
+        if old is not None:
+            # lookups do not yield to the event loop, so nothing is using it
+            old.close()
+        if response_cache is not None:
+            response_cache.clear()
+        logger.info('%d names loaded from %s', len(hosts_db), path)
+
+    watcher.watch(path, reload)
+
+
+def watch_proxies(watcher: FileWatcher,
+                  resolver: ProxyResolver,
+                  path: str,
+                  proxies: Iterable = ()):
+    '''Replace the proxies of `resolver` with the ones in the proxies file
+    followed by `proxies` when the file is changed.
+
+    If there are no proxies at all, the default nameservers are used, as when
+    the resolver is created.'''
+    def reload(path: str):
+        resolver.set_proxies(
+            resolver.load_proxies(path) + list(proxies)
+            or resolver.default_nameservers)
+
+    watcher.watch(path, reload)
+
+
+def watch_zone(watcher: FileWatcher,
+               resolver: BaseResolver,
+               path: str,
+               response_cache: ResponseCache = None):
+    '''Load the zone file again in an executor when it is changed.'''
+    generation = 0
+
+    async def reload(path: str):
+        nonlocal generation
+        generation += 1
+        current = generation
+        loop = asyncio.get_event_loop()
+        zone = await loop.run_in_executor(None, Zone.load, path)
+        if current != generation:
+            return
+        resolver.add_zone(zone)
+        if response_cache is not None:
+            response_cache.clear()
+        logger.info('%d records loaded from %s for zone %s', len(zone), path,
+                    zone.origin)
+
+    watcher.watch(path, reload)
@@ -0,0 +1,209 @@
+'''
+Replication of cache updates between servers.
+'''
+import asyncio
+import hashlib
+import hmac
+import ipaddress
+import os
+import struct
+import time
+from typing import Dict, Iterable, Union
+
+from async_dns.core import DNSMessage, Host, REQUEST, Record, logger, types
+from async_dns.resolver import BaseResolver
+
+from .serve import is_path, start_server
+
+__all__ = ['CacheReplicator']
+
+# payload length, kind, time sent
+_FRAME = struct.Struct('!LBd')
+INSERT = 1
+INVALIDATE = 2
+MAX_PAYLOAD = 1 << 16
+_MAC_SIZE = hashlib.sha256().digest_size
+
+
+def is_local(bind: str) -> bool:
+    '''Return whether `bind` is a Unix socket path or a loopback address.'''
+    if is_path(bind):
+        return True
+    hostname = Host(bind).hostname
+    if hostname == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(hostname).is_loopback
+    except ValueError:
+        return False
+
+
+class CacheReplicator:
+    '''Replicate cache updates of a resolver to peer servers.
+
+    Each update is sent as a frame with the time it is sent, followed by a
+    packed DNS message. Inserts carry the messages passed to
+    `BaseResolver.cache_message`, and invalidations carry the questions
+    passed to `BaseResolver.invalidate`. Peers reduce the TTLs by the transit
+    time, so the clocks of the servers should be synchronized.
+
+    Peers are TCP addresses like `192.168.1.2:5353` or Unix socket paths.
+    Updates are dropped for a peer that is disconnected or whose write
+    buffer exceeds `max_buffer` bytes.
+
+    Updates are written to the cache as they are, so anyone who can connect
+    to the listener can poison the cache. If `secret` is provided, each
+    frame is signed with HMAC-SHA256, and frames with a wrong signature or
+    sent more than `max_skew` seconds away from now are rejected. All peers
+    must share the same secret. Without a secret, the listener only accepts
+    loopback addresses and Unix sockets, which are only accessible by the
+    owner.
+    '''
+    def __init__(self,
+                 resolver: BaseResolver,
+                 peers: Iterable[str] = (),
+                 max_buffer: int = 1 << 20,
+                 retry_interval: float = 5.0,
+                 secret: Union[bytes, str] = None,
+                 max_skew: float = 30.0):
+        self.resolver = resolver
+        if isinstance(secret, str):
+            secret = secret.encode()
+        self.secret = secret
+        self.max_skew = max_skew
+        self.max_buffer = max_buffer
+        self.retry_interval = retry_interval
+        self.writers: Dict[str, asyncio.StreamWriter] = {}
+        self.tasks: Dict[str, asyncio.Future] = {}
+        self.server = None
+        self.sent = self.dropped = self.received = self.rejected = 0
+        resolver.replicator = self
+        for peer in peers:
+            self.add_peer(peer)
+
+    async def start(self, bind: str):
+        '''Accept updates from peers on `bind`.
+
+        Without a secret, `bind` must be a loopback address or a Unix socket
+        path.
+        '''
+        if self.secret is None and not is_local(bind):
+            raise ValueError(
+                'A secret is required to accept updates on ' + bind)
+        self.server = await start_server(self.handle, bind)
+        if is_path(bind):
+            os.chmod(bind, 0o600)
+        return self.server
+
+    def _sign(self, data: bytes) -> bytes:
+        return hmac.new(self.secret, data, hashlib.sha256).digest()
+
+    def close(self):
+        if self.resolver.replicator is self:
+            self.resolver.replicator = None
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        for task in self.tasks.values():
+            task.cancel()
+        self.tasks.clear()
+        for writer in self.writers.values():
+            writer.close()
+        self.writers.clear()
+
+    def add_peer(self, peer: str):
+        '''Send updates to `peer`, reconnecting when it is disconnected.'''
+        if peer not in self.tasks:
+            self.tasks[peer] = asyncio.ensure_future(self._connect(peer))
+
+    async def _open(self, peer: str):
+        if is_path(peer):
+            return await asyncio.open_unix_connection(peer)
+        host = Host(peer)
+        return await asyncio.open_connection(host.hostname, host.port)
+
+    async def _connect(self, peer: str):
+        while True:
+            try:
+                reader, writer = await self._open(peer)
+            except OSError as e:
+                logger.debug('[CacheReplicator][%s] %s', peer, e)
+            else:
+                self.writers[peer] = writer
+                try:
+                    # peers never send anything, wait until disconnected
+                    await reader.read()
+                except OSError:
+                    pass
+                finally:
+                    self.writers.pop(peer, None)
+                    writer.close()
+            await asyncio.sleep(self.retry_interval)
+
+    def _publish(self, kind: int, msg: DNSMessage):
+        if not self.writers:
+            return
+        payload = msg.pack()
+        if len(payload) > MAX_PAYLOAD:
+            return
+        frame = _FRAME.pack(len(payload), kind, time.time()) + payload
+        if self.secret is not None:
+            frame += self._sign(frame)
+        for writer in self.writers.values():
+            if writer.transport.get_write_buffer_size() > self.max_buffer:
+                self.dropped += 1
+            else:
+                writer.write(frame)
+                self.sent += 1
+
+    def publish_message(self, msg: DNSMessage):
+        self._publish(INSERT, msg)
+
+    def publish_invalidation(self, fqdn: str, qtype: int = types.ANY):
+        msg = DNSMessage()
+        msg.qd.append(Record(REQUEST, name=fqdn, qtype=qtype))
+        self._publish(INVALIDATE, msg)
+
+    async def handle(self, reader: asyncio.StreamReader,
+                     writer: asyncio.StreamWriter):
+        '''Apply the updates from a peer.'''
+        try:
+            while True:
+                header = await reader.readexactly(_FRAME.size)
+                size, kind, sent = _FRAME.unpack(header)
+                if size > MAX_PAYLOAD:
+                    break
+                payload = await reader.readexactly(size)
+                if self.secret is not None:
+                    mac = await reader.readexactly(_MAC_SIZE)
+                    if not hmac.compare_digest(
+                            mac, self._sign(header + payload)):
+                        self.rejected += 1
+                        logger.warning('[CacheReplicator] invalid signature')
+                        break
+                    if abs(time.time() - sent) > self.max_skew:
+                        # probably replayed
+                        self.rejected += 1
+                        continue
+                self.apply(kind, sent, payload)
+        except asyncio.IncompleteReadError:
+            pass
+        except Exception:
+            logger.warning('[CacheReplicator] invalid update', exc_info=True)
+        finally:
+            writer.close()
+
+    def apply(self, kind: int, sent: float, payload: bytes):
+        msg = DNSMessage.parse(payload)
+        self.received += 1
+        if kind == INSERT:
+            # round up so that records never outlive the original ones
+            elapsed = max(0, int(time.time() - sent + 0.999))
+            if elapsed:
+                for rec in msg.an + msg.ns + msg.ar:
+                    if rec.ttl > 0 and rec.qtype != types.OPT:
+                        rec.ttl = max(0, rec.ttl - elapsed)
+            self.resolver.cache_message(msg, False)
+        elif kind == INVALIDATE:
+            for question in msg.qd:
+                self.resolver.invalidate(question.name, question.qtype, False)
@@ -1,5 +1,6 @@
 import asyncio
 import os
+import signal
 import socket
 
 from async_dns.core import Host
@@ -97,6 +98,9 @@ def wake_up():
 def run_forever(aw=None):
     wake_up()
     loop = asyncio.get_event_loop()
+    if os.name != 'nt':
+        # exit normally so that exit handlers are called
+        loop.add_signal_handler(signal.SIGTERM, loop.stop)
     if aw is not None:
         loop.run_until_complete(aw)
     loop.run_forever()
@@ -0,0 +1,77 @@
+import io
+import unittest
+from unittest.mock import patch
+
+from async_dns.core import Blocklist, types
+
+
+class TestBlocklist(unittest.TestCase):
+    def test_match(self):
+        blocklist = Blocklist()
+        blocklist.load(
+            io.StringIO('''# comment
+ads.example.com
+*.Tracker.com.  # trailing comment
+0.0.0.0 a.fake.com b.fake.com
+@@ok.tracker.com
+'''))
+        blocklist.add('*.evil.com', Blocklist.NXDOMAIN)
+        self.assertEqual(len(blocklist), 6)
+        self.assertEqual(blocklist.match('ADS.example.com'), Blocklist.NULL)
+        self.assertIsNone(blocklist.match('example.com'))
+        self.assertIsNone(blocklist.match('www.ads.example.com'))
+        self.assertIsNone(blocklist.match('tracker.com'))
+        self.assertEqual(blocklist.match('x.y.tracker.com'), Blocklist.NULL)
+        self.assertEqual(blocklist.match('ok.tracker.com'), Blocklist.ALLOW)
+        self.assertEqual(blocklist.match('b.fake.com'), Blocklist.NULL)
+        self.assertEqual(blocklist.match('www.evil.com'), Blocklist.NXDOMAIN)
+        self.assertIsNone(blocklist.match('0.0.0.0'))
+
+    def test_hosts_header(self):
+        blocklist = Blocklist()
+        blocklist.load(
+            io.StringIO('''127.0.0.1 localhost
+127.0.0.1 localhost.localdomain
+127.0.0.1 local
+255.255.255.255 broadcasthost
+::1 localhost ip6-localhost ip6-loopback
+fe80::1%lo0 localhost
+ff00::0 ip6-localnet
+ff02::1 ip6-allnodes
+0.0.0.0 0.0.0.0
+# Custom host records are listed here.
+0.0.0.0 ads.example.com
+'''))
+        self.assertEqual(len(blocklist), 1)
+        for name in ('localhost', 'localhost.localdomain', 'local',
+                     'broadcasthost', 'ip6-localhost', 'ip6-allnodes'):
+            self.assertIsNone(blocklist.match(name), name)
+        self.assertEqual(blocklist.match('ads.example.com'), Blocklist.NULL)
+
+    def test_allow_duplicate(self):
+        blocklist = Blocklist()
+        blocklist.add('ads.example.com', Blocklist.ALLOW)
+        blocklist.add('ads.example.com')
+        blocklist.add('ads.example.com', Blocklist.NXDOMAIN)
+        blocklist.add('*.tracker.com', Blocklist.ALLOW)
+        blocklist.add('*.tracker.com', Blocklist.NXDOMAIN)
+        self.assertEqual(blocklist.match('ads.example.com'), Blocklist.ALLOW)
+        self.assertEqual(blocklist.match('x.tracker.com'), Blocklist.ALLOW)
+
+    def test_hash_collision(self):
+        # all names have the same hash
+        with patch.object(Blocklist, '_hash', staticmethod(lambda name: 4)):
+            blocklist = Blocklist()
+            blocklist.add('ads.example.com')
+            self.assertEqual(blocklist.match('ads.example.com'),
+                             Blocklist.NULL)
+            self.assertIsNone(blocklist.match('www.example.com'))
+
+    def test_answer(self):
+        blocklist = Blocklist(Blocklist.SINKHOLE, sinkhole=['10.0.0.1'])
+        records = blocklist.answer('ads.com', types.ANY, Blocklist.SINKHOLE)
+        self.assertEqual([rec.data.data for rec in records], ['10.0.0.1'])
+        records = blocklist.answer('ads.com', types.AAAA, Blocklist.NULL)
+        self.assertEqual([rec.data.data for rec in records], ['::'])
+        self.assertEqual(blocklist.answer('ads.com', types.MX, Blocklist.NULL),
+                         [])
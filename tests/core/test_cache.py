@@ -1,6 +1,7 @@
+import time
 import unittest
 
-from async_dns.core import cache, types
+from async_dns.core import Record, cache, create_rdata, types
 
 
 class TestCache(unittest.TestCase):
@@ -11,6 +12,170 @@ class TestCache(unittest.TestCase):
         self.assertIsInstance(value, cache.CacheValue)
         self.assertIs(node.get('www.fake.com'), value)
         node.add('www.fake.com', qtype=types.A, data=('8.8.8.8', ))
-        self.assertIs(
+        self.assertEqual(
             list(node.get('www.fake.com').get(types.A))[0].data.data,
             '8.8.8.8')
+
+    def test_case_insensitive(self):
+        node = cache.CacheNode()
+        node.add('WWW.Fake.com', qtype=types.A, data=('8.8.8.8', ))
+        self.assertEqual(len(list(node.query('www.fake.COM.', types.A))), 1)
+
+    def test_max_entries(self):
+        node = cache.CacheNode(max_entries=3)
+        node.add('localhost', qtype=types.A, data=('127.0.0.1', ))
+        for i in range(3):
+            node.add('%d.fake.com' % i, types.A, ('8.8.8.%d' % i, ), ttl=60)
+        self.assertEqual(node.stats()['entries'], 3)
+        self.assertIsNone(node.get('0.fake.com'))
+        # refresh 1.fake.com so 2.fake.com is evicted first
+        self.assertEqual(len(list(node.query('1.fake.com', types.A))), 1)
+        node.add('3.fake.com', types.A, ('8.8.8.3', ), ttl=60)
+        self.assertIsNone(node.get('2.fake.com'))
+        self.assertIsNotNone(node.get('1.fake.com'))
+        # permanent records are never evicted
+        self.assertEqual(len(list(node.query('localhost', types.A))), 1)
+
+    def test_max_bytes(self):
+        node = cache.CacheNode(max_bytes=20000)
+        for i in range(100):
+            node.add('%d.fake.com' % i, types.A, ('8.8.8.8', ), ttl=60)
+        stats = node.stats()
+        self.assertLessEqual(stats['bytes'], 20000)
+        self.assertGreater(stats['entries'], 0)
+        self.assertEqual(stats['entries'], stats['records'])
+        # nodes, names and record sets are counted as well as records
+        records = sum(map(cache.get_record_size, node.iter_values()))
+        self.assertGreater(stats['bytes'], 2 * records)
+
+    def test_heap(self):
+        node = cache.CacheNode(max_entries=10)
+        for i in range(1000):
+            node.add('%d.fake.com' % i, types.A, ('8.8.8.8', ), ttl=3600)
+            node.add('%d.fake.com' % i, types.A, ('8.8.8.8', ), ttl=60)
+        index = node.index
+        self.assertEqual(len(index.scheduled), 10)
+        self.assertLessEqual(len(index.heap), 2 * 10 + 1)
+
+    def test_tinylfu(self):
+        node = cache.CacheNode(max_entries=2, policy=cache.TinyLFUPolicy(256))
+        for name in 'a.com', 'b.com':
+            for _ in range(3):
+                list(node.query(name, types.A))
+            node.add(name, types.A, ('8.8.8.8', ), ttl=60)
+        for i in range(10):
+            name = '%d.random.com' % i
+            list(node.query(name, types.A))
+            node.add(name, types.A, ('8.8.8.8', ), ttl=60)
+        self.assertIsNotNone(node.get('a.com'))
+        self.assertIsNotNone(node.get('b.com'))
+        self.assertIsNone(node.get('random.com'))
+        # a new name becomes popular
+        for _ in range(5):
+            list(node.query('c.com', types.A))
+        node.add('c.com', types.A, ('8.8.8.8', ), ttl=60)
+        self.assertIsNotNone(node.get('c.com'))
+        self.assertEqual(node.stats()['entries'], 2)
+
+    def test_prune(self):
+        node = cache.CacheNode()
+        node.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        node.add('www.fake.com', types.AAAA, ('::1', ), ttl=60)
+        node.remove('www.fake.com', types.A)
+        self.assertIn('com', node.children)
+        node.remove('www.fake.com')
+        self.assertEqual(node.children, {})
+        self.assertEqual(node.stats(), {'entries': 0, 'records': 0, 'bytes': 0})
+        record = Record(name='old.fake.com', qtype=types.A, ttl=1,
+                        data=create_rdata(types.A, '8.8.8.8'))
+        record.timestamp -= 10
+        node.add(record=record)
+        self.assertEqual(list(node.query('old.fake.com', types.A)), [])
+        self.assertEqual(node.children, {})
+
+    def test_expire(self):
+        node = cache.CacheNode()
+        for i in range(100):
+            node.add('host%d.fake.com' % i, types.A, ('8.8.8.8', ),
+                     ttl=10 if i % 4 else 3600)
+        node.add('live.fake.com', types.A, ('8.8.4.4', ))
+        self.assertEqual(node.stats()['records'], 101)
+        now = time.time() + 60
+        self.assertEqual(node.expire(now, budget=0), 64)
+        self.assertEqual(node.stats()['records'], 37)
+        node.expire(now)
+        self.assertEqual(node.stats()['records'], 26)
+        self.assertIsNone(node.get('host1.fake.com'))
+        self.assertEqual(len(list(node.query('host0.fake.com', types.A))), 1)
+        node.expire(now + 3600)
+        self.assertEqual(node.stats()['records'], 1)
+        self.assertEqual(list(node.children), ['com'])
+        self.assertEqual(list(node.children['com'].children['fake'].children),
+                         ['live'])
+
+    def test_negative_cache(self):
+        negative = cache.NegativeCache(max_ttl=300)
+        soa = Record(name='fake.com', qtype=types.SOA, ttl=3600,
+                     data=create_rdata(types.SOA, 'ns.fake.com',
+                                       'admin.fake.com', 1, 2, 3, 4, 600))
+        negative.add('NX.fake.com', types.A, 3, soa)
+        negative.add('www.fake.com', types.AAAA, 0, soa)
+        rcode, record = negative.get('nx.fake.com', types.MX)
+        self.assertEqual(rcode, 3)
+        self.assertEqual(record.ttl, 300)
+        self.assertEqual(negative.get('www.fake.com', types.AAAA)[0], 0)
+        self.assertIsNone(negative.get('www.fake.com', types.A))
+        negative.remove('www.fake.com', types.AAAA)
+        self.assertIsNone(negative.get('www.fake.com', types.AAAA))
+        soa.timestamp -= 3500
+        negative.add('old.fake.com', types.A, 3, soa)
+        self.assertEqual(negative.get('old.fake.com', types.A)[1].ttl, 100)
+        entry = negative.data['old.fake.com', None][1]
+        entry.timestamp -= 100
+        self.assertIsNone(negative.get('old.fake.com', types.A))
+
+    def test_hits(self):
+        node = cache.CacheNode()
+        node.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        self.assertEqual(node.hit('www.fake.com', types.A), 1)
+        self.assertEqual(node.hit('WWW.fake.com', types.A), 2)
+        self.assertEqual(node.hit('nx.fake.com', types.A), 0)
+        self.assertEqual(node.pop_hits('www.fake.com', types.A), 2)
+        self.assertEqual(node.pop_hits('www.fake.com', types.A), 0)
+        node.hit('www.fake.com', types.A)
+        node.remove('www.fake.com', types.A)
+        node.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        self.assertEqual(node.pop_hits('www.fake.com', types.A), 0)
+
+    def test_stale(self):
+        node = cache.CacheNode(stale_ttl=60)
+        record = Record(name='www.fake.com', qtype=types.A, ttl=10,
+                        data=create_rdata(types.A, '8.8.8.8'))
+        node.add(record=record)
+        record.timestamp -= 30
+        node.get('www.fake.com').update_expires(types.A)
+        self.assertEqual(list(node.query('www.fake.com', types.A)), [])
+        self.assertEqual(list(node.query('www.fake.com', types.A, True)),
+                         [record])
+        node.add('www.fake.com', types.A, ('8.8.4.4', ), ttl=10)
+        self.assertEqual(node.stats()['records'], 1)
+        node.expire(time.time() + 60)
+        self.assertEqual(node.stats()['records'], 1)
+        node.expire(time.time() + 80)
+        self.assertEqual(node.stats()['records'], 0)
+
+    def test_index(self):
+        node = cache.CacheNode()
+        node.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        self.assertEqual(list(node.index.nodes), ['www.fake.com'])
+        self.assertIsNone(node.get('fake.com'))
+        self.assertIsNone(node.get('any.fake.com'))
+        node.add('*.fake.com', types.A, ('8.8.4.4', ), ttl=60)
+        self.assertEqual(node.index.wildcards, 1)
+        records = list(node.query('any.fake.com', types.A))
+        self.assertEqual(records[0].data.data, '8.8.4.4')
+        node.remove('*.fake.com')
+        node.remove('www.fake.com')
+        self.assertEqual(node.index.nodes, {})
+        self.assertEqual(node.index.wildcards, 0)
+        self.assertEqual(node.children, {})
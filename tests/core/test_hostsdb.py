@@ -0,0 +1,70 @@
+import os
+import tempfile
+import unittest
+
+from async_dns.core import (HostsDB, compile_hosts_db, create_rdata,
+                            parse_hosts_file, types)
+from async_dns.core.util import ParseError
+
+hosts = os.path.join(os.path.dirname(__file__), '../fixtures/hosts')
+
+
+class TestHostsDB(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_compile(self):
+        entries = list(parse_hosts_file(hosts)) + [
+            ('Pi3.lan.', types.AAAA, ('::1', )),
+            ('pi3.lan', types.A, ('192.168.199.4', )),
+            ('www.fake.com', types.CNAME, ('fake.com', )),
+            ('fake.com', types.MX, create_rdata(types.MX, 10, 'mx.fake.com')),
+        ] + [('host%d.lan' % i, types.A, ('10.0.%d.%d' % (i // 256, i % 256), ))
+             for i in range(1000)]
+        self.assertEqual(compile_hosts_db(entries, self.path), 1004)
+        db = HostsDB(self.path)
+        try:
+            self.assertEqual(len(db), 1004)
+            records = list(db.query('PI3.LAN', types.ANY))
+            self.assertEqual([(r.qtype, r.data.data) for r in records],
+                             [(types.A, '192.168.199.4'),
+                              (types.AAAA, '::1')])
+            self.assertEqual(records[0].ttl, -1)
+            self.assertEqual(
+                [r.data.data for r in db.query('pi3.lan', types.AAAA)],
+                ['::1'])
+            self.assertEqual(
+                [r.data.data for r in db.query('red.pi', (types.A, types.AAAA))],
+                ['192.168.199.4'])
+            self.assertEqual(
+                list(db.query('www.fake.com', types.CNAME))[0].data.data,
+                'fake.com')
+            mx = list(db.query('fake.com', types.MX))[0].data
+            self.assertEqual((mx.preference, mx.exchange), (10, 'mx.fake.com'))
+            for i in range(0, 1000, 37):
+                self.assertEqual(
+                    [r.data.data for r in db.query('host%d.lan' % i, types.A)],
+                    ['10.0.%d.%d' % (i // 256, i % 256)])
+            self.assertEqual(list(db.query('host1000.lan', types.A)), [])
+            self.assertEqual(list(db.query('a.lan', types.A)), [])
+            self.assertEqual(list(db.query('zzz', types.A)), [])
+        finally:
+            db.close()
+
+    def test_empty(self):
+        self.assertEqual(compile_hosts_db([], self.path), 0)
+        db = HostsDB(self.path)
+        self.assertEqual(list(db.query('pi3.lan', types.A)), [])
+        db.close()
+
+    def test_invalid(self):
+        with self.assertRaises(ParseError):
+            HostsDB(self.path)
+        with open(self.path, 'wb') as f:
+            f.write(b'invalid hosts database')
+        with self.assertRaises(ParseError):
+            HostsDB(self.path)
@@ -0,0 +1,34 @@
+import pickle
+import unittest
+
+from async_dns.core import DomainName
+
+
+class TestDomainName(unittest.TestCase):
+    def test_canonical(self):
+        name = DomainName('WWW.Example.com.')
+        self.assertEqual(name, 'www.example.com')
+        self.assertIs(DomainName('www.example.COM'), name)
+        self.assertIs(DomainName(name), name)
+        self.assertEqual(name.labels, ('www', 'example', 'com'))
+        self.assertEqual(name.wire, b'\3www\7example\3com\0')
+        self.assertEqual(hash(name), hash('www.example.com'))
+        self.assertIs(pickle.loads(pickle.dumps(name)), name)
+
+    def test_root(self):
+        root = DomainName('.')
+        self.assertEqual(root, '')
+        self.assertEqual(root.labels, ())
+        self.assertEqual(root.wire, b'\0')
+
+    def test_from_labels(self):
+        name = DomainName.from_labels([b'WWW', b'example', b'com'])
+        self.assertIs(name, DomainName('www.example.com'))
+
+    def test_subdomain(self):
+        name = DomainName('www.example.com')
+        self.assertEqual(name.parent, 'example.com')
+        self.assertTrue(name.is_subdomain('Example.com'))
+        self.assertTrue(name.is_subdomain(''))
+        self.assertFalse(name.is_subdomain('ample.com'))
+        self.assertFalse(DomainName('com').is_subdomain('example.com'))
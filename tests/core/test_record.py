@@ -1,6 +1,22 @@
+import time
+import tracemalloc
 import unittest
 
-from async_dns.core.record import DNSMessage
+from async_dns.core import types
+from async_dns.core.record import (
+    DNSMessage,
+    MX_RData,
+    REQUEST,
+    RESPONSE,
+    Record,
+    SOA_RData,
+    create_rdata,
+)
+from async_dns.core.util import ParseError
+
+RESPONSE_DATA = (b'D7\x81\x80\x00\x01\x00\x01\x00\x00\x00\x00\x03'
+                 b'www\x06google\x03com\x00\x00\x01\x00\x01\xc0\x0c'
+                 b'\x00\x01\x00\x01\x00\x00\t\xb5\x00\x04\xcbb\x07A')
 
 
 class TestRecord(unittest.TestCase):
@@ -9,3 +25,154 @@ class TestRecord(unittest.TestCase):
             b'\xe2@\x01 \x00\x01\x00\x00\x00\x00\x00\x01\x03www\x05baidu\x03com\x00\x00\x01\x00\x01\x00\x00)\x10\x00\x00\x00\x00\x00\x00\x00'
         )
         self.assertEqual(msg.qd[0].name, 'www.baidu.com')
+        self.assertEqual(msg.udp_size, 4096)
+        self.assertEqual(msg.edns_version, 0)
+
+    def test_edns(self):
+        msg = DNSMessage()
+        self.assertIsNone(msg.opt)
+        self.assertEqual(msg.udp_size, 512)
+        msg.set_edns(1232, do=1)
+        msg.ar.append(Record.create_opt(4096, ext_rcode=1))
+        msg.set_edns(1400)
+        self.assertEqual(len(msg.ar), 1)
+        msg.ar[0] = Record.create_opt(1400, ext_rcode=1, do=1)
+        msg.r = 0
+        parsed = DNSMessage.parse(msg.pack())
+        self.assertEqual(parsed.udp_size, 1400)
+        self.assertEqual(parsed.edns_do, 1)
+        # BADVERS
+        self.assertEqual(parsed.rcode, 16)
+
+    def test_lazy_parse(self):
+        msg = DNSMessage.parse(RESPONSE_DATA, lazy=True)
+        self.assertEqual(msg.qid, 0x4437)
+        self.assertEqual(msg.qd[0].name, 'www.google.com')
+        self.assertIsNotNone(msg._pending)
+        self.assertEqual(len(msg.an), 1)
+        self.assertEqual(msg.an[0].qtype, types.A)
+        self.assertEqual(msg.an[0].data.data, '203.98.7.65')
+        self.assertIsNotNone(msg._pending)
+        self.assertEqual(msg.ar, [])
+        self.assertIsNone(msg._pending)
+        eager = DNSMessage.parse(RESPONSE_DATA)
+        self.assertEqual(repr(eager), repr(msg))
+        msg = DNSMessage(qid=1)
+        msg.an.append(Record(name='www.google.com', qtype=types.A, ttl=60,
+                             data=create_rdata(types.A, '1.2.3.4')))
+        msg.set_edns(1400, do=1)
+        msg = DNSMessage.parse(msg.pack(), lazy=True)
+        # the OPT record is found without decoding the sections
+        self.assertEqual((msg.udp_size, msg.edns_do), (1400, 1))
+        self.assertIsNotNone(msg._pending)
+
+    def test_pack(self):
+        msg = DNSMessage(qid=1234)
+        msg.qd = [Record(REQUEST, 'example.com', types.ANY)]
+        for qtype, data in (
+            (types.A, ('1.2.3.4', )),
+            (types.AAAA, ('::1', )),
+            (types.MX, (10, 'mail.example.com')),
+            (types.SRV, (1, 2, 53, 'ns.example.com')),
+            (types.NS, ('ns.example.com', )),
+            (types.TXT, ('hello', )),
+            (types.NAPTR, (1, 2, 'U', 'E2U+sip', '', 'sip.example.org')),
+            (types.SOA, ('ns.example.com', 'admin.example.com', 1, 2, 3,
+                         4, 5)),
+        ):
+            msg.an.append(
+                Record(name='example.com',
+                       qtype=qtype,
+                       ttl=60,
+                       data=create_rdata(qtype, *data)))
+        data = msg.pack()
+        # `example.com` is written only once, later names are compressed
+        self.assertEqual(data.count(b'\x07example\x03com\x00'), 1)
+        parsed = DNSMessage.parse(data)
+        self.assertEqual(parsed.qid, 1234)
+        self.assertEqual([rec.data for rec in parsed.an],
+                         [rec.data for rec in msg.an])
+
+    def test_pack_truncate(self):
+        msg = DNSMessage()
+        msg.qd = [Record(REQUEST, 'example.com', types.A)]
+        for i in range(100):
+            msg.an.append(
+                Record(name='example.com',
+                       qtype=types.A,
+                       ttl=60,
+                       data=create_rdata(types.A, '10.0.0.%d' % i)))
+        data = msg.pack(size_limit=512)
+        self.assertLessEqual(len(data), 512)
+        parsed = DNSMessage.parse(data)
+        self.assertEqual(parsed.tc, 1)
+        self.assertEqual(len(parsed.an), (512 - 29) // 16)
+
+    def test_address(self):
+        rdata = create_rdata(types.A, '1.2.3.4')
+        self.assertEqual(rdata.raw, b'\1\2\3\4')
+        self.assertEqual(rdata.data, '1.2.3.4')
+        self.assertEqual(rdata, create_rdata(types.A, b'\1\2\3\4'))
+        rdata = create_rdata(types.AAAA, '::1')
+        self.assertEqual(rdata.raw, b'\0' * 15 + b'\1')
+        self.assertEqual(rdata.data, '::1')
+        msg = DNSMessage.parse(RESPONSE_DATA)
+        self.assertEqual(msg.an[0].data.raw, b'\xcbb\x07A')
+        self.assertIn(b'\xcbb\x07A', msg.pack())
+        with self.assertRaises(ValueError):
+            create_rdata(types.AAAA, b'\1\2\3\4')
+        # an A record with 3 bytes of rdata
+        with self.assertRaises(ParseError):
+            DNSMessage.parse(RESPONSE_DATA[:-5] + b'\x03' +
+                             RESPONSE_DATA[-4:-1])
+
+    def test_slots(self):
+        for obj in (
+                DNSMessage(),
+                Record(data=create_rdata(types.A, '1.2.3.4')),
+                create_rdata(types.A, '1.2.3.4'),
+                create_rdata(types.CNAME, 'example.com'),
+                MX_RData(10, 'mail.example.com'),
+                SOA_RData('ns', 'admin', 1, 2, 3, 4, 5),
+        ):
+            self.assertFalse(hasattr(obj, '__dict__'), obj)
+        self.assertEqual(
+            MX_RData(10, 'mail.example.com').data, (10, 'mail.example.com'))
+
+    def test_memory_per_record(self):
+        class DictAddress:
+            def __init__(self, data):
+                self.data = data
+
+        class DictRecord:
+            def __init__(self, q, name, qtype, qclass, ttl, data, timestamp):
+                self.q = q
+                self.name = name
+                self.qtype = qtype
+                self.qclass = qclass
+                self.ttl = ttl
+                self.data = data
+                self.timestamp = timestamp
+
+        def measure(create, n=10000):
+            tracemalloc.start()
+            try:
+                before = tracemalloc.get_traced_memory()[0]
+                items = [create('10.0.%d.%d' % divmod(i, 256))
+                         for i in range(n)]
+                size = (tracemalloc.get_traced_memory()[0] - before) / n
+            finally:
+                tracemalloc.stop()
+            self.assertEqual(len(items), n)
+            return size
+
+        size = measure(lambda ip: Record(name='www.example.com',
+                                         qtype=types.A,
+                                         ttl=60,
+                                         data=create_rdata(types.A, ip)))
+        # the same fields in instance dicts with a text address
+        baseline = measure(lambda ip: DictRecord(
+            RESPONSE, 'www.example.com', types.A, 1, 60, DictAddress(ip),
+            int(time.time())))
+        # measured: ~205 and ~315 bytes per record
+        self.assertLess(size, baseline * 0.8)
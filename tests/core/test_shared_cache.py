@@ -0,0 +1,116 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from async_dns.core import SharedCache, create_rdata, types
+from async_dns.core.shared_cache import fcntl
+
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(self.path)
+        self.cache = SharedCache(self.path, slots=16, slot_size=256)
+
+    def tearDown(self):
+        self.cache.close()
+        os.remove(self.path)
+
+    def test_discard(self):
+        self.cache.add('www.fake.com', types.A, ('192.168.1.2', ))
+        self.cache.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        self.cache.discard('www.fake.com', types.A,
+                           [create_rdata(types.A, '192.168.1.2')])
+        self.assertEqual([
+            rec.data.data for rec in self.cache.query('www.fake.com', types.A)
+        ], ['8.8.8.8'])
+        self.cache.discard('www.fake.com', types.A,
+                           [create_rdata(types.A, '8.8.8.8')])
+        self.assertEqual(list(self.cache.query('www.fake.com', types.A)), [])
+
+    @unittest.skipIf(fcntl is None or not hasattr(os, 'fork'),
+                     'requires fcntl and fork')
+    def test_fork_lock(self):
+        ctx = multiprocessing.get_context('fork')
+        locked = ctx.Event()
+
+        def hold():
+            with self.cache._locked():
+                locked.set()
+                time.sleep(0.2)
+
+        # the cache is opened before the fork
+        process = ctx.Process(target=hold)
+        process.start()
+        try:
+            self.assertTrue(locked.wait(5))
+            start = time.monotonic()
+            with self.cache._locked():
+                waited = time.monotonic() - start
+        finally:
+            process.join()
+        self.assertEqual(process.exitcode, 0)
+        self.assertGreater(waited, 0.1)
+
+    def test_share(self):
+        self.cache.add('WWW.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        self.cache.add('www.fake.com', types.A, ('8.8.4.4', ), ttl=60)
+        self.cache.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        self.cache.add('fake.com', types.SOA, ('ns.fake.com', 'admin.fake.com',
+                                               1, 2, 3, 4, 5))
+        other = SharedCache(self.path)
+        try:
+            self.assertEqual(other.slots, 16)
+            records = list(other.query('www.fake.com', types.A))
+            self.assertEqual(sorted(rec.data.data for rec in records),
+                             ['8.8.4.4', '8.8.8.8'])
+            self.assertEqual(records[0].get_ttl(), 60)
+            soa = list(other.query('fake.com', types.ANY))[0]
+            self.assertEqual(soa.ttl, -1)
+            self.assertEqual(soa.data.mname, 'ns.fake.com')
+            other.remove('www.fake.com')
+        finally:
+            other.close()
+        self.assertEqual(list(self.cache.query('www.fake.com', types.A)), [])
+        self.assertEqual(self.cache.stats(), {
+            'entries': 1,
+            'records': 1,
+            'bytes': self.cache.stats()['bytes']
+        })
+
+    def test_replace(self):
+        for i in range(64):
+            self.cache.add('host%d.fake.com' % i, types.A, ('8.8.8.8', ),
+                           ttl=i + 10)
+        stats = self.cache.stats()
+        self.assertEqual(stats['entries'], 16)
+        # the record sets that expire later are kept
+        names = [rec.name for rec in self.cache.iter_values()]
+        self.assertIn('host63.fake.com', names)
+        self.assertEqual(len(list(self.cache.query('host63.fake.com',
+                                                   types.A))), 1)
+        self.cache.add('large.fake.com', types.TXT, ('x' * 250, ), ttl=60)
+        self.assertEqual(list(self.cache.query('large.fake.com', types.TXT)),
+                         [])
+
+    def test_stale(self):
+        self.cache.stale_ttl = 60
+        self.cache.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=10)
+        self.assertEqual(self.cache.hit('www.fake.com', types.A), 1)
+        self.assertEqual(self.cache.pop_hits('www.fake.com', types.A), 1)
+        now = time.time()
+        with patch('time.time', return_value=now + 30):
+            self.assertEqual(list(self.cache.query('www.fake.com', types.A)),
+                             [])
+            records = list(self.cache.query('www.fake.com', types.A, True))
+            self.assertEqual(records[0].data.data, '8.8.8.8')
+            self.cache.add('www.fake.com', types.A, ('8.8.4.4', ), ttl=10)
+            records = list(self.cache.query('www.fake.com', types.A, True))
+            self.assertEqual([rec.data.data for rec in records], ['8.8.4.4'])
+        with patch('time.time', return_value=now + 120):
+            self.assertEqual(
+                list(self.cache.query('www.fake.com', types.A, True)), [])
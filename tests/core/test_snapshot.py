@@ -0,0 +1,68 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from async_dns.core import (CacheNode, Record, create_rdata, load_snapshot,
+                            save_snapshot, types)
+from async_dns.core.util import ParseError
+from async_dns.server import schedule_snapshot
+
+from ..util import async_test
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        cache = CacheNode()
+        cache.add('localhost', types.A, ('127.0.0.1', ))
+        cache.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        cache.add('www.fake.com', types.AAAA, ('::1', ), ttl=60)
+        cache.add('fake.com', types.SOA, ('ns.fake.com', 'admin.fake.com', 1,
+                                          2, 3, 4, 5), ttl=60)
+        cache.add('*.fake.com', types.CNAME, ('www.fake.com', ), ttl=60)
+        cache.add('fake.com', types.TXT, ('hello', ), ttl=60)
+        record = Record(name='old.fake.com', qtype=types.A, ttl=10,
+                        data=create_rdata(types.A, '8.8.4.4'))
+        cache.add(record=record)
+        record.timestamp -= 20
+        self.assertEqual(save_snapshot(cache, self.path), 5)
+
+        loaded = CacheNode()
+        self.assertEqual(load_snapshot(loaded, self.path), 5)
+        self.assertEqual(
+            sorted((r.name, r.qtype, r.data.data) for r in loaded.iter_values()),
+            sorted((r.name, r.qtype, r.data.data) for r in cache.iter_values()
+                   if r.get_ttl() > 0))
+        record = list(loaded.query('any.fake.com', types.CNAME))[0]
+        self.assertEqual(record.data.data, 'www.fake.com')
+        self.assertGreater(record.get_ttl(), 55)
+
+    def test_invalid(self):
+        self.assertEqual(load_snapshot(CacheNode(), self.path), 0)
+        self.assertEqual(load_snapshot(CacheNode(), self.path + '.none'), 0)
+        with open(self.path, 'wb') as f:
+            f.write(b'invalid snapshot')
+        with self.assertRaises(ParseError):
+            load_snapshot(CacheNode(), self.path)
+
+    @async_test
+    async def test_schedule(self):
+        cache = CacheNode()
+        cache.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        os.remove(self.path)
+        handle = schedule_snapshot(cache, self.path, 0.01)
+        try:
+            for _ in range(100):
+                if os.path.exists(self.path):
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(load_snapshot(CacheNode(), self.path), 1)
+        finally:
+            handle.cancel()
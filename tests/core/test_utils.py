@@ -1,6 +1,7 @@
 import unittest
 
 from async_dns.core.util import (
+    Packer,
     get_bits,
     load_domain_name,
     pack_domain_name,
@@ -32,6 +33,16 @@ class TestUtils(unittest.TestCase):
             'd': 16
         })
 
+    def test_packer(self):
+        packer = Packer(4)
+        packer.reserve(2)
+        packer.write_name('www.example.com')
+        packer.write_name('mail.example.com')
+        packer.write_name('EXAMPLE.com')
+        self.assertEqual(
+            packer.getvalue(),
+            b'\0\0\3www\7example\3com\0\4mail\xc0\6\xc0\6')
+
     def test_pack_string(self):
         self.assertEqual(pack_string('hello'), b'\5hello')
         self.assertEqual(pack_string('hello', '!H'), b'\0\5hello')
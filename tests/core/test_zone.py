@@ -0,0 +1,77 @@
+import io
+import os
+import unittest
+
+from async_dns.core import Zone, ZoneError, parse_zone_file, types
+
+zone_file = os.path.join(os.path.dirname(__file__), '../fixtures/lan.zone')
+
+
+class TestZone(unittest.TestCase):
+    def setUp(self):
+        self.zone = Zone.load(zone_file)
+
+    def _answer(self, name, qtype):
+        rcode, an, ns = self.zone.query(name, qtype)
+        return rcode, [r.data.data for r in an], [r.qtype for r in ns]
+
+    def test_parse(self):
+        records = list(parse_zone_file(zone_file))
+        self.assertEqual(len(records), 12)
+        soa = records[0]
+        self.assertEqual(soa.name, 'lan')
+        self.assertEqual(soa.data.data, ('ns.lan', 'admin.lan', 2024010101,
+                                         3600, 600, 604800, 300))
+        self.assertEqual(soa.ttl, 3600)
+        aaaa = records[5]
+        self.assertEqual((aaaa.name, aaaa.qtype, aaaa.ttl),
+                         ('pi.lan', types.AAAA, 600))
+        self.assertEqual(records[-1].name, 'host.sub.lan')
+        self.assertEqual(self.zone.origin, 'lan')
+        self.assertEqual(len(self.zone), 12)
+
+    def test_query(self):
+        self.assertEqual(self._answer('PI.lan', types.A),
+                         (0, ['192.168.1.2'], []))
+        self.assertEqual(self._answer('lan', types.MX),
+                         (0, [(10, 'mail.lan')], []))
+        self.assertEqual(self._answer('txt.lan', types.TXT),
+                         (0, ['hello world'], []))
+        self.assertEqual(self._answer('_dns._tcp.srv.lan', types.SRV),
+                         (0, [(0, 5, 53, 'ns.lan')], []))
+        self.assertEqual(len(self._answer('pi.lan', types.ANY)[1]), 2)
+        # NODATA, also for names that only exist as parents
+        self.assertEqual(self._answer('pi.lan', types.MX),
+                         (0, [], [types.SOA]))
+        self.assertEqual(self._answer('sub.lan', types.A),
+                         (0, [], [types.SOA]))
+        self.assertEqual(self._answer('_tcp.srv.lan', types.A),
+                         (0, [], [types.SOA]))
+        # NXDOMAIN
+        self.assertEqual(self._answer('none.lan', types.A),
+                         (3, [], [types.SOA]))
+        self.assertEqual(self._answer('a.none.lan', types.A),
+                         (3, [], [types.SOA]))
+        _, _, ns = self.zone.query('none.lan', types.A)
+        self.assertEqual(ns[0].ttl, 300)
+        # wildcard
+        rcode, an, ns = self.zone.query('a.b.dev.lan', types.A)
+        self.assertEqual((an[0].name, an[0].qtype, an[0].data.data),
+                         ('a.b.dev.lan', types.CNAME, 'pi.lan'))
+        # out of zone
+        self.assertEqual(self.zone.query('www.example.com', types.A),
+                         (5, [], []))
+        self.assertEqual(self.zone.query('lan.com', types.A), (5, [], []))
+
+    def test_invalid(self):
+        for content in (
+                'www IN A 127.0.0.1\n',
+                '$ORIGIN lan.\n@ IN SOA ns admin (1 2 3 4\n',
+                '$ORIGIN lan.\n@ IN SOA ns admin 1 2 3 4 5\nwww IN A none\n',
+                '$ORIGIN lan.\n@ IN SOA ns admin 1 2 3 4 5\nwww CH A 1.1.1.1\n',
+                '$ORIGIN lan.\n@ IN SOA ns admin 1 2 3 4 5\n$INCLUDE other\n',
+                '$ORIGIN lan.\nwww IN A 127.0.0.1\n',
+                '$ORIGIN lan.\n@ IN SOA ns admin 1 2 3 4 5\nwww.example. A 1.1.1.1\n',
+        ):
+            with self.assertRaises(ZoneError):
+                Zone.load(io.StringIO(content))
@@ -0,0 +1,111 @@
+import struct
+import unittest
+
+from async_dns.core import Address, DNSMessage, Record, Zone, create_rdata, types
+from async_dns.request import util, xfr
+from tests.util import async_test
+
+from .util import MockConnection, MockConnectionHandle
+
+addr = Address.parse('tcp://192.168.1.1')
+
+
+def soa(serial):
+    return Record(name='lan',
+                  qtype=types.SOA,
+                  ttl=3600,
+                  data=create_rdata(types.SOA, 'ns.lan', 'admin.lan', serial,
+                                    3600, 600, 86400, 300))
+
+
+def a(name, ip):
+    return Record(name=name,
+                  qtype=types.A,
+                  ttl=300,
+                  data=create_rdata(types.A, ip))
+
+
+class TestXFR(unittest.TestCase):
+    def setUp(self):
+        self._conn = MockConnection()
+        MockConnectionHandle.conn = self._conn
+        xfr.ConnectionHandle = MockConnectionHandle
+
+    def tearDown(self):
+        xfr.ConnectionHandle = util.ConnectionHandle
+
+    def _feed(self, *messages):
+        for records in messages:
+            msg = DNSMessage(aa=1)
+            msg.an = list(records)
+            data = msg.pack()
+            self._conn.reader.feed(struct.pack('!H', len(data)))
+            self._conn.reader.feed(data)
+
+    def _request(self):
+        data = self._conn.writer.buffer.getvalue()
+        return DNSMessage.parse(data[2:])
+
+    def _data(self, zone, name):
+        _, an, _ = zone.query(name, types.A)
+        return [r.data.data for r in an]
+
+    @async_test
+    async def test_axfr(self):
+        hosts = [a('host%d.lan' % i, '10.0.0.%d' % i) for i in range(100)]
+        self._feed([soa(1)] + hosts[:60], hosts[60:], [soa(1)])
+        zone = await xfr.transfer_zone(addr, 'lan')
+        self.assertEqual(self._request().qd[0].qtype, types.AXFR)
+        self.assertEqual(len(zone), 101)
+        self.assertEqual(zone.soa.data.serial, 1)
+        self.assertEqual(self._data(zone, 'host99.lan'), ['10.0.0.99'])
+
+    @async_test
+    async def test_iter_transfer(self):
+        self._feed([soa(1), a('pi.lan', '10.0.0.1')], [soa(1)])
+        records = [
+            r async for r in xfr.iter_transfer(addr, 'lan', types.AXFR)
+        ]
+        self.assertEqual([r.qtype for r in records],
+                         [types.SOA, types.A, types.SOA])
+
+    @async_test
+    async def test_ixfr(self):
+        zone = Zone('lan')
+        for record in (soa(1), a('pi.lan', '10.0.0.1'),
+                       a('old.lan', '10.0.0.2')):
+            zone.add(record)
+        self._feed(
+            [soa(3), soa(1), a('old.lan', '10.0.0.2'), soa(2)],
+            [a('pi.lan', '10.0.0.3'), soa(2), a('pi.lan', '10.0.0.1')],
+            [soa(3), a('new.lan', '10.0.0.4'), soa(3)],
+        )
+        self.assertIs(await xfr.transfer_zone(addr, zone), zone)
+        request = self._request()
+        self.assertEqual(request.qd[0].qtype, types.IXFR)
+        self.assertEqual(request.ns[0].data.serial, 1)
+        self.assertEqual(zone.soa.data.serial, 3)
+        self.assertEqual(self._data(zone, 'pi.lan'), ['10.0.0.3'])
+        self.assertEqual(self._data(zone, 'new.lan'), ['10.0.0.4'])
+        self.assertEqual(zone.query('old.lan', types.A)[0], 3)
+        self.assertEqual(len(zone), 3)
+
+    @async_test
+    async def test_ixfr_up_to_date(self):
+        zone = Zone('lan')
+        zone.add(soa(3))
+        self._feed([soa(3)])
+        await xfr.transfer_zone(addr, zone)
+        self.assertEqual(zone.soa.data.serial, 3)
+
+    @async_test
+    async def test_ixfr_full(self):
+        zone = Zone('lan')
+        zone.add(soa(1))
+        zone.add(a('old.lan', '10.0.0.2'))
+        self._feed([soa(2), a('pi.lan', '10.0.0.1'), soa(2)])
+        await xfr.transfer_zone(addr, zone)
+        self.assertEqual(zone.soa.data.serial, 2)
+        self.assertEqual(self._data(zone, 'pi.lan'), ['10.0.0.1'])
+        self.assertEqual(zone.query('old.lan', types.A)[0], 3)
+        self.assertEqual(len(zone), 2)
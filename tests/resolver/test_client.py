@@ -1,6 +1,8 @@
+import asyncio
 from unittest import TestCase
+from unittest.mock import patch
 
-from async_dns.core import Address, types
+from async_dns.core import Address, DNSMessage, types
 from async_dns.request import clean
 from async_dns.resolver import DNSClient
 
@@ -16,3 +18,75 @@ class TestClient(TestCase):
         dns = DNSClient()
         res = await dns.query('gmail.com', types.A, Address.parse('8.8.8.8'))
         self.assertEqual(res.qd[0].name, 'gmail.com')
+
+    @async_test
+    async def test_edns(self):
+        requests = []
+
+        async def fake_request(req, addr, timeout):
+            requests.append(req)
+            res = DNSMessage(qid=req.qid)
+            res.qd = req.qd
+            return res
+
+        with patch.dict(DNSClient.protocols, {'udp': fake_request}):
+            await DNSClient(edns_size=4096).query('gmail.com', types.A,
+                                                  Address.parse('8.8.8.8'))
+            await DNSClient(edns_size=None).query('gmail.com', types.A,
+                                                  Address.parse('8.8.8.8'))
+        self.assertEqual(requests[0].udp_size, 4096)
+        self.assertIsNone(requests[1].opt)
+
+    @async_test
+    async def test_truncated(self):
+        requests = []
+
+        def make_request(protocol, tc):
+            async def fake_request(req, addr, timeout):
+                requests.append((protocol, str(addr)))
+                res = DNSMessage(qid=req.qid, tc=tc)
+                res.qd = req.qd
+                return res
+
+            return fake_request
+
+        with patch.dict(DNSClient.protocols, {
+                'udp': make_request('udp', 1),
+                'tcp': make_request('tcp', 0),
+        }):
+            dns = DNSClient()
+            addr = Address.parse('8.8.8.8')
+            res = await dns.query('gmail.com', types.TXT, addr)
+            self.assertEqual(res.tc, 0)
+            await dns.query('gmail.com', types.TXT, addr)
+            await dns.query('gmail.com', types.A, addr)
+        self.assertEqual(requests, [
+            ('udp', 'udp://8.8.8.8:53'),
+            ('tcp', 'tcp://8.8.8.8:53'),
+            ('tcp', 'tcp://8.8.8.8:53'),
+            ('udp', 'udp://8.8.8.8:53'),
+            ('tcp', 'tcp://8.8.8.8:53'),
+        ])
+
+    @async_test
+    async def test_timeout(self):
+        requests = []
+
+        async def fake_request(req, addr, timeout):
+            requests.append(req)
+            await asyncio.sleep(0.05)
+            res = DNSMessage(qid=req.qid)
+            res.qd = req.qd
+            return res
+
+        with patch.dict(DNSClient.protocols, {'udp': fake_request}):
+            dns = DNSClient()
+            addr = Address.parse('8.8.8.8')
+            first = asyncio.ensure_future(dns.query('gmail.com', types.A,
+                                                    addr))
+            with self.assertRaises(asyncio.TimeoutError):
+                await dns.query('gmail.com', types.A, addr, timeout=0.01)
+            res = await first
+        # the request is shared and not cancelled by the impatient caller
+        self.assertEqual(res.qd[0].name, 'gmail.com')
+        self.assertEqual(len(requests), 1)
@@ -1,7 +1,10 @@
+import asyncio
+import os
+import tempfile
 import unittest
 from unittest.mock import patch
 
-from async_dns.core import DNSMessage, Record, types
+from async_dns.core import Blocklist, CacheNode, DNSMessage, HostsDB, Record, SharedCache, Zone, compile_hosts_db, create_rdata, types
 from async_dns.resolver import ProxyResolver
 
 from ..util import async_test
@@ -52,3 +55,339 @@ class TestResolver(unittest.TestCase):
         self.assertTrue(second_from_cache)
         self.assertEqual(len(calls), 1)
         self.assertEqual(len(list(resolver.cache.query('www.baidu.com', types.A))), 1)
+
+    @async_test
+    async def test_query_caches_negative_answers(self):
+        resolver = ProxyResolver()
+        calls = []
+
+        async def fake_request(fqdn, qtype, *args):
+            calls.append(fqdn)
+            msg = DNSMessage(qid=0)
+            msg.ra = 1
+            msg.r = 3 if fqdn == 'nx.baidu.com' else 0
+            msg.qd = [Record(name=fqdn, qtype=qtype)]
+            msg.ns = [
+                Record(name='baidu.com',
+                       qtype=types.SOA,
+                       ttl=600,
+                       data=create_rdata(types.SOA, 'ns.baidu.com',
+                                         'admin.baidu.com', 1, 2, 3, 4, 60))
+            ]
+            return msg
+
+        with patch.object(resolver, 'request', new=fake_request):
+            for _ in range(2):
+                res, _ = await resolver.query('nx.baidu.com', types.A)
+                self.assertEqual(res.r, 3)
+                self.assertEqual(res.ns[0].qtype, types.SOA)
+            res, from_cache = await resolver.query('nx.baidu.com', types.AAAA)
+            self.assertEqual(res.r, 3)
+            self.assertTrue(from_cache)
+            for _ in range(2):
+                res, _ = await resolver.query('www.baidu.com', types.AAAA)
+                self.assertEqual(res.r, 0)
+                self.assertEqual(res.an, [])
+            self.assertEqual(res.ns[0].ttl, 60)
+            await resolver.query('www.baidu.com', types.A)
+
+        self.assertEqual(calls, ['nx.baidu.com', 'www.baidu.com', 'www.baidu.com'])
+
+    @async_test
+    async def test_prefetch_popular_answers(self):
+        resolver = ProxyResolver()
+        record = self._make_response().an[0]
+        resolver.cache.add(record=record)
+        calls = []
+
+        async def fake_request(*args, **kwargs):
+            calls.append(args)
+            return self._make_response()
+
+        with patch.object(resolver, 'request', new=fake_request):
+            for _ in range(2):
+                _, from_cache = await resolver.query('www.baidu.com', types.A)
+                self.assertTrue(from_cache)
+            record.timestamp -= 57
+            await resolver.query('www.baidu.com', types.A)
+            await asyncio.sleep(0.01)
+            self.assertEqual(len(calls), 1)
+            await resolver.query('www.baidu.com', types.A)
+            await asyncio.sleep(0.01)
+
+        self.assertEqual(len(calls), 1)
+
+    def _make_stale_resolver(self):
+        resolver = ProxyResolver(cache=CacheNode(stale_ttl=3600))
+        record = Record(name='www.baidu.com', qtype=types.A, ttl=60,
+                        data=create_rdata(types.A, '1.2.3.4'))
+        resolver.cache.add(record=record)
+        record.timestamp -= 120
+        resolver.cache.get('www.baidu.com').update_expires(types.A)
+        return resolver
+
+    @async_test
+    async def test_serve_stale_on_failure(self):
+        resolver = self._make_stale_resolver()
+
+        async def fake_request(*args, **kwargs):
+            raise ConnectionError
+
+        with patch.object(resolver, 'request', new=fake_request):
+            res, from_cache = await resolver.query('www.baidu.com', types.A)
+
+        self.assertTrue(from_cache)
+        self.assertEqual(res.an[0].data.data, '1.2.3.4')
+        self.assertEqual(res.an[0].ttl, resolver.stale_answer_ttl)
+
+    @async_test
+    async def test_serve_stale_on_timeout(self):
+        resolver = self._make_stale_resolver()
+        resolver.stale_timeout = 0.01
+
+        async def fake_request(fqdn, qtype, *args):
+            await asyncio.sleep(0.05)
+            msg = self._make_response()
+            msg.an[0].data = create_rdata(types.A, '5.6.7.8')
+            return msg
+
+        with patch.object(resolver, 'request', new=fake_request):
+            res, _ = await resolver.query('www.baidu.com', types.A)
+            self.assertEqual(res.an[0].data.data, '1.2.3.4')
+            await asyncio.sleep(0.1)
+
+        records = list(resolver.cache.query('www.baidu.com', types.A, True))
+        self.assertEqual([rec.data.data for rec in records], ['5.6.7.8'])
+
+    @async_test
+    async def test_shared_cache(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        os.remove(path)
+        caches = [SharedCache(path, slots=64), SharedCache(path)]
+        try:
+            resolvers = [ProxyResolver(cache=cache) for cache in caches]
+            fake_response = self._make_response()
+            fake_response.an[0].data = create_rdata(types.A, '1.2.3.4')
+            calls = []
+
+            async def fake_request(*args, **kwargs):
+                calls.append(args)
+                return fake_response
+
+            with patch.object(resolvers[0], 'request', new=fake_request):
+                _, from_cache = await resolvers[0].query('www.baidu.com',
+                                                         types.A)
+            self.assertFalse(from_cache)
+            res, from_cache = await resolvers[1].query('www.baidu.com',
+                                                       types.A)
+            self.assertTrue(from_cache)
+            self.assertEqual(res.an[0].data.data, '1.2.3.4')
+            self.assertEqual(len(calls), 1)
+        finally:
+            for cache in caches:
+                cache.close()
+            os.remove(path)
+
+    @async_test
+    async def test_blocklist(self):
+        blocklist = Blocklist()
+        blocklist.add('*.ads.com')
+        blocklist.add('nx.ads.com', Blocklist.NXDOMAIN)
+        blocklist.add('ok.ads.com', Blocklist.ALLOW)
+        resolver = ProxyResolver(blocklist=blocklist)
+        calls = []
+
+        async def fake_request(*args, **kwargs):
+            calls.append(args)
+            return self._make_response('ok.ads.com')
+
+        with patch.object(resolver, 'request', new=fake_request):
+            res, from_cache = await resolver.query('www.ads.com', types.A)
+            self.assertTrue(from_cache)
+            self.assertEqual(res.an[0].data.data, '0.0.0.0')
+            res, _ = await resolver.query('nx.ads.com', types.A)
+            self.assertEqual(res.r, 3)
+            self.assertEqual(res.an, [])
+            await resolver.query('ok.ads.com', types.A)
+
+        self.assertEqual(len(calls), 1)
+
+    @async_test
+    async def test_hosts_db(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        compile_hosts_db([
+            ('static.lan', types.A, ('192.168.1.2', )),
+            ('alias.lan', types.CNAME, ('static.lan', )),
+        ], path)
+        hosts_db = HostsDB(path)
+        resolver = ProxyResolver(hosts_db=hosts_db)
+        calls = []
+
+        async def fake_request(*args, **kwargs):
+            calls.append(args)
+            return self._make_response('static.lan', types.AAAA)
+
+        try:
+            with patch.object(resolver, 'request', new=fake_request):
+                res, from_cache = await resolver.query('alias.lan', types.A)
+                self.assertTrue(from_cache)
+                self.assertEqual([r.data.data for r in res.an],
+                                 ['static.lan', '192.168.1.2'])
+                res, from_cache = await resolver.query('static.lan',
+                                                       types.AAAA)
+                self.assertFalse(from_cache)
+        finally:
+            hosts_db.close()
+            os.remove(path)
+
+        self.assertEqual(len(calls), 1)
+
+    @async_test
+    async def test_zone(self):
+        resolver = ProxyResolver()
+        resolver.add_zone(
+            Zone.load(
+                os.path.join(os.path.dirname(__file__),
+                             '../fixtures/lan.zone')))
+        calls = []
+
+        async def fake_request(fqdn, qtype, addr):
+            calls.append(fqdn)
+            return self._make_response(fqdn)
+
+        with patch.object(resolver, 'request', new=fake_request):
+            res, from_cache = await resolver.query('x.dev.lan', types.A)
+            self.assertTrue(from_cache)
+            self.assertEqual(res.aa, 1)
+            self.assertEqual([r.data.data for r in res.an],
+                             ['pi.lan', '192.168.1.2'])
+            res, _ = await resolver.query('none.lan', types.A)
+            self.assertEqual((res.r, res.an), (3, []))
+            self.assertEqual(res.ns[0].qtype, types.SOA)
+            res, _ = await resolver.query('pi.lan', types.MX)
+            self.assertEqual((res.r, res.an), (0, []))
+            self.assertEqual(res.ns[0].qtype, types.SOA)
+            # CNAME records out of the zone are followed upstream
+            res, from_cache = await resolver.query('www.lan', types.A)
+            self.assertFalse(from_cache)
+            self.assertEqual([r.qtype for r in res.an],
+                             [types.CNAME, types.A])
+
+        self.assertEqual(calls, ['www.example.com'])
+
+    @async_test
+    async def test_coalesce(self):
+        resolvers = [ProxyResolver(proxies=['8.8.8.8']) for _ in range(2)]
+        calls = []
+
+        async def fake_request(fqdn, qtype, addr):
+            calls.append(fqdn)
+            await asyncio.sleep(0.01)
+            return self._make_response(fqdn)
+
+        for resolver in resolvers:
+            resolver.request = fake_request
+        await asyncio.gather(
+            resolvers[0].query('www.example.com', types.A),
+            resolvers[0].query('www.example.com', types.A),
+            resolvers[1].query('www.example.com', types.A),
+        )
+        # questions are only shared within one resolver
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(resolvers[0].coalescer.coalesced, 1)
+
+    @async_test
+    async def test_coalesce_timeout(self):
+        resolver = ProxyResolver(proxies=['8.8.8.8'])
+        calls = []
+
+        async def fake_request(fqdn, qtype, addr):
+            calls.append(fqdn)
+            await asyncio.sleep(0.05)
+            return self._make_response(fqdn)
+
+        resolver.request = fake_request
+        first = asyncio.ensure_future(
+            resolver.query('www.example.com', types.A))
+        await asyncio.sleep(0)
+        # each caller waits for the shared query with its own timeout
+        resolver.query_timeout = 0.01
+        with self.assertRaises(asyncio.TimeoutError):
+            await resolver.query('www.example.com', types.A)
+        res, from_cache = await first
+        self.assertFalse(from_cache)
+        self.assertEqual(res.an[0].name, 'www.example.com')
+        self.assertEqual(calls, ['www.example.com'])
+        self.assertEqual(resolver.coalescer.coalesced, 1)
+
+    def _make_hedge_resolver(self, delays):
+        resolver = ProxyResolver(proxies=list(delays))
+        resolver.hedge_delay = 0.01
+        calls = []
+        cancelled = []
+
+        async def fake_request(fqdn, qtype, addr):
+            host = addr.hostinfo.hostname
+            calls.append(host)
+            delay = delays[host]
+            if delay is None:
+                raise ConnectionError
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                cancelled.append(host)
+                raise
+            return self._make_response(fqdn)
+
+        resolver.request = fake_request
+        return resolver, calls, cancelled
+
+    @async_test
+    async def test_hedge(self):
+        resolver, calls, cancelled = self._make_hedge_resolver({
+            '1.1.1.1': 1,
+            '2.2.2.2': 0,
+        })
+        res, from_cache = await resolver.query('www.example.com', types.A)
+        self.assertFalse(from_cache)
+        self.assertEqual(res.an[0].name, 'www.example.com')
+        self.assertEqual(calls, ['1.1.1.1', '2.2.2.2'])
+        self.assertEqual(cancelled, ['1.1.1.1'])
+        self.assertEqual(resolver.hedge_budget.hedged, 1)
+        # the cancelled request is recorded with its elapsed time
+        samples = {
+            addr.hostinfo.hostname: list(rtts)
+            for addr, rtts in resolver.rtt.samples.items()
+        }
+        self.assertEqual(len(samples['1.1.1.1']), 1)
+        self.assertLess(samples['2.2.2.2'][0], samples['1.1.1.1'][0])
+
+    @async_test
+    async def test_hedge_budget(self):
+        resolver, calls, _ = self._make_hedge_resolver({
+            '1.1.1.1': 0.05,
+            '2.2.2.2': 0,
+        })
+        resolver.hedge_budget.tokens = 0
+        await resolver.query('www.example.com', types.A)
+        self.assertEqual(calls, ['1.1.1.1'])
+
+    @async_test
+    async def test_hedge_failover(self):
+        resolver, calls, _ = self._make_hedge_resolver({
+            '1.1.1.1': None,
+            '2.2.2.2': 0,
+        })
+        resolver.hedge_budget.tokens = 0
+        res, _ = await resolver.query('www.example.com', types.A)
+        self.assertEqual(res.an[0].name, 'www.example.com')
+        self.assertEqual(calls, ['1.1.1.1', '2.2.2.2'])
+
+        resolver, _, _ = self._make_hedge_resolver({
+            '1.1.1.1': None,
+            '2.2.2.2': None,
+        })
+        with self.assertRaises(ConnectionError):
+            await resolver.query('www.example.com', types.A)
@@ -0,0 +1,59 @@
+import unittest
+
+from async_dns.resolver import ProxyResolver
+from async_dns.resolver.routing import RoutingTable
+
+
+class TestRoutingTable(unittest.TestCase):
+    def test_longest_match(self):
+        table = RoutingTable('default')
+        table.update([
+            ('*.lan', 'lan'),
+            ('*.home.lan', 'home'),
+            ('pi.home.lan', 'pi'),
+            ('home.lan', 'exact'),
+            (lambda d: d.endswith('.local'), 'local'),
+            (lambda d: d.startswith('pi.'), 'callable'),
+        ])
+        self.assertEqual(len(table), 6)
+        self.assertEqual(table.get('nas.lan'), 'lan')
+        self.assertEqual(table.get('a.b.home.lan'), 'home')
+        self.assertEqual(table.get('PI.home.lan.'), 'pi')
+        self.assertEqual(table.get('home.lan'), 'exact')
+        self.assertEqual(table.get('printer.local'), 'local')
+        self.assertEqual(table.get('pi.example.com'), 'callable')
+        self.assertEqual(table.get('lan'), 'default')
+        self.assertEqual(table.get('example.com'), 'default')
+
+    def test_replace(self):
+        table = RoutingTable()
+        table.add('*.lan', 1)
+        table.add('*.lan', 2)
+        self.assertEqual(len(table), 1)
+        self.assertEqual(table.get('pi.lan'), 2)
+        self.assertIsNone(table.get('example.com'))
+
+
+class TestProxyRoutes(unittest.TestCase):
+    def test_routes(self):
+        resolver = ProxyResolver(proxies=[
+            ('*.lan', ['192.168.1.1']),
+            ('pi.lan', ['192.168.1.2']),
+            ('*.home', ['192.168.1.1']),
+            '8.8.8.8',
+        ])
+        lan = resolver._get_nameservers('nas.lan')
+        self.assertEqual([str(addr) for addr in lan.iter()],
+                         ['udp://192.168.1.1:53'])
+        self.assertIs(resolver._get_nameservers('nas.home'), lan)
+        self.assertEqual(
+            [str(addr) for addr in resolver._get_nameservers('pi.lan').iter()],
+            ['udp://192.168.1.2:53'])
+        self.assertEqual([
+            str(addr)
+            for addr in resolver._get_nameservers('example.com').iter()
+        ], ['udp://8.8.8.8:53'])
+
+    def test_no_fallback(self):
+        resolver = ProxyResolver(proxies=[('*.lan', ['192.168.1.1'])])
+        self.assertFalse(resolver._get_nameservers('example.com'))
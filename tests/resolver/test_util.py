@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+
+from async_dns.resolver.util import Coalescer, HedgeBudget, RTTStats
+
+from ..util import async_test
+
+
+class TestCoalescer(unittest.TestCase):
+    @async_test
+    async def test_coalesce(self):
+        coalescer = Coalescer()
+        calls = []
+
+        async def work(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(
+            coalescer.run('a', lambda: work(1)),
+            coalescer.run('a', lambda: work(2)),
+            coalescer.run('b', lambda: work(3)),
+        )
+        self.assertEqual(results, [1, 1, 3])
+        self.assertEqual(calls, [1, 3])
+        self.assertEqual(coalescer.stats(), {
+            'started': 2,
+            'coalesced': 1,
+            'in_flight': 0,
+        })
+
+    @async_test
+    async def test_cancel(self):
+        coalescer = Coalescer()
+        cancelled = []
+
+        async def work():
+            try:
+                await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return 'done'
+
+        first = asyncio.ensure_future(coalescer.run('a', work))
+        second = asyncio.ensure_future(coalescer.run('a', work))
+        with self.assertRaises(asyncio.TimeoutError):
+            await coalescer.run('a', work, timeout=0.01)
+        first.cancel()
+        self.assertEqual(await second, 'done')
+        self.assertTrue(first.cancelled())
+        self.assertEqual(cancelled, [])
+
+        # the work is cancelled when all callers are gone
+        task = asyncio.ensure_future(coalescer.run('a', work))
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(len(coalescer), 0)
+
+
+class TestRTTStats(unittest.TestCase):
+    def test_percentile(self):
+        stats = RTTStats(window=10, size=2)
+        for i in range(4):
+            stats.add('a', i)
+        self.assertIsNone(stats.percentile('a'))
+        for i in range(4, 20):
+            stats.add('a', i)
+        # only the last 10 samples are kept
+        self.assertEqual(stats.percentile('a'), 19)
+        self.assertEqual(stats.percentile('a', 0.5), 15)
+        stats.add('b', 1)
+        stats.add('c', 1)
+        self.assertEqual(list(stats.samples), ['b', 'c'])
+
+
+class TestHedgeBudget(unittest.TestCase):
+    def test_budget(self):
+        budget = HedgeBudget(ratio=0.5, burst=1)
+        self.assertTrue(budget.take())
+        self.assertFalse(budget.take())
+        budget.request()
+        self.assertFalse(budget.take())
+        budget.request()
+        budget.request()
+        budget.request()
+        self.assertTrue(budget.take())
+        self.assertFalse(budget.take())
+        self.assertEqual((budget.requests, budget.hedged), (4, 2))
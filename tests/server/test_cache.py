@@ -0,0 +1,191 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import patch
+
+from async_dns.core import CacheNode, DNSMessage, REQUEST, Record, types
+from async_dns.core.record import create_rdata
+from async_dns.resolver import ProxyResolver
+from async_dns.server import ResponseCache, handle_dns
+
+from ..util import async_test
+
+
+class FakeResolver:
+    def __init__(self, size=1):
+        self.calls = 0
+        self.size = size
+        self.cache = CacheNode()
+
+    async def query(self, fqdn, qtype):
+        self.calls += 1
+        msg = DNSMessage()
+        msg.qd.append(Record(REQUEST, fqdn, qtype))
+        for i in range(self.size):
+            msg.an.append(
+                Record(name=fqdn,
+                       qtype=qtype,
+                       ttl=300,
+                       data=create_rdata(types.A, '10.0.0.%d' % i)))
+        return msg, False
+
+
+def make_request(qid, name='www.example.com', edns_size=None):
+    req = DNSMessage(qr=REQUEST, qid=qid)
+    req.qd.append(Record(REQUEST, name, types.A))
+    if edns_size:
+        req.set_edns(edns_size)
+    return req.pack()
+
+
+async def collect(*k):
+    return [bytes(data) async for data in handle_dns(*k)]
+
+
+class TestResponseCache(unittest.TestCase):
+    @async_test
+    async def test_hit(self):
+        resolver = FakeResolver()
+        cache = ResponseCache(max_ttl=3600)
+        addr = '127.0.0.1', 53
+        first, = await collect(resolver, make_request(1), addr, 'udp', cache)
+        with patch('time.time', return_value=time.time() + 100):
+            second, = await collect(resolver, make_request(2), addr, 'udp',
+                                    cache)
+        self.assertEqual(resolver.calls, 1)
+        self.assertEqual(len(cache), 1)
+        first, second = DNSMessage.parse(first), DNSMessage.parse(second)
+        self.assertEqual((first.qid, second.qid), (1, 2))
+        self.assertEqual(first.an[0].ttl, 300)
+        self.assertIn(second.an[0].ttl, (199, 200, 201))
+        self.assertEqual(second.an[0].data, first.an[0].data)
+
+    @async_test
+    async def test_edns(self):
+        resolver = FakeResolver(50)
+        addr = '127.0.0.1', 53
+        result, = await collect(resolver, make_request(1), addr, 'udp')
+        msg = DNSMessage.parse(result)
+        self.assertEqual((msg.tc, msg.opt), (1, None))
+        result, = await collect(resolver, make_request(1, edns_size=4096),
+                                addr, 'udp')
+        msg = DNSMessage.parse(result)
+        self.assertEqual((msg.tc, len(msg.an), msg.udp_size), (0, 50, 1232))
+        # limited by the server
+        resolver.size = 200
+        result, = await collect(resolver, make_request(1, edns_size=4096),
+                                addr, 'udp')
+        self.assertLessEqual(len(result), 1232)
+        msg = DNSMessage.parse(result)
+        self.assertEqual(msg.tc, 1)
+        self.assertIsNotNone(msg.opt)
+
+    @async_test
+    async def test_edns_flags(self):
+        resolver = FakeResolver()
+        cache = ResponseCache()
+        addr = '127.0.0.1', 53
+        req = DNSMessage(qr=REQUEST, qid=1)
+        req.qd.append(Record(REQUEST, 'www.example.com', types.A))
+        req.set_edns(4096, do=1)
+        result, = await collect(resolver, req.pack(), addr, 'udp', cache)
+        self.assertEqual(DNSMessage.parse(result).edns_do, 1)
+        # the DO bit is part of the cache key
+        result, = await collect(resolver, make_request(2, edns_size=4096),
+                                addr, 'udp', cache)
+        self.assertEqual(DNSMessage.parse(result).edns_do, 0)
+        self.assertEqual(resolver.calls, 2)
+
+        req.ar = [Record.create_opt(4096, version=1)]
+        result, = await collect(resolver, req.pack(), addr, 'udp', cache)
+        msg = DNSMessage.parse(result)
+        self.assertEqual((msg.rcode, msg.edns_version, msg.an), (16, 0, []))
+        self.assertEqual(msg.qd[0].name, 'www.example.com')
+        self.assertEqual(resolver.calls, 2)
+
+    @async_test
+    async def test_key(self):
+        resolver = FakeResolver()
+        cache = ResponseCache()
+        addr = '127.0.0.1', 53
+        await collect(resolver, make_request(1), addr, 'udp', cache)
+        await collect(resolver, make_request(1), addr, 'tcp', cache)
+        await collect(resolver, make_request(1, 'example.com'), addr, 'udp',
+                      cache)
+        self.assertEqual(resolver.calls, 3)
+
+    @async_test
+    async def test_echo_question(self):
+        resolver = FakeResolver()
+        cache = ResponseCache()
+        addr = '127.0.0.1', 53
+        await collect(resolver, make_request(1), addr, 'udp', cache)
+        data = make_request(2).replace(b'www\7example', b'WWW\7Example')
+        result, = await collect(resolver, data, addr, 'udp', cache)
+        self.assertEqual(resolver.calls, 1)
+        self.assertIn(b'\3WWW\7Example\3com\0', result)
+
+    def test_invalidate(self):
+        resolver = ProxyResolver(proxies=[])
+        cache = ResponseCache()
+        resolver.invalidation_callbacks.append(cache.invalidate)
+        ttls = [(0, 300)]
+        cache.put(('www.example.com', types.A), b'www', ttls,
+                  ['cdn.example.net'])
+        cache.put(('www.example.com', types.AAAA), b'www6', ttls)
+        cache.put(('example.com', types.A), b'example', ttls)
+        resolver.invalidate('cdn.example.net')
+        self.assertEqual(len(cache), 2)
+        resolver.invalidate('WWW.example.com.', types.A)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.names, {'example.com': {('example.com', 1)}})
+        # replaced and evicted responses leave no names behind
+        cache.max_size = 1
+        cache.put(('example.com', types.A), b'example', ttls, ['a.com'])
+        cache.put(('b.com', types.A), b'b', ttls)
+        self.assertEqual(cache.names, {'b.com': {('b.com', 1)}})
+
+    @async_test
+    async def test_stale(self):
+        resolver = ProxyResolver(proxies=['8.8.8.8'],
+                                 cache=CacheNode(stale_ttl=3600))
+        resolver.stale_timeout = 0.01
+        record = Record(name='www.example.com', qtype=types.A, ttl=60,
+                        data=create_rdata(types.A, '1.2.3.4'))
+        resolver.cache.add(record=record)
+        record.timestamp -= 120
+        resolver.cache.get('www.example.com').update_expires(types.A)
+        cache = ResponseCache()
+        resolver.invalidation_callbacks.append(cache.invalidate)
+
+        async def fake_request(fqdn, qtype, addr):
+            await asyncio.sleep(0.05)
+            msg = DNSMessage(qid=0, ra=1)
+            msg.qd.append(Record(REQUEST, fqdn, qtype))
+            msg.an.append(
+                Record(name=fqdn, qtype=qtype, ttl=300,
+                       data=create_rdata(types.A, '5.6.7.8')))
+            return msg
+
+        resolver.request = fake_request
+        addr = '127.0.0.1', 53
+        result, = await collect(resolver, make_request(1), addr, 'udp', cache)
+        self.assertEqual(DNSMessage.parse(result).an[0].data.data, '1.2.3.4')
+        self.assertEqual(len(cache), 1)
+        # the refresh in background replaces the stale response
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(cache), 0)
+        result, = await collect(resolver, make_request(2), addr, 'udp', cache)
+        self.assertEqual(DNSMessage.parse(result).an[0].data.data, '5.6.7.8')
+
+    def test_pack_keeps_ttl(self):
+        record = Record(name='example.com',
+                        qtype=types.A,
+                        ttl=60,
+                        data=create_rdata(types.A, '1.2.3.4'))
+        record.timestamp -= 10
+        msg = DNSMessage()
+        msg.an.append(record)
+        self.assertEqual(DNSMessage.parse(msg.pack()).an[0].ttl, 50)
+        self.assertEqual(record.ttl, 60)
+        self.assertEqual(record.copy().get_ttl(), 50)
@@ -0,0 +1,175 @@
+import asyncio
+import io
+import os
+import tempfile
+import unittest
+
+from async_dns.core import types
+from async_dns.resolver import ProxyResolver
+from async_dns.server import FileWatcher, HostsReloader, ResponseCache, watch_proxies, watch_zone
+
+from ..util import async_test
+
+
+class TestReload(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _write(self, content):
+        with open(self.path, 'w') as f:
+            f.write(content)
+        # make sure the change is detected on file systems with coarse mtime
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    def _query(self, resolver, name, qtype=types.A):
+        return sorted(r.data.data for r in resolver.cache.query(name, qtype))
+
+    def test_hosts(self):
+        resolver = ProxyResolver(proxies=['8.8.8.8'])
+        resolver.cache.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        response_cache = ResponseCache()
+        response_cache.put(('pi3.lan', types.A), b'pi3', [])
+        response_cache.put(('red.pi', types.A), b'red', [])
+        reloader = HostsReloader(resolver, self.path, response_cache)
+        self._write('192.168.1.2 pi3.lan red.pi\n::1 pi3.lan\n')
+        self.assertEqual(reloader.load(), 3)
+        self.assertEqual(self._query(resolver, 'red.pi'), ['192.168.1.2'])
+        self.assertEqual(len(response_cache), 0)
+
+        response_cache.put(('pi3.lan', types.A), b'pi3', [])
+        response_cache.put(('red.pi', types.A), b'red', [])
+        self._write('192.168.1.2 red.pi\n192.168.1.3 pi3.lan\n'
+                    '192.168.1.4 pi3.lan\n')
+        self.assertEqual(reloader.load(), 2)
+        self.assertEqual(self._query(resolver, 'pi3.lan'),
+                         ['192.168.1.3', '192.168.1.4'])
+        self.assertEqual(self._query(resolver, 'pi3.lan', types.AAAA), [])
+        self.assertEqual(self._query(resolver, 'red.pi'), ['192.168.1.2'])
+        self.assertEqual(self._query(resolver, 'www.fake.com'), ['8.8.8.8'])
+        self.assertEqual(len(response_cache), 1)
+
+        self.assertEqual(reloader.load(), 0)
+
+    def test_hosts_keep_upstream(self):
+        resolver = ProxyResolver(proxies=['8.8.8.8'])
+        reloader = HostsReloader(resolver, self.path)
+        self._write('192.168.1.2 www.fake.com\n')
+        reloader.load()
+        resolver.cache.add('www.fake.com', types.A, ('8.8.8.8', ), ttl=60)
+        self.assertEqual(self._query(resolver, 'www.fake.com'),
+                         ['192.168.1.2', '8.8.8.8'])
+        # a missing file is not taken as empty
+        os.remove(self.path)
+        self.assertEqual(reloader.load(), 0)
+        self.assertEqual(self._query(resolver, 'www.fake.com'),
+                         ['192.168.1.2', '8.8.8.8'])
+        self._write('')
+        self.assertEqual(reloader.load(), 1)
+        self.assertEqual(self._query(resolver, 'www.fake.com'), ['8.8.8.8'])
+        key = 'www.fake.com', types.A
+        self.assertIn(key, resolver.cache.index.lru)
+        self.assertNotIn(key, resolver.cache.index.pinned)
+
+    @async_test
+    async def test_hosts_reload(self):
+        resolver = ProxyResolver(proxies=['8.8.8.8'])
+        reloader = HostsReloader(resolver, self.path)
+        self._write('192.168.1.2 pi3.lan\n')
+        self.assertEqual(await reloader.reload(), 1)
+        self.assertEqual(self._query(resolver, 'pi3.lan'), ['192.168.1.2'])
+        self._write('192.168.1.3 pi3.lan\n')
+        # only the latest of overlapping reloads is applied
+        results = await asyncio.gather(reloader.reload(), reloader.reload())
+        self.assertEqual(results, [0, 1])
+        self.assertEqual(self._query(resolver, 'pi3.lan'), ['192.168.1.3'])
+        os.remove(self.path)
+        self.assertEqual(await reloader.reload(), 0)
+        self.assertEqual(self._query(resolver, 'pi3.lan'), ['192.168.1.3'])
+        self._write('')
+
+    @async_test
+    async def test_zone(self):
+        resolver = ProxyResolver(proxies=['8.8.8.8'])
+        response_cache = ResponseCache()
+        response_cache.put(('pi.lan', types.A), b'pi', [])
+        watcher = FileWatcher()
+        watch_zone(watcher, resolver, self.path, response_cache)
+        self._write('$ORIGIN lan.\n@ 60 IN SOA ns admin 1 1 1 1 1\n'
+                    'pi 60 IN A 192.168.1.2\n')
+        watcher.check()
+        watcher.check()
+        # the zone is loaded in an executor
+        for _ in range(100):
+            if resolver.zones:
+                break
+            await asyncio.sleep(0.01)
+        _, an, _ = resolver.zones['lan'].query('pi.lan', types.A)
+        self.assertEqual(an[0].data.data, '192.168.1.2')
+        self.assertEqual(len(response_cache), 0)
+
+    def test_watcher(self):
+        changes = []
+        watcher = FileWatcher()
+        watcher.watch(self.path, changes.append)
+        watcher.check()
+        self.assertEqual(changes, [])
+        self._write('8.8.8.8')
+        watcher.check()
+        # the file may still be being written
+        self.assertEqual(changes, [])
+        watcher.check()
+        self.assertEqual(changes, [self.path])
+        os.remove(self.path)
+        watcher.check()
+        watcher.check()
+        self.assertEqual(changes, [self.path])
+        self._write('8.8.4.4')
+        watcher.check()
+        watcher.check()
+        self.assertEqual(changes, [self.path, self.path])
+
+    def test_proxies(self):
+        resolver = ProxyResolver(proxies=['8.8.8.8'])
+        watcher = FileWatcher()
+        watch_proxies(watcher, resolver, self.path, ['8.8.8.8'])
+        self._write('*.lan tcp://192.168.1.1:53  # router\n1.1.1.1\n')
+        watcher.check()
+        watcher.check()
+        self.assertEqual(
+            [str(addr) for addr in resolver._get_nameservers('pi.lan').iter()],
+            ['tcp://192.168.1.1:53'])
+        self.assertEqual(
+            len(list(resolver._get_nameservers('www.fake.com').iter())), 2)
+
+    def test_empty_proxies(self):
+        resolver = ProxyResolver(proxies=['8.8.8.8'])
+        watcher = FileWatcher()
+        watch_proxies(watcher, resolver, self.path)
+        self._write('# no proxies\n')
+        watcher.check()
+        watcher.check()
+        self.assertEqual(
+            [str(addr) for addr in resolver._get_nameservers('pi.lan').iter()],
+            [
+                str(addr) for addr in ProxyResolver(
+                    proxies=[])._get_nameservers('pi.lan').iter()
+            ])
+        self.assertTrue(resolver._get_nameservers('pi.lan'))
+
+    def test_load_proxies(self):
+        proxies = ProxyResolver.load_proxies(
+            io.StringIO('# comment\n'
+                        '*.lan tcp://192.168.1.1:53 192.168.1.2\n'
+                        'example.com 127.0.0.1:1053\n'
+                        '8.8.8.8 udp://8.8.4.4\n'))
+        self.assertEqual(proxies, [
+            ('*.lan', ['tcp://192.168.1.1:53', '192.168.1.2']),
+            ('example.com', ['127.0.0.1:1053']),
+            '8.8.8.8',
+            'udp://8.8.4.4',
+        ])
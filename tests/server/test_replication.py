@@ -0,0 +1,97 @@
+import asyncio
+import time
+import unittest
+
+from async_dns.core import DNSMessage, Record, create_rdata, types
+from async_dns.resolver import ProxyResolver
+from async_dns.server import CacheReplicator
+
+from ..util import async_test
+
+
+async def wait_for(predicate, timeout=1.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+class TestReplication(unittest.TestCase):
+    @async_test
+    async def test_replicate(self):
+        resolvers = [ProxyResolver() for _ in range(3)]
+        replicators = [CacheReplicator(resolver) for resolver in resolvers]
+        try:
+            addrs = []
+            for replicator in replicators:
+                server = await replicator.start('127.0.0.1:0')
+                addrs.append('127.0.0.1:%d' %
+                             server.sockets[0].getsockname()[1])
+            replicators[0].add_peer(addrs[1])
+            replicators[0].add_peer(addrs[2])
+            await wait_for(lambda: len(replicators[0].writers) == 2)
+
+            msg = DNSMessage()
+            msg.qd.append(Record(0, name='www.fake.com', qtype=types.A))
+            record = Record(name='www.fake.com', qtype=types.A, ttl=60,
+                            data=create_rdata(types.A, '1.2.3.4'))
+            msg.an.append(record)
+            # the record has been in cache for a while
+            record.timestamp -= 10
+            resolvers[0].cache_message(msg)
+            for resolver in resolvers[1:]:
+                await wait_for(lambda: list(
+                    resolver.cache.query('www.fake.com', types.A)))
+                records = list(resolver.cache.query('www.fake.com', types.A))
+                self.assertEqual(records[0].data.data, '1.2.3.4')
+                self.assertLessEqual(records[0].ttl, 50)
+                self.assertGreaterEqual(records[0].ttl, 48)
+
+            resolvers[0].invalidate('www.fake.com')
+            self.assertEqual(
+                list(resolvers[0].cache.query('www.fake.com', types.A)), [])
+            for resolver in resolvers[1:]:
+                await wait_for(lambda: not list(
+                    resolver.cache.query('www.fake.com', types.A)))
+                self.assertEqual(
+                    list(resolver.cache.query('www.fake.com', types.A)), [])
+            # updates applied from peers are not sent again
+            self.assertEqual(replicators[1].sent, 0)
+        finally:
+            for replicator in replicators:
+                replicator.close()
+            await asyncio.sleep(0)
+
+    @async_test
+    async def test_secret(self):
+        resolvers = [ProxyResolver() for _ in range(3)]
+        replicators = [
+            CacheReplicator(resolvers[0], secret='secret'),
+            CacheReplicator(resolvers[1], secret='secret'),
+            CacheReplicator(resolvers[2], secret='wrong'),
+        ]
+        try:
+            with self.assertRaises(ValueError):
+                await CacheReplicator(ProxyResolver()).start('0.0.0.0:0')
+            server = await replicators[1].start('0.0.0.0:0')
+            addr = '127.0.0.1:%d' % server.sockets[0].getsockname()[1]
+            for replicator in (replicators[0], replicators[2]):
+                replicator.add_peer(addr)
+            await wait_for(lambda: replicators[0].writers and replicators[2].
+                           writers)
+
+            for i, resolver in enumerate((resolvers[0], resolvers[2])):
+                msg = DNSMessage()
+                msg.an.append(
+                    Record(name='%d.fake.com' % i, qtype=types.A, ttl=60,
+                           data=create_rdata(types.A, '1.2.3.4')))
+                resolver.cache_message(msg)
+            await wait_for(lambda: replicators[1].received and replicators[1].
+                           rejected)
+            cache = resolvers[1].cache
+            self.assertEqual(len(list(cache.query('0.fake.com', types.A))), 1)
+            self.assertEqual(list(cache.query('1.fake.com', types.A)), [])
+            self.assertEqual(replicators[1].rejected, 1)
+        finally:
+            for replicator in replicators:
+                replicator.close()
+            await asyncio.sleep(0)